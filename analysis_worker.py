@@ -0,0 +1,24 @@
+# runs InjusticeJudge analysis for the bot in its own process, on this machine
+# or another one (with a checkout of this repo and its config.env). Usage:
+#   python analysis_worker.py --listen unix:/tmp/ronhorn-analysis.sock
+#   python analysis_worker.py --listen 0.0.0.0:7001 --workers 8   (needs `analysis_service_token`)
+# then list the addresses in the bot's `analysis_service_addresses`.
+# Start several of these to spread the analysis over more cores or machines.
+import argparse
+import asyncio
+import logging
+
+async def main(args) -> None:
+    from ext.InjusticeJudge.analysis import ANALYSIS_TIMEOUT, ANALYSIS_WORKERS, AnalysisPool
+    from ext.InjusticeJudge.analysis_service import ANALYSIS_SERVICE_TOKEN, AnalysisServer
+    pool = AnalysisPool(max_workers=args.workers or ANALYSIS_WORKERS, timeout=ANALYSIS_TIMEOUT)
+    await AnalysisServer(pool, token=ANALYSIS_SERVICE_TOKEN).serve(args.listen)
+
+if __name__ == "__main__":
+    import dotenv
+    dotenv.load_dotenv("config.env")
+    parser = argparse.ArgumentParser(description="Serve InjusticeJudge analysis jobs for the bot.")
+    parser.add_argument("--listen", default="unix:/tmp/ronhorn-analysis.sock", help="`unix:<path>` or `<host>:<port>`")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: analysis_workers from config.env)")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+# runs InjusticeJudge over many games at once and writes per-player
+# injustice/skill/deal-in totals to `batch_results/`. Usage:
+#   python batch_analysis.py <link> <link> ...
+#   python batch_analysis.py --from 2024-01-15 --to 2024-05-01 [--db club.db]
+import argparse
+import asyncio
+from typing import *
+
+async def main(args) -> None:
+    import global_stuff
+    from ext.InjusticeJudge.batch import majsoul_link, run_batch, summarize_batch, write_batch_results
+    from ext.InjusticeJudge.utilities import close_http_session
+    links: List[str] = args.links
+    description = f"{len(links)} games"
+    if args.start is not None and args.end is not None:
+        from modules.clubdb.store import ClubStore
+        store = ClubStore(args.db)
+        await store.open()
+        links = links + [majsoul_link(uuid) for uuid in await store.get_game_uuids(f"{args.start} 00:00:00", f"{args.end} 23:59:59")]
+        await store.close()
+        description = f"games from {args.start} to {args.end}"
+    if any("mahjongsoul" in link or "maj-soul" in link or "majsoul" in link for link in links):
+        await global_stuff.load_mjs_account_manager()
+    print(f"Analyzing {len(links)} games...")
+    results = await run_batch(links, fetch_concurrency=args.concurrency)
+    print(f"Wrote {write_batch_results(results, description)}")
+    for name, value in summarize_batch(results):
+        print(f"{name}:\n  " + value.replace("\n", "\n  "))
+    for link, error in results["failed"].items():
+        print(f"FAILED {link}: {error}")
+    await close_http_session()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate InjusticeJudge results per player over many games.")
+    parser.add_argument("links", nargs="*", help="game links (Mahjong Soul, tenhou.net or Riichi City log ids)")
+    parser.add_argument("--from", dest="start", help="with --to: every lobby game recorded from this date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="...up to and including this date")
+    parser.add_argument("--db", default="club.db", help="club database to read recorded games from")
+    parser.add_argument("--concurrency", type=int, default=4, help="games fetched at once")
+    asyncio.run(main(parser.parse_args()))
@@ -59,6 +59,17 @@ async def setup_bot() -> commands.Bot:
         await bot.tree.sync()
         await ctx.send("Synced global slash commands.")
 
+    @bot.command(name='sheets_stats', hidden=True)
+    @commands.is_owner()
+    async def sheets_stats(ctx: commands.Context):
+        from global_stuff import gs_client, sheets_exporter
+        if gs_client is None:
+            return await ctx.send("Not connected to Google Sheets.")
+        summary = gs_client.scheduler.summary() + gs_client.stats.summary()
+        if sheets_exporter is not None:
+            summary += await sheets_exporter.summary()
+        await ctx.send("\n".join(summary))
+
     @bot.command(name='shutdown', hidden=True)
     @commands.is_owner()
     async def shutdown(ctx: commands.Context):
@@ -117,11 +128,13 @@ async def setup_bot() -> commands.Bot:
         elif isinstance(error, app_commands.errors.CommandInvokeError):
             # here it's especially important so the bot isn't stuck "thinking" (e.g., from `defer()`)
             # meanwhile, the user also gets an idea of what they might have done wrong.
+            from modules.gsheets.async_sheets import SheetsQuotaError
+            message = str(error.original) if isinstance(error.original, SheetsQuotaError) else repr(error.original)
             if interaction.response.is_done():
                 # NOTE: `ephemeral` here only works if `defer()` was called with `ephemeral=True`
-                await interaction.followup.send(repr(error.original), ephemeral=True)
+                await interaction.followup.send(message, ephemeral=True)
             else:
-                await interaction.response.send_message(repr(error.original), ephemeral=True)
+                await interaction.response.send_message(message, ephemeral=True)
             # do NOT raise the error again here; this somehow results in the error being
             # sent here again (TOTHINK: but only once! Intriguing...)
         else:
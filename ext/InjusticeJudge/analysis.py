@@ -0,0 +1,398 @@
+"""
+Runs InjusticeJudge's parse + `evaluate_game` on a process pool, so long
+analyses (e.g. `/injustice` for all players) don't block the event loop.
+This module is imported by the worker processes, so it must not import
+discord or `global_stuff`. All logs are fetched (and cached) by the bot
+and sent over: Mahjong Soul records as bytes, tenhou and Riichi City logs
+as their decoded JSON.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import *
+
+from modules.pymjsoul.proto import liqi_combined_pb2 as proto
+from modules.InjusticeJudge.injustice_judge.fetch import parse_majsoul, parse_majsoul_link, parse_riichicity, parse_tenhou, parse_tenhou_link
+from modules.InjusticeJudge.injustice_judge.injustices import evaluate_game
+from modules.InjusticeJudge.injustice_judge.classes import GameMetadata
+from modules.InjusticeJudge.injustice_judge.classes2 import Kyoku
+from .record_decoder import decode_record
+
+INVALID_LINK_MESSAGE = ("expected tenhou link similar to `tenhou.net/0/?log=`"
+                        " or mahjong soul link similar to `mahjongsoul.game.yo-star.com/?paipu=`"
+                        " or 20-character riichi city log id like `cjc3unuai08d9qvmstjg`")
+
+def is_majsoul_link(link: str) -> bool:
+    # EN: `mahjongsoul.game.yo-star.com`; CN: `maj-soul.com`; JP: `mahjongsoul.com`
+    # Old CN (?): http://majsoul.union-game.com/0/?paipu=190303-335e8b25-7f5c-4bd1-9ac0-249a68529e8d_a93025901
+    return "mahjongsoul" in link or "maj-soul" in link or "majsoul" in link
+
+def decode_majsoul_record(record, link: str):
+    """Turn a `ResGameRecord` into what InjusticeJudge's `fetch_majsoul()` would return"""
+    _, ms_account_id, player_seat = parse_majsoul_link(link)
+    actions, metadata = decode_record(record)
+
+    player = None
+    if player_seat is not None:
+        player = player_seat
+    elif ms_account_id is not None:
+        for acc in record.head.accounts:
+            if acc.account_id == ms_account_id:
+                player = acc.seat
+                break
+
+    return actions, metadata, player
+
+def decode_tenhou_log(game_data: Dict[str, Any], link: str):
+    """Turn tenhou's `mjlog2json.cgi` response into what InjusticeJudge's `fetch_tenhou()` would return"""
+    _, player = parse_tenhou_link(link)
+    return game_data["log"], {k: v for k, v in game_data.items() if k != "log"}, player
+
+def decode_riichicity_log(game_data: Dict[str, Any]):
+    """Turn Riichi City's `getRoomData` response into what InjusticeJudge's `fetch_riichicity()` would return"""
+    return game_data["data"]["handRecord"], game_data["data"], None
+
+def parse_fetched_log(link: str, fetched_log: Any, nickname: Optional[str]) -> Tuple[List[Kyoku], GameMetadata, Optional[int], Optional[int]]:
+    """
+    Returns the parsed game, the seat of `nickname` (if given) and the seat specified
+    by the link (if any). The log must be fetched beforehand: a `ResGameRecord` for
+    Mahjong Soul, the JSON response for tenhou.net and Riichi City.
+    """
+    if "tenhou.net/" in link:
+        tenhou_log, metadata, player = decode_tenhou_log(fetched_log, link)
+        kyokus, parsed_metadata, parsed_player_seat = parse_tenhou(tenhou_log, metadata, nickname)
+        logging.info("  tenhou log parsed")
+    elif is_majsoul_link(link):
+        majsoul_log, metadata, player = decode_majsoul_record(fetched_log, link)
+        kyokus, parsed_metadata, parsed_player_seat = parse_majsoul(majsoul_log, metadata, nickname)
+        logging.info("  majsoul log parsed")
+    elif len(link) == 20: # riichi city log id
+        riichicity_log, metadata, player = decode_riichicity_log(fetched_log)
+        kyokus, parsed_metadata, parsed_player_seat = parse_riichicity(riichicity_log, metadata, nickname)
+        logging.info("  riichicity log parsed")
+    else:
+        raise Exception(INVALID_LINK_MESSAGE)
+    kyokus[-1].is_final_round = True
+    return kyokus, parsed_metadata, parsed_player_seat, player
+
+def select_players(parsed_metadata: GameMetadata, parsed_player_seat: Optional[int], player: Optional[int], specified_players: Set[int]) -> Set[int]:
+    if parsed_metadata.num_players == 3:
+        assert player != 3 or all(p != 3 for p in specified_players), "Can't specify North player in a sanma game"
+    if len(specified_players) == 0:
+        if parsed_player_seat is not None:
+            specified_players = {parsed_player_seat}
+        elif player is not None:
+            specified_players = {player}
+        else:
+            specified_players = {0}
+    return specified_players
+
+"""
+=====================================================
+WORKER SIDE
+=====================================================
+"""
+
+# each worker keeps its last few parsed games, since e.g. `/injustice`
+# and `/skill` are usually run on the same game one after the other
+WORKER_PARSED_GAMES = 4
+_worker_parsed_games: OrderedDict = OrderedDict()
+
+def _parse_in_worker(link: str, fetched_log: Any, nickname: Optional[str]):
+    key = (link, nickname)
+    if key in _worker_parsed_games:
+        _worker_parsed_games.move_to_end(key)
+        return _worker_parsed_games[key]
+    if isinstance(fetched_log, bytes):
+        record = proto.ResGameRecord()  # type: ignore[attr-defined]
+        record.ParseFromString(fetched_log)
+        fetched_log = record
+    parsed = parse_fetched_log(link, fetched_log, nickname)
+    _worker_parsed_games[key] = parsed
+    while len(_worker_parsed_games) > WORKER_PARSED_GAMES:
+        _worker_parsed_games.popitem(last=False)
+    return parsed
+
+def evaluate_kyokus(kyokus: List[Kyoku], game_metadata: GameMetadata, parsed_player_seat: Optional[int], player: Optional[int],
+                     specified_players: Set[int], look_for: Set[str]) -> Iterator[Tuple[Set[int], List[str]]]:
+    """Yields (specified players, results) for each kyoku in turn"""
+    try:
+        players = select_players(game_metadata, parsed_player_seat, player, specified_players)
+    except Exception:
+        players = select_players(game_metadata, parsed_player_seat, player, specified_players - {3})
+    for kyoku in kyokus:
+        try:
+            results = evaluate_game(kyoku, players, game_metadata.name, look_for)
+        except Exception:
+            # retry without North, in case it's sanma
+            sanma_players = select_players(game_metadata, parsed_player_seat, player, specified_players - {3})
+            if sanma_players == players:
+                raise
+            players = sanma_players
+            results = evaluate_game(kyoku, players, game_metadata.name, look_for)
+        yield players, results
+
+def analyze_job(link: str, fetched_log: Any, specified_players: Set[int], look_for: Set[str],
+                nickname: Optional[str], submitted_at: float) -> Tuple[Tuple[List[str], Set[int]], float, float]:
+    """
+    Same as `analyze_game()` in `utilities.py`, run in a worker process.
+    Returns ((results, specified players), seconds spent queued, seconds spent running)
+    """
+    start_time = time.time()
+    queue_wait = start_time - submitted_at
+    kyokus, game_metadata, parsed_player_seat, player = _parse_in_worker(link, fetched_log, nickname)
+    results: List[str] = []
+    players = specified_players
+    for players, kyoku_results in evaluate_kyokus(kyokus, game_metadata, parsed_player_seat, player, specified_players, look_for):
+        results.extend(kyoku_results)
+    return (results, players), queue_wait, time.time() - start_time
+
+def season_job(link: str, fetched_log: Any, submitted_at: float) -> Tuple[Dict[str, Any], float, float]:
+    """
+    Every seat's injustices, skills and deal-ins for one game, for `batch.py`.
+    Returns ({"names", "seats": [{"injustice", "skill", "deal_ins", "dama_deal_ins",
+    "dealer_deal_ins", "deal_in_points"} for each seat]}, seconds queued, seconds running)
+    """
+    start_time = time.time()
+    queue_wait = start_time - submitted_at
+    kyokus, game_metadata, _, _ = _parse_in_worker(link, fetched_log, None)
+    num_players = game_metadata.num_players
+    seats: List[Dict[str, Any]] = [{"injustice": [], "skill": [], "deal_ins": 0, "dama_deal_ins": 0, "dealer_deal_ins": 0, "deal_in_points": 0}
+                                   for _ in range(num_players)]
+    for kyoku in kyokus:
+        for seat in range(num_players):
+            for look_for in ["injustice", "skill"]:
+                seats[seat][look_for].extend(evaluate_game(kyoku, {seat}, game_metadata.name, {look_for}))
+        result_type, *results = kyoku.result
+        if result_type == "ron":
+            for result in results:
+                stats = seats[result.won_from]
+                stats["deal_ins"] += 1
+                stats["dama_deal_ins"] += int(result.dama)
+                stats["dealer_deal_ins"] += int(result.winner == kyoku.round % 4)
+                stats["deal_in_points"] += result.score.to_points()
+    return {"names": list(game_metadata.name[:num_players]), "seats": seats}, queue_wait, time.time() - start_time
+
+def stream_job(link: str, fetched_log: Any, specified_players: Set[int], look_for: Set[str],
+               nickname: Optional[str], submitted_at: float, results_queue) -> None:
+    """
+    Same as `analyze_job()`, but puts each kyoku's results on `results_queue` as soon as
+    they're ready: ("kyoku", (players, results)) for each kyoku, then
+    ("done", (queue_wait, exec_time)) or ("error", exception).
+    """
+    start_time = time.time()
+    try:
+        kyokus, game_metadata, parsed_player_seat, player = _parse_in_worker(link, fetched_log, nickname)
+        for item in evaluate_kyokus(kyokus, game_metadata, parsed_player_seat, player, specified_players, look_for):
+            results_queue.put(("kyoku", item))
+    except Exception as e:
+        try:
+            results_queue.put(("error", e))
+        except Exception: # the exception couldn't be pickled
+            results_queue.put(("error", Exception(repr(e))))
+    else:
+        results_queue.put(("done", (start_time - submitted_at, time.time() - start_time)))
+
+"""
+=====================================================
+BOT SIDE
+=====================================================
+"""
+
+class AnalysisTimeout(Exception):
+    def __init__(self, timeout: float):
+        super().__init__(f"Analysis took longer than {timeout:.0f} seconds and was cancelled.")
+
+class AnalysisInterrupted(Exception):
+    def __init__(self):
+        super().__init__("Analysis was interrupted because another analysis took too long. Please try again.")
+
+class AnalysisPool:
+    """
+    Lazily started pool of `max_workers` processes. Jobs are only handed to the
+    pool once a worker is free, so a job's `timeout` counts from when it starts
+    running, not from when it was queued. Waiting jobs get a worker first come,
+    first served, except that `low_priority` ones (precomputing) go after
+    everyone else's. Jobs that take longer than `timeout` seconds are abandoned
+    and the pool is restarted, since a running job can't be cancelled any other
+    way (other jobs running at the time fail with `AnalysisInterrupted`).
+    """
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.free_workers = max_workers
+        self.waiting: Deque[asyncio.Future] = deque() # jobs waiting for a free worker
+        self.waiting_low_priority: Deque[asyncio.Future] = deque()
+        self.generation = 0 # bumped on restart, so the killed jobs don't free their workers again
+        self.manager = None # holds the queues `stream()` reads from
+        self.manager_lock = threading.Lock()
+        # waits on those queues, so streams don't tie up the default executor the rest of the bot uses
+        # (each stream holds a worker while it reads, so this never needs more threads than that)
+        self.stream_executor = ThreadPoolExecutor(max_workers=max_workers + 1, thread_name_prefix="analysis_stream")
+        self.jobs = 0
+        self.timeouts = 0
+        self.total_queue_wait = 0.0
+        self.total_exec_time = 0.0
+        self.max_exec_time = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn rather than fork: the bot process has threads (Sheets, SQLite, ...)
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def _restart(self) -> None:
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+        # every worker of the new pool is free
+        self.generation += 1
+        self.free_workers = 0
+        for _ in range(self.max_workers):
+            self._free_worker()
+
+    async def _acquire_worker(self, low_priority: bool = False) -> int:
+        """Wait for a free worker; returns what to pass to `_release_worker()`"""
+        if self.free_workers > 0 and len(self.waiting) == 0 and len(self.waiting_low_priority) == 0:
+            self.free_workers -= 1
+            return self.generation
+        waiter = asyncio.get_running_loop().create_future()
+        (self.waiting_low_priority if low_priority else self.waiting).append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_worker(waiter.result()) # got a worker just as we were cancelled
+            raise
+
+    def _release_worker(self, generation: int) -> None:
+        if generation == self.generation: # otherwise `_restart()` already freed it
+            self._free_worker()
+
+    def _free_worker(self) -> None:
+        for waiting in (self.waiting, self.waiting_low_priority):
+            while len(waiting) > 0:
+                waiter = waiting.popleft()
+                if not waiter.done():
+                    waiter.set_result(self.generation)
+                    return
+        self.free_workers += 1
+
+    async def _submit(self, job: Callable, *args, low_priority: bool = False) -> asyncio.Future:
+        """Wait for a free worker and start `job(*args)` on it; the worker is freed when the job finishes"""
+        generation = await self._acquire_worker(low_priority)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._get_executor(), job, *args)
+        except BaseException:
+            self._release_worker(generation)
+            raise
+        future.add_done_callback(partial(self._job_done, generation))
+        return future
+
+    def _job_done(self, generation: int, future: asyncio.Future) -> None:
+        self._release_worker(generation)
+        if not future.cancelled():
+            future.exception() # nobody waits for a timed out job's result anymore; don't log it as unretrieved
+
+    @staticmethod
+    def _interrupted(future: asyncio.Future) -> bool:
+        """Whether the job was killed (or dropped before it started) by a restart"""
+        return future.cancelled() or isinstance(future.exception(), BrokenProcessPool)
+
+    def _get_manager(self):
+        # called from `stream_executor`'s threads, so two streams starting at once mustn't both start a Manager
+        with self.manager_lock:
+            if self.manager is None:
+                self.manager = multiprocessing.get_context("spawn").Manager()
+            return self.manager
+
+    def _record(self, link: str, label: str, queue_wait: float, exec_time: float) -> None:
+        self.jobs += 1
+        self.total_queue_wait += queue_wait
+        self.total_exec_time += exec_time
+        self.max_exec_time = max(self.max_exec_time, exec_time)
+        logging.info(f"analysis: {link} ({label}) queued {1000*queue_wait:.0f}ms, ran {1000*exec_time:.0f}ms")
+
+    def _timed_out(self, link: str) -> AnalysisTimeout:
+        self.timeouts += 1
+        logging.error(f"analysis: timed out after {self.timeout}s on {link}; restarting the pool")
+        self._restart()
+        return AnalysisTimeout(self.timeout)
+
+    async def run_timed(self, link: str, job: Callable, *args, low_priority: bool = False) -> Tuple[Any, float, float]:
+        """
+        Run `job(*args, submitted_at)` on the pool without recording it.
+        Returns (result, seconds queued, seconds running), which is what jobs return.
+        """
+        future = await self._submit(job, *args, time.time(), low_priority=low_priority)
+        # unlike `wait_for`, this doesn't turn the job being cancelled by a restart into our own cancellation
+        done, _ = await asyncio.wait({future}, timeout=self.timeout)
+        if len(done) == 0:
+            raise self._timed_out(link)
+        if self._interrupted(future):
+            raise AnalysisInterrupted()
+        return future.result()
+
+    async def run(self, link: str, label: str, job: Callable, *args, low_priority: bool = False) -> Any:
+        """
+        Run `job(*args, submitted_at)` on the pool and return its result.
+        `link` and `label` are just for the logs.
+        """
+        result, queue_wait, exec_time = await self.run_timed(link, job, *args, low_priority=low_priority)
+        self._record(link, label, queue_wait, exec_time)
+        return result
+
+    async def analyze(self, link: str, fetched_log: Any, specified_players: Set[int],
+                      look_for: Set[str], nickname: Optional[str], low_priority: bool = False) -> Tuple[List[str], Set[int]]:
+        return await self.run(link, ", ".join(sorted(look_for)), analyze_job, link, fetched_log, specified_players, look_for, nickname,
+                              low_priority=low_priority)
+
+    async def stream(self, link: str, fetched_log: Any, specified_players: Set[int],
+                     look_for: Set[str], nickname: Optional[str]) -> AsyncIterator[Tuple[Set[int], List[str]]]:
+        """Like `analyze()`, but yields (specified players, results) per kyoku as the worker gets to them"""
+        loop = asyncio.get_running_loop()
+        results_queue = await loop.run_in_executor(self.stream_executor, lambda: self._get_manager().Queue())
+        future = await self._submit(stream_job, link, fetched_log, specified_players, look_for, nickname, time.time(), results_queue)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._timed_out(link)
+            try:
+                # wake up every second to notice if the worker died without reporting back
+                kind, value = await loop.run_in_executor(self.stream_executor, partial(results_queue.get, timeout=min(remaining, 1.0)))
+            except queue.Empty:
+                if future.done():
+                    if self._interrupted(future):
+                        raise AnalysisInterrupted()
+                    if future.exception() is not None:
+                        raise future.exception()  # type: ignore[misc]
+                continue
+            if kind == "kyoku":
+                yield value
+            elif kind == "done":
+                self._record(link, ", ".join(sorted(look_for)), *value)
+                return
+            else:
+                raise value
+
+    def summary(self) -> List[str]:
+        if self.jobs == 0:
+            return [f"analysis: no jobs yet ({self.max_workers} workers, {self.timeouts} timeouts)"]
+        return [f"analysis: {self.jobs} jobs on {self.max_workers} workers, avg queued {1000*self.total_queue_wait/self.jobs:.0f}ms,"
+                f" avg ran {1000*self.total_exec_time/self.jobs:.0f}ms, max ran {1000*self.max_exec_time:.0f}ms, {self.timeouts} timeouts"]
+
+ANALYSIS_WORKERS = int(os.getenv("analysis_workers", 2))
+ANALYSIS_TIMEOUT = float(os.getenv("analysis_timeout", 60))
@@ -0,0 +1,280 @@
+"""
+Lets `/injustice`, `/skill` and `batch_analysis` run in separate analysis
+services (see `analysis_worker.py`) instead of the bot's own process pool,
+so the bot only fetches logs and relays results. Services can run on this
+machine (listening on a Unix socket) or on others (TCP), each with its own
+pool of worker processes; the bot sends each job to the least busy one.
+
+Each job is one connection. Frames are a 4-byte big-endian length followed by
+JSON, with bytes and sets tagged (see `encode`), never pickle:
+  bot -> service: {"token", "job", "link", "args"}
+  service -> bot: {"result", "queue_wait", "exec_time"}      for `run` jobs
+                  {"kyoku": [players, results]} ... {"done": exec_time}  for `stream`
+                  {"error": message, "timeout": bool}         if the job failed
+
+If no service is reachable, jobs run on the local pool as before.
+"""
+
+import asyncio
+import base64
+import hmac
+import json
+import logging
+import os
+import struct
+import time
+from typing import *
+
+from .analysis import ANALYSIS_TIMEOUT, ANALYSIS_WORKERS, AnalysisPool, AnalysisTimeout, analyze_job, season_job
+
+# jobs a service will run, by name; `stream` is handled separately
+JOBS: Dict[str, Callable] = {job.__name__: job for job in [analyze_job, season_job]}
+
+LENGTH = struct.Struct(">I")
+MAX_FRAME_SIZE = 64_000_000 # a long Mahjong Soul record is ~1 MB
+RETRY_DOWN_AFTER = 30 # seconds to skip a service after failing to connect to it
+
+class AnalysisServiceError(Exception):
+    pass
+
+"""
+=====================================================
+PROTOCOL
+=====================================================
+"""
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode()}
+    if isinstance(value, (set, frozenset)):
+        return {"$set": sorted(value)}
+    raise TypeError(f"can't send {type(value).__name__} to an analysis service")
+
+def _decode_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "$bytes" in obj:
+            return base64.b64decode(obj["$bytes"])
+        if "$set" in obj:
+            return set(obj["$set"])
+    return obj
+
+def encode(message: Dict[str, Any]) -> bytes:
+    """JSON, except bytes and sets are tagged so they survive the trip (tuples become lists)"""
+    data = json.dumps(message, default=_encode_default, ensure_ascii=False).encode()
+    return LENGTH.pack(len(data)) + data
+
+async def write_frame(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    writer.write(encode(message))
+    await writer.drain()
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    if length > MAX_FRAME_SIZE:
+        raise AnalysisServiceError(f"frame of {length} bytes is too large")
+    return json.loads(await reader.readexactly(length), object_hook=_decode_hook)
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """"unix:/path/to/socket" -> ("unix", path); "host:port" -> ("tcp", (host, port))"""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if host == "" or not port.isdigit():
+        raise ValueError(f"expected `unix:<path>` or `<host>:<port>` for an analysis service address, got `{address}`")
+    return "tcp", (host.strip("[]"), int(port))
+
+async def _connect(address: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target, limit=MAX_FRAME_SIZE)
+    return await asyncio.open_connection(*target, limit=MAX_FRAME_SIZE)
+
+"""
+=====================================================
+SERVICE SIDE
+=====================================================
+"""
+
+class AnalysisServer:
+    """Runs jobs from the bot on `pool`; see `analysis_worker.py`"""
+    def __init__(self, pool: AnalysisPool, token: str = ""):
+        self.pool = pool
+        self.token = token
+        self.connections = 0
+
+    async def serve(self, address: str) -> None:
+        kind, target = parse_address(address)
+        if kind == "tcp" and self.token == "":
+            # anyone who can reach the port could run jobs on this machine
+            raise ValueError(f"refusing to listen on {address} without an analysis_service_token; set one on both ends, or use a unix: socket")
+        if kind == "unix":
+            if os.path.exists(target):
+                os.remove(target) # left over from a previous run
+            server = await asyncio.start_unix_server(self.handle, target, limit=MAX_FRAME_SIZE)
+        else:
+            server = await asyncio.start_server(self.handle, *target, limit=MAX_FRAME_SIZE)
+        logging.info(f"analysis service: listening on {address} with {self.pool.max_workers} workers")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            request = await read_frame(reader)
+            if not hmac.compare_digest(str(request.get("token", "")), self.token):
+                await write_frame(writer, {"error": "wrong analysis_service_token", "timeout": False})
+                return
+            link, job, args = request["link"], request["job"], request["args"]
+            try:
+                if job == "stream_job":
+                    start_time = time.time()
+                    async for item in self.pool.stream(link, *args):
+                        await write_frame(writer, {"kyoku": item})
+                    await write_frame(writer, {"done": time.time() - start_time})
+                elif job in JOBS:
+                    result, queue_wait, exec_time = await self.pool.run_timed(link, JOBS[job], *args)
+                    self.pool._record(link, job, queue_wait, exec_time)
+                    await write_frame(writer, {"result": result, "queue_wait": queue_wait, "exec_time": exec_time})
+                else:
+                    await write_frame(writer, {"error": f"unknown job {job}", "timeout": False})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                logging.warning(f"analysis service: {job} failed on {link}: {e!r}")
+                await write_frame(writer, {"error": str(e) or repr(e), "timeout": isinstance(e, AnalysisTimeout)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # the bot gave up on this job
+        except Exception as e:
+            logging.error(f"analysis service: bad request: {e!r}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+"""
+=====================================================
+BOT SIDE
+=====================================================
+"""
+
+class ServiceState:
+    def __init__(self, address: str):
+        self.address = address
+        self.in_flight = 0
+        self.jobs = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+class RemoteAnalysisPool(AnalysisPool):
+    """
+    `AnalysisPool` that sends jobs to analysis services, picking whichever has the
+    fewest jobs in flight. Falls back to the local pool (started only if needed)
+    when no service accepts the connection. Once a job has been sent it isn't
+    retried elsewhere, since it might be running already.
+    """
+    def __init__(self, addresses: List[str], token: str, max_workers: int, timeout: float):
+        super().__init__(max_workers, timeout)
+        for address in addresses:
+            parse_address(address) # fail early on typos
+        self.services = [ServiceState(address) for address in addresses]
+        self.token = token
+        if token == "" and any(parse_address(address)[0] == "tcp" for address in addresses):
+            logging.warning("analysis: no analysis_service_token set; services on TCP addresses will refuse to start without one")
+        self.local_jobs = 0
+
+    async def _open(self, link: str, job: str, args: Sequence[Any]) -> Optional[Tuple[ServiceState, asyncio.StreamReader, asyncio.StreamWriter]]:
+        """Send the job to the first service that accepts it, least busy first"""
+        now = time.monotonic()
+        for service in sorted(self.services, key=lambda s: (s.down_until > now, s.in_flight)):
+            try:
+                reader, writer = await asyncio.wait_for(_connect(service.address), timeout=5)
+                await write_frame(writer, {"token": self.token, "job": job, "link": link, "args": list(args)})
+            except (OSError, asyncio.TimeoutError) as e:
+                if service.down_until <= now:
+                    logging.warning(f"analysis: can't reach the analysis service at {service.address}: {e!r}")
+                service.failures += 1
+                service.down_until = time.monotonic() + RETRY_DOWN_AFTER
+                continue
+            service.in_flight += 1
+            service.jobs += 1
+            return service, reader, writer
+        logging.warning(f"analysis: no analysis service available, running {job} on {link} locally")
+        self.local_jobs += 1
+        return None
+
+    async def _read(self, reader: asyncio.StreamReader, deadline: float) -> Dict[str, Any]:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            frame = await asyncio.wait_for(read_frame(reader), timeout=remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise AnalysisTimeout(self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise AnalysisServiceError("Lost the connection to the analysis service.")
+        if "error" in frame:
+            if frame["timeout"]:
+                self.timeouts += 1
+                raise AnalysisTimeout(self.timeout)
+            raise AnalysisServiceError(frame["error"])
+        return frame
+
+    @staticmethod
+    def _close(service: ServiceState, writer: asyncio.StreamWriter) -> None:
+        service.in_flight -= 1
+        writer.close()
+
+    async def run(self, link: str, label: str, job: Callable, *args, low_priority: bool = False) -> Any:
+        # services run jobs first come, first served; `low_priority` only applies on the local pool
+        if job.__name__ not in JOBS:
+            return await super().run(link, label, job, *args, low_priority=low_priority)
+        submitted_at = time.monotonic()
+        connection = await self._open(link, job.__name__, args)
+        if connection is None:
+            return await super().run(link, label, job, *args, low_priority=low_priority)
+        service, reader, writer = connection
+        try:
+            # give the service's own timeout a chance to report first
+            frame = await self._read(reader, submitted_at + self.timeout + 5)
+        finally:
+            self._close(service, writer)
+        # count the round trip as queueing
+        self._record(link, f"{label} on {service.address}", time.monotonic() - submitted_at - frame["exec_time"], frame["exec_time"])
+        return frame["result"]
+
+    async def stream(self, link: str, fetched_log: Any, specified_players: Set[int],
+                     look_for: Set[str], nickname: Optional[str]) -> AsyncIterator[Tuple[Set[int], List[str]]]:
+        args = (fetched_log, specified_players, look_for, nickname)
+        submitted_at = time.monotonic()
+        connection = await self._open(link, "stream_job", args)
+        if connection is None:
+            async for item in super().stream(link, *args):
+                yield item
+            return
+        service, reader, writer = connection
+        try:
+            while True:
+                frame = await self._read(reader, submitted_at + self.timeout + 5)
+                if "kyoku" in frame:
+                    players, results = frame["kyoku"]
+                    yield players, results
+                else:
+                    self._record(link, f"{', '.join(sorted(look_for))} on {service.address}",
+                                 time.monotonic() - submitted_at - frame["done"], frame["done"])
+                    return
+        finally:
+            self._close(service, writer)
+
+    def summary(self) -> List[str]:
+        now = time.monotonic()
+        return super().summary() + [f"analysis service {s.address}: {s.jobs} jobs, {s.in_flight} in flight, {s.failures} failed connections"
+                                    + (" (down)" if s.down_until > now else "") for s in self.services] \
+                                 + [f"analysis: {self.local_jobs} jobs ran locally for lack of a service"]
+
+ANALYSIS_SERVICE_ADDRESSES = [address.strip() for address in os.getenv("analysis_service_addresses", "").split(",") if address.strip() != ""]
+ANALYSIS_SERVICE_TOKEN = os.getenv("analysis_service_token", "")
+
+analysis_pool: AnalysisPool
+if len(ANALYSIS_SERVICE_ADDRESSES) > 0:
+    analysis_pool = RemoteAnalysisPool(ANALYSIS_SERVICE_ADDRESSES, ANALYSIS_SERVICE_TOKEN, ANALYSIS_WORKERS, ANALYSIS_TIMEOUT)
+else:
+    analysis_pool = AnalysisPool(ANALYSIS_WORKERS, ANALYSIS_TIMEOUT)
@@ -0,0 +1,114 @@
+"""
+Season-wide analysis: run every seat of many games through InjusticeJudge
+and add up injustices, skills and deal-ins per player. Used by the
+`batch_analysis` owner command and `batch_analysis.py`.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import *
+
+from .analysis import season_job
+from .analysis_service import analysis_pool
+from .utilities import fetch_worker_log
+
+BATCH_OUTPUT_DIR = os.getenv("batch_output_dir", "batch_results")
+BATCH_FETCH_CONCURRENCY = int(os.getenv("batch_fetch_concurrency", 4))
+
+def majsoul_link(game_uuid: str) -> str:
+    return f"https://mahjongsoul.game.yo-star.com/?paipu={game_uuid}"
+
+def result_type(result: str) -> str:
+    """
+    InjusticeJudge results are plain text, so group them by their wording:
+    drop code spans (round names, hands), markdown and numbers, keep the first few words
+    """
+    text = re.sub(r"`[^`]*`", "", result)
+    words = re.findall(r"[A-Za-z][A-Za-z'-]*", text)
+    return " ".join(words[:6]).lower()[:80]
+
+class PlayerAggregate:
+    def __init__(self):
+        self.games = 0
+        self.injustices: Counter = Counter() # result type -> count
+        self.skills: Counter = Counter()
+        self.deal_ins = 0
+        self.dama_deal_ins = 0
+        self.dealer_deal_ins = 0
+        self.deal_in_points = 0
+
+    def add(self, seat: Dict[str, Any]) -> None:
+        self.games += 1
+        self.injustices.update(map(result_type, seat["injustice"]))
+        self.skills.update(map(result_type, seat["skill"]))
+        self.deal_ins += seat["deal_ins"]
+        self.dama_deal_ins += seat["dama_deal_ins"]
+        self.dealer_deal_ins += seat["dealer_deal_ins"]
+        self.deal_in_points += seat["deal_in_points"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"games": self.games,
+                "injustices": sum(self.injustices.values()),
+                "skills": sum(self.skills.values()),
+                "injustice_types": dict(self.injustices.most_common()),
+                "skill_types": dict(self.skills.most_common()),
+                "deal_ins": self.deal_ins,
+                "dama_deal_ins": self.dama_deal_ins,
+                "dealer_deal_ins": self.dealer_deal_ins,
+                "deal_in_points": self.deal_in_points}
+
+async def run_batch(links: List[str], fetch_concurrency: int = BATCH_FETCH_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Fetch the games (at most `fetch_concurrency` at a time) and analyze them on
+    `analysis_pool`, at most one per worker at a time so the batch never queues
+    up the whole season in front of everyone else's jobs.
+    Returns {"games", "failed": {link: error}, "players": {name: aggregate}}
+    """
+    start_time = time.perf_counter()
+    fetch_limit = asyncio.Semaphore(fetch_concurrency)
+    analysis_limit = asyncio.Semaphore(analysis_pool.max_workers * max(1, len(getattr(analysis_pool, "services", []))))
+    async def analyze(link: str) -> Dict[str, Any]:
+        async with fetch_limit:
+            fetched_log = await fetch_worker_log(link)
+        async with analysis_limit:
+            return await analysis_pool.run(link, "season", season_job, link, fetched_log)
+    outcomes = await asyncio.gather(*map(analyze, links), return_exceptions=True)
+
+    players: Dict[str, PlayerAggregate] = {}
+    failed: Dict[str, str] = {}
+    for link, outcome in zip(links, outcomes):
+        if isinstance(outcome, BaseException):
+            failed[link] = repr(outcome)
+            continue
+        for name, seat in zip(outcome["names"], outcome["seats"]):
+            players.setdefault(name, PlayerAggregate()).add(seat)
+    logging.info(f"batch: analyzed {len(links) - len(failed)}/{len(links)} games in {time.perf_counter() - start_time:.1f}s")
+    return {"games": len(links) - len(failed),
+            "failed": failed,
+            "players": {name: aggregate.to_dict() for name, aggregate in sorted(players.items(), key=lambda item: -item[1].games)}}
+
+def write_batch_results(results: Dict[str, Any], description: str) -> str:
+    """Save `results` under `BATCH_OUTPUT_DIR` and return the path"""
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(BATCH_OUTPUT_DIR, f"batch-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump({"description": description, **results}, f, indent=2, ensure_ascii=False)
+    return path
+
+def summarize_batch(results: Dict[str, Any], top: int = 5) -> List[Tuple[str, str]]:
+    """(title, text) fields for an embed"""
+    players = results["players"]
+    per_game = lambda stat: sorted(((p[stat] / p["games"], name) for name, p in players.items()), reverse=True)[:top]
+    fields = [("Games", f"{results['games']} analyzed, {len(results['failed'])} failed, {len(players)} players")]
+    for title, stat in [("Most injustices per game", "injustices"), ("Most skills per game", "skills"), ("Most deal-ins per game", "deal_ins")]:
+        fields.append((title, "\n".join(f"{name}: {value:.2f}" for value, name in per_game(stat)) or "-"))
+    injustice_types: Counter = Counter()
+    for p in players.values():
+        injustice_types.update(p["injustice_types"])
+    fields.append(("Most common injustices", "\n".join(f"{count}× {kind}" for kind, count in injustice_types.most_common(top)) or "-"))
+    return fields
@@ -1,5 +1,6 @@
 import logging
 import json
+import re
 import discord
 from discord.ext import commands
 from discord import app_commands, ui, ButtonStyle, Colour, Embed, Interaction
@@ -7,7 +8,7 @@ from typing import *
 
 # InjusticeJudge imports
 from .commands import _parse, _injustice, _skill, _shanten
-from .utilities import analyze_game, draw_graph, long_followup, parse_game, parse_link
+from .utilities import analyze_game, close_http_session, draw_graph, long_followup, parse_game, parse_link
 from .command_view import CommandSuggestionView
 
 
@@ -19,6 +20,10 @@ class Injustice(commands.Cog):
     given list of servers.
     """
 
+    async def cog_unload(self):
+        # `bot.close()` removes every cog, so this also runs on shutdown
+        await close_http_session()
+
     @app_commands.command(name="injustice", description="Display the injustices in a given game.")  # type: ignore[arg-type]
     @app_commands.describe(link="Link to the game to analyze (Mahjong Soul or tenhou.net)",
                            player="(optional) The seat to analyze the game from. Determined using the link, but defaults to East.",
@@ -45,8 +50,47 @@ class Injustice(commands.Cog):
         await interaction.response.defer()
         await _skill(interaction, link, {0,1,2,3})
 
+    @commands.command(name="game_cache_stats", hidden=True)
+    @commands.is_owner()
+    async def game_cache_stats(self, ctx: commands.Context):
+        from .analysis_service import analysis_pool
+        from .game_cache import game_log_cache, parsed_game_cache
+        from .precompute import result_cache
+        from .shanten import hand_analysis
+        from .shanten_table import shanten_table
+        from .utilities import followup_stats
+        from modules.render.cache import image_cache
+        from modules.render.engine import render_engine
+        await ctx.send("\n".join(game_log_cache.summary() + parsed_game_cache.summary() + analysis_pool.summary()
+                                  + followup_stats.summary() + result_cache.summary() + render_engine.summary() + image_cache.summary()
+                                  + hand_analysis.summary() + shanten_table.summary()))
+
+    @commands.command(name="batch_analysis", hidden=True)
+    @commands.is_owner()
+    async def batch_analysis(self, ctx: commands.Context, *args: str):
+        """`batch_analysis <from> <to>` (dates like 2024-01-31) for every recorded lobby game, or `batch_analysis <link> <link> ...`"""
+        from .batch import majsoul_link, run_batch, summarize_batch, write_batch_results
+        if len(args) == 2 and all(re.fullmatch(r"\d{4}-\d{2}-\d{2}", arg) for arg in args):
+            from global_stuff import club_store
+            assert club_store is not None
+            links = [majsoul_link(uuid) for uuid in await club_store.get_game_uuids(f"{args[0]} 00:00:00", f"{args[1]} 23:59:59")]
+            description = f"games from {args[0]} to {args[1]}"
+        else:
+            links = list(args)
+            description = f"{len(links)} games"
+        if len(links) == 0:
+            await ctx.send("No games to analyze.")
+            return
+        await ctx.send(f"Analyzing {len(links)} games...")
+        results = await run_batch(links)
+        path = write_batch_results(results, description)
+        embed = Embed(title=f"Batch analysis of {description}", colour=Colour.from_str("#1EA51E"))
+        for name, value in summarize_batch(results):
+            embed.add_field(name=name, value=value[:1024], inline=False)
+        await ctx.send(embed=embed, file=discord.File(path))
+
     @app_commands.command(name="shanten", description="Analyze a given hand's waits and upgrades.")  # type: ignore[arg-type]
-    @app_commands.describe(hand="A hand in the form 123m456p789s1234z. Must be {4,7,10,13} tiles in length.")
+    @app_commands.describe(hand="A hand in the form 123m456p789s1234z. Must be {4,7,10,13} tiles, or 14 to choose a discard.")
     async def shanten(self, interaction: Interaction, hand: str):
         await interaction.response.defer()
         await _shanten(interaction, hand)
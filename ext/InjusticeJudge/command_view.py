@@ -1,6 +1,5 @@
 from discord import app_commands, ui, ButtonStyle, File, Interaction, Message, WebhookMessage
-from .commands import _parse, _injustice, _skill
-from .utilities import draw_graph, parse_link
+from .commands import _graph, _parse, _injustice, _skill
 
 class CommandSuggestionView(ui.View):
     def __init__(self, link: str, 
@@ -52,10 +51,7 @@ class CommandSuggestionView(ui.View):
     async def score_graph_button(self, interaction: Interaction, button: ui.Button) -> None:
         await interaction.response.defer()
         print("score graph clicked")
-        image = await draw_graph(self.link, "Scores only")
-        identifier, _ = parse_link(self.link)
-        file = File(fp=image, filename=f"game-{identifier}.png")
-        await interaction.channel.send(file=file)  # type: ignore[union-attr]
+        await _graph(interaction, self.link, "Scores only")
         button.disabled = True
         self.score_graph_enabled = False
         await self.update_view()
@@ -64,10 +60,7 @@ class CommandSuggestionView(ui.View):
     async def bonus_graph_button(self, interaction: Interaction, button: ui.Button) -> None:
         await interaction.response.defer()
         print("bonus graph clicked")
-        image = await draw_graph(self.link, "Scores with placement bonus")
-        identifier, _ = parse_link(self.link)
-        file = File(fp=image, filename=f"game-{identifier}.png")
-        await interaction.channel.send(file=file)  # type: ignore[union-attr]
+        await _graph(interaction, self.link, "Scores with placement bonus")
         button.disabled = True
         self.bonus_graph_enabled = False
         await self.update_view()
@@ -1,60 +1,86 @@
 import discord
-from .utilities import analyze_game, draw_graph, long_followup, parse_game, parse_link
+from .precompute import analysis_kind, graph_kind, parse_kind, result_cache
+from .utilities import analyze_game, draw_graph_bytes, long_followup, parse_game, parse_link, stream_followup
 from .shanten import analyze_hand, translate_hand
 from discord import app_commands, ui, ButtonStyle, Colour, Embed, Interaction, Message
 from global_stuff import account_manager
 import logging
+import time
+from io import BytesIO
 from typing import *
 
 async def _parse(interaction: Interaction, link: str, display_hands: Optional[str] = None, display_graph: Optional[str] = None, view: Optional[ui.View] = None) -> Message:
     logging.info("Running parse...")
-    header, ret = await parse_game(link, display_hands)
+    start_time = time.perf_counter()
+    precomputed = result_cache.get(link, parse_kind(display_hands))
+    header, ret = precomputed or await parse_game(link, display_hands)
     logging.info("  game parsed")
     last_message = await long_followup(interaction, ret, header, view=view)
-    logging.info("  response sent")
+    result_cache.record("parse", precomputed is not None, time.perf_counter() - start_time)
     if display_graph is not None:
-        image = await draw_graph(link, display_graph)
-        logging.info("  graph drawn")
-        identifier, _ = parse_link(link)
-        file = discord.File(fp=image, filename=f"game-{identifier}.png")
-        await interaction.channel.send(file=file)  # type: ignore[union-attr]
-        logging.info("  graph sent")
+        await _graph(interaction, link, display_graph)
     return last_message
 
+async def _graph(interaction: Interaction, link: str, display_graph: str) -> None:
+    start_time = time.perf_counter()
+    precomputed = result_cache.get(link, graph_kind(display_graph))
+    image = precomputed or await draw_graph_bytes(link, display_graph)
+    logging.info("  graph drawn")
+    identifier, _ = parse_link(link)
+    file = discord.File(fp=BytesIO(image), filename=f"game-{identifier}.png")
+    await interaction.channel.send(file=file)  # type: ignore[union-attr]
+    result_cache.record("graph", precomputed is not None, time.perf_counter() - start_time)
+
 async def _injustice(interaction: Interaction, link: str, player_set: Set[int], nickname: Optional[str] = None) -> None:
     logging.info("Running injustice")
-    injustices, specified_players = await analyze_game(link, player_set, nickname=nickname)
-    logging.info("  game parsed")
-    if len(specified_players) == 0 and len(link) == 20: # riichi city link with no specified players
-        # return await interaction.followup.send(content="For riichi city injustices, you must specify the player seat (will fix this later)")
-        specified_players = {0} # default to East
-    if len(specified_players) == 0:
-        player_name = "yourself"
-        player_str = "the player specified in the link"
-    elif len(specified_players) == 1:
-        player_name = ["East", "South", "West", "North"][next(iter(specified_players))]
-        player_str = f"the starting {player_name} player"
-    else:
-        player_name = "all players"
-        player_str = "all players"
-    if injustices == []:
-        injustices = [f"No injustices detected for {player_str}.\n"
-                       "Specify another player with the `player` option in `/injustice`.\n"
-                       "Did we miss an injustice? Contribute ideas [here](https://github.com/Longhorn-Riichi/InjusticeJudge/issues/1)!"]
-    header = f"Input: {link}\nAnalysis result for **{player_name}**:"
-    await long_followup(interaction, injustices, header)
-    logging.info("  response sent")
+    start_time = time.perf_counter()
+    precomputed = result_cache.get(link, analysis_kind("injustice", player_set)) if nickname is None else None
+    specified_players = player_set
+    async def injustices() -> AsyncIterator[str]:
+        nonlocal specified_players
+        if precomputed is not None:
+            results, specified_players = precomputed
+            for injustice in results:
+                yield injustice
+            return
+        async for specified_players, kyoku_injustices in analyze_game(link, player_set, nickname=nickname):
+            for injustice in kyoku_injustices:
+                yield injustice
+    def describe_players() -> Tuple[str, str]:
+        players = specified_players
+        if len(players) == 0 and len(link) == 20: # riichi city link with no specified players
+            players = {0} # default to East
+        if len(players) == 0:
+            return "yourself", "the player specified in the link"
+        elif len(players) == 1:
+            player_name = ["East", "South", "West", "North"][next(iter(players))]
+            return player_name, f"the starting {player_name} player"
+        else:
+            return "all players", "all players"
+    no_injustices = lambda: [f"No injustices detected for {describe_players()[1]}.\n"
+                              "Specify another player with the `player` option in `/injustice`.\n"
+                              "Did we miss an injustice? Contribute ideas [here](https://github.com/Longhorn-Riichi/InjusticeJudge/issues/1)!"]
+    header = lambda: f"Input: {link}\nAnalysis result for **{describe_players()[0]}**:"
+    await stream_followup(interaction, injustices(), header, no_injustices)
+    result_cache.record("injustice", precomputed is not None, time.perf_counter() - start_time)
 
 async def _skill(interaction: Interaction, link: str, player_set: Set[int]) -> None:
     logging.info("Running skill")
-    skills, _ = await analyze_game(link, specified_players=player_set, look_for={"skill"})
-    logging.info("  game parsed")
-    if skills == []:
-        skills = [f"No skills detected for any player.\n"
-                   "Did we miss a skill? Contribute ideas [here](https://github.com/Longhorn-Riichi/InjusticeJudge/issues/10)!"]
-    header = f"Input: {link}\nSkills everyone pulled off this game:"
-    await long_followup(interaction, skills, header)
-    logging.info("  response sent")
+    start_time = time.perf_counter()
+    precomputed = result_cache.get(link, analysis_kind("skill", player_set))
+    async def skills() -> AsyncIterator[str]:
+        if precomputed is not None:
+            for skill in precomputed[0]:
+                yield skill
+            return
+        async for _, kyoku_skills in analyze_game(link, specified_players=player_set, look_for={"skill"}):
+            for skill in kyoku_skills:
+                yield skill
+    no_skills = lambda: [f"No skills detected for any player.\n"
+                          "Did we miss a skill? Contribute ideas [here](https://github.com/Longhorn-Riichi/InjusticeJudge/issues/10)!"]
+    header = lambda: f"Input: {link}\nSkills everyone pulled off this game:"
+    await stream_followup(interaction, skills(), header, no_skills)
+    result_cache.record("skill", precomputed is not None, time.perf_counter() - start_time)
 
 async def _shanten(interaction: Interaction, hand: str) -> None:
     logging.info("Running shanten")
@@ -0,0 +1,238 @@
+"""
+Two-tier cache for game logs:
+- memory: LRU of decoded records, bounded by (serialized) bytes
+- disk: compressed in a pack file in the `cached_games` directory (see
+  `pack_store.py`), LRU-evicted under a byte budget, with an index file
+  remembering last access times.
+All file IO happens on a small thread pool.
+
+Plus a small cache of parsed games (`ParsedGameCache`), so the several
+commands run on one game only parse it into `Kyoku`s once.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+from .pack_store import PackStore
+
+INDEX_FILENAME = "index.json"
+INDEX_FLUSH_DELAY = 30 # seconds; access times are flushed lazily
+
+class CacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+        self.disk_read_time = 0.0
+        self.fetch_time = 0.0
+
+    def summary(self) -> List[str]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        rate = lambda n: f"{100*n/lookups:.1f}%" if lookups > 0 else "n/a"
+        avg = lambda total, n: f"{1000*total/n:.0f}ms" if n > 0 else "n/a"
+        return [f"{lookups} lookups: {rate(self.memory_hits)} memory hits, {rate(self.disk_hits)} disk hits, {rate(self.misses)} misses",
+                f"avg disk read {avg(self.disk_read_time, self.disk_hits)}, avg fetch {avg(self.fetch_time, self.misses)}",
+                f"evictions: {self.memory_evictions} from memory, {self.disk_evictions} from disk"]
+
+class GameLogCache:
+    """
+    `get(key, decode, fetch)` returns the decoded log for `key`, trying
+    memory, then disk, then `fetch()` (whose bytes are written to disk).
+    """
+    def __init__(self, store: PackStore, index_path: str, memory_budget: int, disk_budget: int):
+        self.store = store
+        self.index_path = index_path
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="game_cache")
+        self.memory: OrderedDict[str, Tuple[Any, int]] = OrderedDict() # key -> (decoded, size)
+        self.memory_bytes = 0
+        self.disk: OrderedDict[str, int] = OrderedDict() # key -> size, least recently used first
+        self.disk_bytes = 0
+        self.disk_access: Dict[str, float] = {} # key -> last access time, as saved in the index
+        self.stats = CacheStats()
+        self.loaded = False
+        self.load_lock = asyncio.Lock()
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.offline = False # if set, misses raise `LookupError` instead of fetching
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _ensure_loaded(self) -> None:
+        async with self.load_lock:
+            if not self.loaded:
+                await self._run(self._load_index)
+                self.loaded = True
+                await self._evict_disk()
+
+    def _load_index(self) -> None:
+        """Reconcile the index with what's actually on disk"""
+        on_disk = self.store.list()
+        try:
+            with open(self.index_path, "r") as f:
+                last_access: Dict[str, float] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            last_access = {}
+        # logs missing from the index (e.g. just migrated into the pack) use their mtime
+        entries = sorted(on_disk.items(), key=lambda item: last_access.get(item[0], item[1][1]))
+        self.disk = OrderedDict((key, size) for key, (size, _) in entries)
+        self.disk_bytes = sum(self.disk.values())
+        self.disk_access = {key: last_access.get(key, mtime) for key, (_, mtime) in entries}
+        logging.info(f"game_cache: {len(self.disk)} logs on disk ({self.disk_bytes/1e6:.1f} MB)")
+
+    def _write_index(self, snapshot: Dict[str, float]) -> None:
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _schedule_flush(self) -> None:
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(INDEX_FLUSH_DELAY, lambda: loop.create_task(self.flush()))
+
+    async def flush(self) -> None:
+        self.flush_handle = None
+        await self._run(self._write_index, dict(self.disk_access))
+
+    def _touch_disk(self, key: str) -> None:
+        self.disk.move_to_end(key)
+        self.disk_access[key] = time.time()
+        self._schedule_flush()
+
+    def _put_memory(self, key: str, decoded: Any, size: int) -> None:
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1]
+        if size > self.memory_budget:
+            return
+        self.memory[key] = (decoded, size)
+        self.memory_bytes += size
+        while self.memory_bytes > self.memory_budget:
+            _, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted_size
+            self.stats.memory_evictions += 1
+
+    async def _evict_disk(self) -> None:
+        evicted = []
+        while self.disk_bytes > self.disk_budget and len(self.disk) > 1:
+            key, size = self.disk.popitem(last=False)
+            self.disk_access.pop(key, None)
+            self.disk_bytes -= size
+            evicted.append(key)
+        if len(evicted) > 0:
+            self.stats.disk_evictions += len(evicted)
+            await self._run(lambda: [self.store.remove(key) for key in evicted])
+            self._schedule_flush()
+
+    async def get(self, key: str, decode: Callable[[bytes], Any], fetch: Callable[[], Awaitable[bytes]]) -> Any:
+        await self._ensure_loaded()
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            if key in self.disk:
+                self._touch_disk(key)
+            self.stats.memory_hits += 1
+            return self.memory[key][0]
+
+        if key in self.disk:
+            start_time = time.perf_counter()
+            data = await self._run(self.store.read, key)
+            if data is not None:
+                decoded = await self._run(decode, data)
+                self.stats.disk_read_time += time.perf_counter() - start_time
+                self.stats.disk_hits += 1
+                if key in self.disk: # a `put` meanwhile may have evicted it, since it wasn't touched yet
+                    self._touch_disk(key)
+                self._put_memory(key, decoded, len(data))
+                return decoded
+            # someone deleted the file (or `_evict_disk` just did)
+            self.disk_bytes -= self.disk.pop(key, 0)
+            self.disk_access.pop(key, None)
+
+        if self.offline:
+            raise LookupError(f"{key} isn't cached")
+        start_time = time.perf_counter()
+        data = await fetch()
+        self.stats.fetch_time += time.perf_counter() - start_time
+        self.stats.misses += 1
+        decoded = await self._run(decode, data)
+        await self.put(key, data, decoded)
+        return decoded
+
+    async def put(self, key: str, data: bytes, decoded: Any) -> None:
+        await self._ensure_loaded()
+        size = await self._run(self.store.write, key, data)
+        if key in self.disk:
+            self.disk_bytes -= self.disk[key]
+        self.disk[key] = size
+        self.disk_bytes += size
+        self._touch_disk(key)
+        self._put_memory(key, decoded, len(data))
+        await self._evict_disk()
+
+    def summary(self) -> List[str]:
+        return [f"memory: {len(self.memory)} logs, {self.memory_bytes/1e6:.1f}/{self.memory_budget/1e6:.0f} MB",
+                f"disk: {len(self.disk)} logs, {self.disk_bytes/1e6:.1f}/{self.disk_budget/1e6:.0f} MB"] + self.stats.summary()
+
+class ParsedGameCache:
+    """
+    LRU of parsed games with a TTL. Concurrent lookups of the same key
+    share one parse instead of each starting their own; it runs in its own
+    task, so cancelling one lookup doesn't cancel it for the others.
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict() # key -> (expiry, value)
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        if key in self.entries:
+            expiry, value = self.entries[key]
+            if expiry > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        if key in self.in_flight:
+            self.hits += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute_and_store(key, compute))
+            # mark any exception retrieved in case every lookup was cancelled
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self.in_flight[key] = task
+        return await asyncio.shield(self.in_flight[key])
+
+    async def _compute_and_store(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return value
+        finally:
+            del self.in_flight[key]
+
+    def summary(self) -> List[str]:
+        lookups = self.hits + self.misses
+        hit_rate = f"{100*self.hits/lookups:.1f}%" if lookups > 0 else "n/a"
+        return [f"parsed games: {len(self.entries)}/{self.max_entries} cached, {lookups} lookups, {hit_rate} hits"]
+
+CACHE_DIRECTORY = os.getenv("game_cache_dir", "cached_games")
+game_log_cache = GameLogCache(PackStore(CACHE_DIRECTORY, codec=os.getenv("game_cache_compression") or None),
+                              index_path=os.path.join(CACHE_DIRECTORY, INDEX_FILENAME),
+                              memory_budget=int(os.getenv("game_cache_memory_bytes", 64_000_000)),
+                              disk_budget=int(os.getenv("game_cache_disk_bytes", 1_000_000_000)))
+parsed_game_cache = ParsedGameCache(max_entries=int(os.getenv("parsed_game_cache_size", 32)),
+                                    ttl=float(os.getenv("parsed_game_cache_ttl", 1800)))
@@ -0,0 +1,94 @@
+"""
+LRU memo for hand analyses (like `shanten._analyze_hand`), keyed on the
+hand's canonical form so that hands which only differ in tile order, red
+fives or which suit is which (123m456p vs 123p456s) share one analysis:
+- tiles are sorted, with red fives as fives
+- the number suits are relabelled in order of most tiles (then highest
+  counts), ties keeping their order
+The cached analysis is of the canonical hand; on the way out its waits and
+the tiles in its text (found by how `pt` renders each tile) are relabelled
+back to the hand's actual suits. Runs of tiles that were sorted are sorted
+again, but separately rendered groups of tiles (e.g. shapes listed one after
+another) stay in the canonical hand's order.
+"""
+
+import re
+from collections import OrderedDict
+from typing import *
+
+from modules.InjusticeJudge.injustice_judge.display import ph, pt
+from modules.InjusticeJudge.injustice_judge.utils import normalize_red_fives
+
+Analysis = Tuple[List[str], Set[int]] # (lines, waits)
+SUITS = [10, 20, 30]
+ALL_TILES = [suit + rank for suit in SUITS for rank in range(1, 10)] + list(range(41, 48))
+
+def relabel(tile: int, suit_map: Dict[int, int]) -> int:
+    suit = tile // 10 * 10
+    return suit_map.get(suit, suit) + tile % 10
+
+def canonicalize(hand: Iterable[int], relabel_suits: bool = True) -> Tuple[Tuple[int, ...], Dict[int, int]]:
+    """(canonical hand, canonical suit -> actual suit)"""
+    tiles = sorted(normalize_red_fives(hand))
+    if not relabel_suits:
+        return tuple(tiles), {}
+    counts = {suit: [0] * 10 for suit in SUITS}
+    for tile in tiles:
+        if tile < 40:
+            counts[tile // 10 * 10][tile % 10] += 1
+    order = sorted(SUITS, key=lambda suit: (sum(counts[suit]), counts[suit]), reverse=True)
+    to_canonical = {actual: canonical for canonical, actual in zip(SUITS, order)}
+    return tuple(sorted(relabel(tile, to_canonical) for tile in tiles)), {canonical: actual for actual, canonical in to_canonical.items()}
+
+class HandMemo:
+    """`get(hand)` is `analyze(hand)`, cached; the results are copies, so callers may change them"""
+    def __init__(self, analyze: Callable[[Tuple[int, ...]], Analysis], max_entries: int):
+        self.analyze = analyze
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Tuple[int, ...], Analysis] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.relabelled = 0 # hits and misses whose suits had to be relabelled
+        self.tile_renders: Optional[Dict[str, int]] = None
+        self.relabel_suits = True
+
+    def _find_renders(self) -> None:
+        self.tile_renders = {pt(tile): tile for tile in ALL_TILES}
+        alternatives = "|".join(map(re.escape, sorted(self.tile_renders, key=len, reverse=True)))
+        self.tile_pattern = re.compile(alternatives)
+        self.run_pattern = re.compile(f"(?:{alternatives})+")
+        # only relabel suits if tiles can be told apart in the text
+        self.relabel_suits = len(self.tile_renders) == len(ALL_TILES) and "" not in self.tile_renders and ph((11, 22)) == pt(11) + pt(22)
+
+    def _relabel_run(self, match: re.Match, suit_map: Dict[int, int]) -> str:
+        assert self.tile_renders is not None
+        tiles = [self.tile_renders[render] for render in self.tile_pattern.findall(match.group(0))]
+        actual = [relabel(tile, suit_map) for tile in tiles]
+        if tiles == sorted(tiles):
+            actual.sort()
+        return "".join(map(pt, actual))
+
+    def get(self, hand: Tuple[int, ...]) -> Analysis:
+        if self.tile_renders is None:
+            self._find_renders()
+        canonical, suit_map = canonicalize(hand, self.relabel_suits)
+        if canonical in self.entries:
+            self.entries.move_to_end(canonical)
+            self.hits += 1
+            lines, waits = self.entries[canonical]
+        else:
+            self.misses += 1
+            lines, waits = self.entries[canonical] = self.analyze(canonical)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if all(canonical_suit == actual_suit for canonical_suit, actual_suit in suit_map.items()):
+            return list(lines), set(waits)
+        self.relabelled += 1
+        return ([self.run_pattern.sub(lambda match: self._relabel_run(match, suit_map), line) for line in lines],
+                {relabel(tile, suit_map) for tile in waits})
+
+    def summary(self) -> List[str]:
+        lookups = self.hits + self.misses
+        rate = lambda n: f"{100*n/lookups:.1f}%" if lookups > 0 else "n/a"
+        return [f"hand analyses: {len(self.entries)}/{self.max_entries} cached, {lookups} lookups,"
+                f" {rate(self.hits)} hits, {rate(self.relabelled)} relabelled"]
@@ -0,0 +1,281 @@
+"""
+Storage for the game log cache's disk tier: every log lives, compressed, in
+one append-only pack file instead of one file per game.
+
+- `games.pack`: records back to back, each the key followed by the compressed log
+- `games.idx`: fixed-width entries sorted by the key's digest, memory-mapped
+  and binary-searched, so a lookup never touches the pack file
+- `games.journal`: index changes since `games.idx` was last rewritten;
+  replayed into memory on open and merged into the index every so often
+
+Removed logs leave dead space in the pack until it's compacted.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import *
+
+try:
+    import zstandard  # type: ignore[import]
+except ImportError:
+    zstandard = None
+
+PACK_FILENAME = "games.pack"
+INDEX_FILENAME = "games.idx"
+JOURNAL_FILENAME = "games.journal"
+
+# digest, record offset, compressed size, uncompressed size, mtime, key length, codec
+ENTRY = struct.Struct("<16sQIIdHB5x")
+# op + entry
+JOURNAL_ENTRY = struct.Struct("<B" + ENTRY.format[1:])
+OP_WRITE = 0
+OP_REMOVE = 1
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+JOURNAL_LIMIT = 256       # merge the journal into the index after this many entries
+COMPACT_MIN_DEAD = 16_000_000 # compact once at least this many bytes...
+COMPACT_DEAD_RATIO = 0.5      # ...and this fraction of the pack are dead
+
+class Entry(NamedTuple):
+    digest: bytes
+    offset: int
+    size: int
+    raw_size: int
+    mtime: float
+    key_len: int
+    codec: int
+
+def digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+class PackStore:
+    """
+    Drop-in replacement for a one-file-per-key directory; `GameLogCache` only
+    uses `list`, `read`, `write` and `remove`. Any loose files in `directory`
+    (i.e. the old `cached_games/game-*` files) are moved into the pack on open.
+    Thread-safe, since `GameLogCache` calls it from a thread pool.
+    """
+    def __init__(self, directory: str, codec: Optional[str] = None):
+        self.directory = directory
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "zlib"
+        if codec == "zstd" and zstandard is None:
+            logging.warning("game_cache: zstandard isn't installed, compressing with zlib instead")
+            codec = "zlib"
+        self.codec = CODEC_ZSTD if codec == "zstd" else CODEC_ZLIB
+        self.lock = threading.RLock()
+        self.opened = False
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    # opening
+
+    def _open(self) -> None:
+        if self.opened:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.pack_fd = os.open(self._path(PACK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+        self.pack_size = os.fstat(self.pack_fd).st_size
+        self._map_index()
+        self.pending: Dict[bytes, Optional[Entry]] = {} # digest -> entry, or None if removed
+        self.journal_entries = 0
+        self._replay_journal()
+        self.journal = open(self._path(JOURNAL_FILENAME), "ab")
+        self.live_bytes = sum(entry.key_len + entry.size for entry in self._entries())
+        self.opened = True
+        self._migrate_loose_files()
+
+    def _map_index(self) -> None:
+        self.index_file = open(self._path(INDEX_FILENAME), "a+b")
+        size = os.fstat(self.index_file.fileno()).st_size
+        self.index_count = size // ENTRY.size
+        self.index: Optional[mmap.mmap] = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+
+    def _replay_journal(self) -> None:
+        try:
+            with open(self._path(JOURNAL_FILENAME), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # a torn write at the end (from a crash) is ignored
+        for start in range(0, len(data) - JOURNAL_ENTRY.size + 1, JOURNAL_ENTRY.size):
+            op, *fields = JOURNAL_ENTRY.unpack_from(data, start)
+            entry = Entry(*fields)
+            self.pending[entry.digest] = entry if op == OP_WRITE else None
+            self.journal_entries += 1
+
+    def _migrate_loose_files(self) -> None:
+        loose = [entry for entry in os.scandir(self.directory)
+                 if entry.is_file() and entry.name.startswith("game-") and not entry.name.endswith(".tmp")]
+        if len(loose) == 0:
+            return
+        start_time = time.perf_counter()
+        for entry in loose:
+            with open(entry.path, "rb") as f:
+                self._write(entry.name, f.read(), entry.stat().st_mtime)
+            os.remove(entry.path)
+        logging.info(f"game_cache: moved {len(loose)} cached logs into {PACK_FILENAME} in {time.perf_counter() - start_time:.1f}s")
+
+    # index lookups
+
+    def _index_entry(self, i: int) -> Entry:
+        assert self.index is not None
+        return Entry(*ENTRY.unpack_from(self.index, i * ENTRY.size))
+
+    def _index_find(self, key_digest: bytes) -> Optional[Entry]:
+        lo, hi = 0, self.index_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            assert self.index is not None
+            mid_digest = self.index[mid * ENTRY.size : mid * ENTRY.size + 16]
+            if mid_digest < key_digest:
+                lo = mid + 1
+            elif mid_digest > key_digest:
+                hi = mid
+            else:
+                return self._index_entry(mid)
+        return None
+
+    def _find(self, key_digest: bytes) -> Optional[Entry]:
+        if key_digest in self.pending:
+            return self.pending[key_digest]
+        return self._index_find(key_digest)
+
+    def _entries(self) -> Iterator[Entry]:
+        """Every live entry, in digest order"""
+        merged: Dict[bytes, Optional[Entry]] = {}
+        for i in range(self.index_count):
+            entry = self._index_entry(i)
+            merged[entry.digest] = entry
+        merged.update(self.pending)
+        for key_digest in sorted(merged):
+            entry = merged[key_digest]
+            if entry is not None:
+                yield entry
+
+    # journal and index maintenance
+
+    def _log(self, op: int, entry: Entry) -> None:
+        self.journal.write(JOURNAL_ENTRY.pack(op, *entry))
+        self.journal.flush()
+        self.pending[entry.digest] = entry if op == OP_WRITE else None
+        self.journal_entries += 1
+        if self.journal_entries >= JOURNAL_LIMIT:
+            self._rewrite_index(list(self._entries()))
+
+    def _rewrite_index(self, entries: List[Entry]) -> None:
+        tmp_path = self._path(INDEX_FILENAME) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in entries:
+                f.write(ENTRY.pack(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+        if self.index is not None:
+            self.index.close()
+        self.index_file.close()
+        os.replace(tmp_path, self._path(INDEX_FILENAME))
+        self._map_index()
+        # the new index covers everything in the journal
+        self.journal.close()
+        self.journal = open(self._path(JOURNAL_FILENAME), "wb")
+        self.pending = {}
+        self.journal_entries = 0
+
+    def _maybe_compact(self) -> None:
+        dead_bytes = self.pack_size - self.live_bytes
+        if dead_bytes >= COMPACT_MIN_DEAD and dead_bytes >= COMPACT_DEAD_RATIO * self.pack_size:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the pack with only the live records"""
+        with self.lock:
+            self._open()
+            start_time = time.perf_counter()
+            old_size = self.pack_size
+            tmp_path = self._path(PACK_FILENAME) + ".tmp"
+            entries = []
+            with open(tmp_path, "wb") as f:
+                offset = 0
+                for entry in self._entries():
+                    record = os.pread(self.pack_fd, entry.key_len + entry.size, entry.offset)
+                    f.write(record)
+                    entries.append(entry._replace(offset=offset))
+                    offset += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+            # if we crash before the index is rewritten, it points into the new pack;
+            # losing the cache is fine, so just make sure that's noticed (see `read`)
+            os.close(self.pack_fd)
+            os.replace(tmp_path, self._path(PACK_FILENAME))
+            self.pack_fd = os.open(self._path(PACK_FILENAME), os.O_RDWR)
+            self.pack_size = offset
+            self._rewrite_index(entries)
+            logging.info(f"game_cache: compacted {PACK_FILENAME} from {old_size/1e6:.1f} MB"
+                         f" to {self.pack_size/1e6:.1f} MB in {time.perf_counter() - start_time:.1f}s")
+
+    # the interface `GameLogCache` uses
+
+    def list(self) -> Dict[str, Tuple[int, float]]:
+        """key -> (size in bytes, last modified time)"""
+        with self.lock:
+            self._open()
+            return {os.pread(self.pack_fd, entry.key_len, entry.offset).decode(errors="replace"): (entry.key_len + entry.size, entry.mtime)
+                    for entry in self._entries()}
+
+    def read(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            self._open()
+            encoded_key = key.encode()
+            entry = self._find(digest(key))
+            if entry is None:
+                return None
+            record = os.pread(self.pack_fd, entry.key_len + entry.size, entry.offset)
+        if record[:entry.key_len] != encoded_key:
+            logging.error(f"game_cache: {PACK_FILENAME} doesn't match its index at {key}")
+            return None
+        data = record[entry.key_len:]
+        if entry.codec == CODEC_ZSTD:
+            assert zstandard is not None, "logs were compressed with zstd, but zstandard isn't installed"
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=entry.raw_size)
+        return zlib.decompress(data)
+
+    def write(self, key: str, data: bytes) -> int:
+        """Returns the number of bytes it takes up on disk"""
+        with self.lock:
+            self._open()
+            return self._write(key, data, time.time())
+
+    def _write(self, key: str, data: bytes, mtime: float) -> int:
+        encoded_key = key.encode()
+        if self.codec == CODEC_ZSTD:
+            compressed = zstandard.ZstdCompressor(level=9).compress(data)
+        else:
+            compressed = zlib.compress(data, 6)
+        key_digest = digest(key)
+        old_entry = self._find(key_digest)
+        if old_entry is not None:
+            self.live_bytes -= old_entry.key_len + old_entry.size
+        offset = self.pack_size
+        os.pwrite(self.pack_fd, encoded_key + compressed, offset)
+        self.pack_size += len(encoded_key) + len(compressed)
+        self.live_bytes += len(encoded_key) + len(compressed)
+        self._log(OP_WRITE, Entry(key_digest, offset, len(compressed), len(data), mtime, len(encoded_key), self.codec))
+        return len(encoded_key) + len(compressed)
+
+    def remove(self, key: str) -> None:
+        with self.lock:
+            self._open()
+            entry = self._find(digest(key))
+            if entry is not None:
+                self.live_bytes -= entry.key_len + entry.size
+                self._log(OP_REMOVE, entry)
+                self._maybe_compact()
@@ -0,0 +1,102 @@
+"""
+Precomputes everything the `CommandSuggestionView` buttons show for a game
+(parse, both graphs, all-seat injustices and skills) as soon as a lobby game
+ends, so the buttons can answer straight from `result_cache`.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import *
+
+from .analysis_service import analysis_pool
+from .utilities import draw_graph_bytes, fetch_worker_log, parse_game
+
+ALL_SEATS = {0,1,2,3}
+GRAPH_MODES = ["Scores only", "Scores with placement bonus"]
+
+def parse_kind(display_hands: Optional[str]) -> str:
+    return f"parse:{display_hands}"
+def graph_kind(display_graph: str) -> str:
+    return f"graph:{display_graph}"
+def analysis_kind(look_for: str, specified_players: Set[int]) -> str:
+    return f"{look_for}:{','.join(map(str, sorted(specified_players)))}"
+
+class ResultCache:
+    """
+    LRU of games -> {kind: result}, plus response latencies for
+    cache hits vs. cold (computed on the spot) responses.
+    """
+    LATENCIES_KEPT = 1000 # per kind of response, for the medians
+
+    def __init__(self, max_games: int):
+        self.max_games = max_games
+        self.games: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.responses: Dict[bool, int] = {True: 0, False: 0} # hit? -> count
+        self.latencies: Dict[bool, Deque[float]] = {hit: deque(maxlen=self.LATENCIES_KEPT) for hit in (True, False)} # hit? -> latest seconds
+
+    def get(self, link: str, kind: str) -> Optional[Any]:
+        if link in self.games:
+            self.games.move_to_end(link)
+            return self.games[link].get(kind)
+        return None
+
+    def put(self, link: str, kind: str, value: Any) -> None:
+        self.games.setdefault(link, {})[kind] = value
+        self.games.move_to_end(link)
+        while len(self.games) > self.max_games:
+            self.games.popitem(last=False)
+
+    def record(self, kind: str, hit: bool, seconds: float) -> None:
+        self.responses[hit] += 1
+        self.latencies[hit].append(seconds)
+        logging.info(f"  {kind} answered {'from precomputed results' if hit else 'cold'} in {1000*seconds:.0f}ms")
+
+    def summary(self) -> List[str]:
+        def describe(hit: bool) -> str:
+            if self.responses[hit] == 0:
+                return "none"
+            ordered = sorted(self.latencies[hit])
+            return f"{self.responses[hit]}, median {1000*ordered[len(ordered)//2]:.0f}ms, max {1000*ordered[-1]:.0f}ms (last {len(ordered)})"
+        return [f"precomputed results: {len(self.games)}/{self.max_games} games",
+                f"  hits: {describe(True)}",
+                f"  cold: {describe(False)}"]
+
+result_cache = ResultCache(max_games=int(os.getenv("precompute_cache_size", 16)))
+
+# one game at a time, so precomputing never takes more than one analysis
+# worker away from people actually running commands; its jobs also wait
+# for a worker behind everyone else's (`low_priority`)
+precompute_lock = asyncio.Lock()
+precompute_tasks: Set[asyncio.Task] = set()
+
+def schedule_precompute(link: str) -> None:
+    task = asyncio.create_task(precompute(link))
+    precompute_tasks.add(task)
+    task.add_done_callback(precompute_tasks.discard)
+
+async def precompute(link: str) -> None:
+    async with precompute_lock:
+        start_time = time.perf_counter()
+        async def step(kind: str, compute: Callable[[], Awaitable[Any]]) -> None:
+            if result_cache.get(link, kind) is not None:
+                return
+            try:
+                result_cache.put(link, kind, await compute())
+            except Exception as e:
+                logging.error(f"precompute: {kind} failed for {link}: {e!r}")
+
+        try:
+            fetched_log = await fetch_worker_log(link) # every step below reuses this fetch
+        except Exception as e:
+            logging.error(f"precompute: failed to fetch {link}: {e!r}")
+            return
+        await step(parse_kind(None), lambda: parse_game(link, None))
+        for mode in GRAPH_MODES:
+            await step(graph_kind(mode), lambda: draw_graph_bytes(link, mode))
+        for look_for in ["injustice", "skill"]:
+            await step(analysis_kind(look_for, ALL_SEATS),
+                       lambda: analysis_pool.analyze(link, fetched_log, ALL_SEATS, {look_for}, None, low_priority=True))
+        logging.info(f"precompute: {link} done in {1000*(time.perf_counter() - start_time):.0f}ms")
@@ -0,0 +1,163 @@
+"""
+Decodes Mahjong Soul `ResGameRecord`s into what InjusticeJudge's `parse_majsoul()`
+expects, without the per-message reflection of `parse_wrapped_bytes()` and
+`MessageToDict()`:
+- wrapped messages are unwrapped through a name -> class map built once
+- messages are turned into dicts by a per-message-type plan of fields, built
+  on first use, that only visits fields that are actually set
+- actions can optionally be decoded on first access instead of all at once
+
+Run this file to compare it against the old path on cached games.
+"""
+
+import base64
+from typing import *
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal import type_checkers  # type: ignore[import]
+from google.protobuf.json_format import MessageToDict  # type: ignore[import]
+from modules.pymjsoul.proto import liqi_combined_pb2 as proto
+
+# "RecordNewRound" -> proto.RecordNewRound
+MESSAGE_CLASSES: Dict[str, Any] = {name: getattr(proto, name) for name in proto.DESCRIPTOR.message_types_by_name}
+
+def unwrap(data: bytes) -> Tuple[str, Any]:
+    """Same as InjusticeJudge's `parse_wrapped_bytes()`: (message name, message)"""
+    wrapper = proto.Wrapper()  # type: ignore[attr-defined]
+    wrapper.ParseFromString(data)
+    name = wrapper.name.rpartition(".")[2] # e.g. ".lq.RecordNewRound"
+    try:
+        return name, MESSAGE_CLASSES[name].FromString(wrapper.data)
+    except Exception:
+        raise Exception(f"Failed to decode the {name} message")
+
+class LazyActions(Sequence):
+    """The actions of a record, each unwrapped the first time it's accessed"""
+    def __init__(self, wrapped: List[bytes]):
+        self.wrapped = wrapped
+        self.decoded: List[Optional[Tuple[str, Any]]] = [None] * len(wrapped)
+
+    def __len__(self) -> int:
+        return len(self.wrapped)
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        action = self.decoded[i]
+        if action is None:
+            action = self.decoded[i] = unwrap(self.wrapped[i])
+        return action
+
+def decode_actions(record_data: bytes, lazy: bool = False) -> Sequence[Tuple[str, Any]]:
+    """The (name, message) actions in a `ResGameRecord.data`"""
+    _, details = unwrap(record_data)
+    if len(details.actions) > 0:
+        wrapped = [action.result for action in details.actions if len(action.result) > 0]
+    else:
+        wrapped = list(details.records)
+    return LazyActions(wrapped) if lazy else [unwrap(data) for data in wrapped]
+
+"""
+=====================================================
+message -> dict, matching `MessageToDict()`
+=====================================================
+"""
+
+_INT64_TYPES = {FieldDescriptor.TYPE_INT64, FieldDescriptor.TYPE_UINT64, FieldDescriptor.TYPE_SINT64,
+                FieldDescriptor.TYPE_FIXED64, FieldDescriptor.TYPE_SFIXED64}
+_plans: Dict[str, Dict[str, Tuple[str, Callable[[Any], Any], bool]]] = {} # message type -> field name -> (json name, convert, repeated)
+
+def _is_repeated(field: FieldDescriptor) -> bool:
+    # `label` is gone in newer protobuf versions
+    if hasattr(field, "is_repeated"):
+        return field.is_repeated
+    return field.label == FieldDescriptor.LABEL_REPEATED
+
+def _converter(field: FieldDescriptor) -> Callable[[Any], Any]:
+    if field.type == FieldDescriptor.TYPE_MESSAGE:
+        if field.message_type.GetOptions().map_entry:
+            convert_value = _converter(field.message_type.fields_by_name["value"])
+            return lambda entries: {str(key): convert_value(value) for key, value in entries.items()}
+        if field.message_type.full_name.startswith("google.protobuf."):
+            return lambda message: MessageToDict(message) # well-known types have special JSON forms
+        return message_to_dict
+    if field.type in _INT64_TYPES:
+        return str
+    if field.type == FieldDescriptor.TYPE_ENUM:
+        values = field.enum_type.values_by_number
+        return lambda number: values[number].name if number in values else number
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return lambda value: base64.b64encode(value).decode("utf-8")
+    if field.type == FieldDescriptor.TYPE_FLOAT:
+        return type_checkers.ToShortestFloat
+    return lambda value: value
+
+def _plan(descriptor) -> Dict[str, Tuple[str, Callable[[Any], Any], bool]]:
+    plan = _plans.get(descriptor.full_name)
+    if plan is None:
+        plan = _plans[descriptor.full_name] = {
+            field.name: (field.json_name, _converter(field),
+                         _is_repeated(field) and not (field.type == FieldDescriptor.TYPE_MESSAGE and field.message_type.GetOptions().map_entry))
+            for field in descriptor.fields}
+    return plan
+
+def message_to_dict(message) -> Dict[str, Any]:
+    """
+    `MessageToDict(message)` for the messages in Mahjong Soul records
+    (unset fields left out, int64s as strings, enums by name, camelCase names)
+    """
+    plan = _plan(message.DESCRIPTOR)
+    ret = {}
+    for field, value in message.ListFields():
+        json_name, convert, repeated = plan[field.name]
+        ret[json_name] = [convert(v) for v in value] if repeated else convert(value)
+    return ret
+
+def decode_record(record, lazy: bool = False) -> Tuple[Sequence[Tuple[str, Any]], Dict[str, Any]]:
+    """(actions, head as a dict) of a `ResGameRecord`"""
+    return decode_actions(record.data, lazy), message_to_dict(record.head)
+
+if __name__ == "__main__":
+    # compare against the old path on the cached regression games:
+    #   python -m ext.InjusticeJudge.record_decoder [cache directory]
+    import sys
+    import time
+    from unit_test_imports import links
+    from modules.InjusticeJudge.injustice_judge.fetch import parse_majsoul_link, parse_wrapped_bytes
+    from .pack_store import PackStore
+
+    def old_decode(record):
+        parsed = parse_wrapped_bytes(record.data)[1]
+        if parsed.actions != []:
+            actions = [parse_wrapped_bytes(action.result) for action in parsed.actions if len(action.result) > 0]
+        else:
+            actions = [parse_wrapped_bytes(record) for record in parsed.records]
+        return actions, MessageToDict(record.head)
+
+    store = PackStore(sys.argv[1] if len(sys.argv) > 1 else "cached_games")
+    records = []
+    for reason, link in links.items():
+        if "paipu=" in link:
+            data = store.read(f"game-{parse_majsoul_link(link)[0]}.log")
+            if data is not None:
+                record = proto.ResGameRecord()  # type: ignore[attr-defined]
+                record.ParseFromString(data)
+                records.append((reason, record))
+    if len(records) == 0:
+        sys.exit("No cached Mahjong Soul games; run `injustice_benchmark.py --record` or the bot first")
+
+    totals = {"old": 0.0, "new": 0.0, "new (lazy)": 0.0}
+    for reason, record in records:
+        times = {}
+        for name, decode in [("old", old_decode), ("new", decode_record), ("new (lazy)", lambda r: decode_record(r, lazy=True))]:
+            start_time = time.perf_counter()
+            for _ in range(20):
+                actions, head = decode(record)
+            times[name] = (time.perf_counter() - start_time) / 20
+            totals[name] += times[name]
+        old_actions, old_head = old_decode(record)
+        new_actions, new_head = decode_record(record)
+        assert new_head == old_head, f"{reason}: heads differ"
+        assert list(new_actions) == old_actions, f"{reason}: actions differ"
+        print(f"{reason[:40]:<40} {len(new_actions):>5} actions: " + ", ".join(f"{name} {1000*t:.2f}ms" for name, t in times.items()))
+    print(f"total over {len(records)} games: " + ", ".join(f"{name} {1000*t:.1f}ms" for name, t in totals.items()))
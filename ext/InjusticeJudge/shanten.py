@@ -1,8 +1,12 @@
+import os
 from typing import *
 from modules.InjusticeJudge.injustice_judge.display import ph, pt
 from modules.InjusticeJudge.injustice_judge.constants import SUCC, PRED, TANYAOHAI, YAOCHUUHAI
-from modules.InjusticeJudge.injustice_judge.shanten import Suits, to_suits, from_suits, eliminate_all_groups, eliminate_some_groups, get_shanten_type, calculate_chiitoitsu_shanten, calculate_kokushi_shanten, eliminate_some_taatsus, get_hand_shanten, get_tenpai_waits, calculate_wait_extensions, calculate_tanki_wait_extensions
+from modules.InjusticeJudge.injustice_judge.shanten import Suits, to_suits, from_suits, eliminate_all_groups, eliminate_some_groups, get_shanten_type, calculate_chiitoitsu_shanten, calculate_kokushi_shanten, calculate_wait_extensions, calculate_tanki_wait_extensions
 from modules.InjusticeJudge.injustice_judge.utils import try_remove_all_tiles, normalize_red_fives, sorted_hand, get_taatsu_wait
+from .hand_memo import HandMemo
+from .shanten_table import shanten_table
+from .tile_set import TileSet
 
 SHANTEN_STRINGS = {1: "iishanten", 2: "ryanshanten", 3: "sanshanten"}
 
@@ -19,15 +23,17 @@ def translate_hand(hand: str) -> Tuple[int, ...]:
     return tuple(reversed(ret))
 
 def _analyze_hand(hand: Tuple[int, ...]) -> Tuple[List[str], Set[int]]:
+    if len(hand) in {5, 8, 11, 14}:
+        return describe_discards(hand), set()
     if len(hand) not in {4, 7, 10, 13}:
-        return ["The given hand must be of length 4, 7, 10, or 13."], set()
+        return ["The given hand must be of length 4, 7, 10, or 13 (or 14 to choose a discard)."], set()
     suits = to_suits(hand)
     groupless_hands = eliminate_all_groups(suits)
     groups_needed = (len(next(from_suits(groupless_hands))) - 1) // 3
-    removed_taatsus = eliminate_some_taatsus(groupless_hands)
-    shanten_int: int = get_hand_shanten(removed_taatsus, groups_needed)
+    # standard shanten and waits come from the table; the rest only describes them
+    shanten_int, standard_waits = shanten_table.shanten_and_waits(hand)
     shanten: float = float(shanten_int)
-    waits: Set[int] = set()
+    waits = TileSet()
     debug_info: Dict[str, Any] = {"hand": hand, "shanten": shanten}
     ctr = Counter(normalize_red_fives(hand))
     ret = [f"Hand: {ph(hand)}", f"Hand with groups removed: {' or '.join(sorted(map(ph, from_suits(groupless_hands))))}", ""]
@@ -39,12 +45,15 @@ def _analyze_hand(hand: Tuple[int, ...]) -> Tuple[List[str], Set[int]]:
         debug_info["c_shanten"] = c_shanten
         debug_info["k_shanten"] = k_shanten
         if c_shanten <= shanten_int:
-            debug_info["chiitoitsu_waits"] = set(c_waits)
+            debug_info["chiitoitsu_waits"] = TileSet(c_waits)
         elif k_shanten <= shanten_int:
-            debug_info["kokushi_waits"] = set(k_waits)
+            debug_info["kokushi_waits"] = TileSet(k_waits)
 
     if shanten_int == 0:
-        waits = get_tenpai_waits(hand)
+        waits = TileSet(standard_waits)
+        if len(hand) == 13:
+            waits |= TileSet(c_waits) if c_shanten == 0 else TileSet()
+            waits |= TileSet(k_waits) if k_shanten == 0 else TileSet()
         debug_info["tenpai_waits"] = waits
         ret.extend(describe_tenpai(debug_info))
     elif shanten_int in {1, 2, 3}:
@@ -63,13 +72,11 @@ def _analyze_hand(hand: Tuple[int, ...]) -> Tuple[List[str], Set[int]]:
             ret.extend(describe_headless_shanten(shanten_int, debug_info, waits))
             waits |= debug_info["headless_taatsu_waits"]
             waits |= debug_info["headless_tanki_waits"]
-            extended_waits = set(wait for waits, _, _ in debug_info["headless_tanki_extensions"] for wait in waits)
+            extended_waits = TileSet(wait for waits, _, _ in debug_info["headless_tanki_extensions"] for wait in waits)
             waits |= extended_waits
         if shanten_digits[3] in "123":
             ret.extend(describe_simple_shanten(shanten_int, debug_info, waits))
-            for s_hand in debug_info["simple_hands"]:
-                waits |= s_hand["simple_waits"]  # type: ignore[call-overload]
-                waits |= s_hand["complex_waits"]  # type: ignore[call-overload]
+            waits |= debug_info["simple_shanten_waits"]
 
         # check non-standard iishanten
         if len(hand) == 13:
@@ -87,7 +94,7 @@ def _analyze_hand(hand: Tuple[int, ...]) -> Tuple[List[str], Set[int]]:
     if shanten < 2:
         # remove all ankan in hand from the waits
         ctr = Counter(normalize_red_fives(hand))
-        ankan_tiles = {k for k, v in ctr.items() if v == 4}
+        ankan_tiles = TileSet(k for k, v in ctr.items() if v == 4)
         debug_info["ankan_tiles"] = ankan_tiles
         ankan_description = describe_ankan(debug_info, waits)
         if len(ankan_description) > 0 and len(ret) > 3:
@@ -95,19 +102,24 @@ def _analyze_hand(hand: Tuple[int, ...]) -> Tuple[List[str], Set[int]]:
         ret.extend(ankan_description)
         waits -= ankan_tiles
         if len(waits) == 0 and len(ankan_tiles) > 0:
-            debug_info["tanki_iishanten_waits"] = (TANYAOHAI | YAOCHUUHAI) - {k for k, v in ctr.items() if v >= 3}
+            debug_info["tanki_iishanten_waits"] = TileSet(TANYAOHAI | YAOCHUUHAI) - {k for k, v in ctr.items() if v >= 3}
             if len(ankan_description) > 0:
                 ret.append("")
             ret.extend(describe_tanki_iishanten(debug_info))
 
     if len(waits) > 0:
-        ret.insert(2, f"Total waits: {ph(sorted_hand(waits))}")
-        ret.extend(["", f"This results in an overall wait on {ph(sorted_hand(waits))}."])
+        ret.insert(2, f"Total waits: {ph(waits.sorted())}")
+        ret.extend(["", f"This results in an overall wait on {ph(waits.sorted())}."])
+
+    return ret, set(waits)
 
-    return ret, waits
+# `_analyze_hand`, cached for hands of the same shape; use this rather than calling it directly
+hand_analysis = HandMemo(_analyze_hand, max_entries=int(os.getenv("hand_analysis_cache_size", 4096)))
 
 def analyze_hand(hand: Tuple[int, ...]) -> List[str]:
-    ret, waits = _analyze_hand(hand)
+    ret, waits = hand_analysis.get(hand)
+    if ret[0].startswith("Hand: "):
+        ret[0] = f"Hand: {ph(hand)}" # as given, rather than the cached hand's sorted tiles
     return ret
 
 def get_shape_str(max_shapes: int, simple_shapes: Tuple[Tuple[int, ...], ...], complex_shapes: Tuple[Tuple[int, ...], ...], pair: Optional[Tuple[int, ...]], max_floating: int, floating_tiles: Tuple[int, ...]):
@@ -135,7 +147,7 @@ def get_shape_str(max_shapes: int, simple_shapes: Tuple[Tuple[int, ...], ...], c
     floating_str = f"{floating_num_str} floating {ph(floating_tiles)}" if floating_num > 0 else "no floating tiles"
     return f" and ".join(s for s in [shape_str, pair_str, floating_str] if s != "")
 
-def describe_simple_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set[int]) -> List[str]:
+def describe_simple_shanten(shanten: int, debug_info: Dict[str, Any], waits: TileSet) -> List[str]:
     ret = []
     is_ryanmen = lambda h: len(h) == 2 and SUCC[h[0]] == h[1] and h[0] not in {11,18,21,28,31,38}
     shanten_string = SHANTEN_STRINGS[shanten]
@@ -145,8 +157,8 @@ def describe_simple_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set
         simple_shapes = hand["simple_shapes"]
         complex_shapes = hand["complex_shapes"]
         floating_tiles = hand["floating_tiles"]
-        simple_waits = hand["simple_waits"]
-        complex_waits = hand["complex_waits"]
+        simple_waits = TileSet(hand["simple_waits"])
+        complex_waits = TileSet(hand["complex_waits"])
         extensions = hand["extensions"]
         has_complex_pair = any(len(set(complex_shape)) == 2 for complex_shape in complex_shapes)
         perfect_str = ""
@@ -187,11 +199,11 @@ def describe_simple_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set
         wait_strs = []
         if len(simple_shapes) > 0:
             s = "s" if len(simple_shapes) != 1 else ""
-            wait_strs.append(f"its simple shape{s} {ph(sorted_hand(simple_waits))}")
+            wait_strs.append(f"its simple shape{s} {ph(simple_waits.sorted())}")
         if len(complex_shapes) > 0:
             s = "s" if len(complex_shapes) != 1 else ""
-            wait_strs.append(f"its complex shape{s} {ph(sorted_hand(complex_waits))}")
-        add_string = "" if len(waits) == 0 else f", adding {ph(sorted_hand((simple_waits | complex_waits) - waits))} to the wait"
+            wait_strs.append(f"its complex shape{s} {ph(complex_waits.sorted())}")
+        add_string = "" if len(waits) == 0 else f", adding {ph(((simple_waits | complex_waits) - waits).sorted())} to the wait"
         ret.extend(["",
             f"The waits for {'complete' if is_complete else 'floating tile'} {shanten_string} are completely determined by the waits of"
             f" {' and '.join(wait_strs)}{add_string}."
@@ -199,24 +211,27 @@ def describe_simple_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set
 
         waits |= simple_waits | complex_waits
         ret.extend(describe_extensions(waits, extensions, []))
-        extended_waits = set(wait for waits, _, _ in extensions for wait in waits)
+        extended_waits = TileSet(wait for waits, _, _ in extensions for wait in waits)
         waits |= extended_waits
 
-    n_waits = lambda h: len(h["simple_waits"] | h["complex_waits"] | set(wait for waits, _, _ in h["extensions"] for wait in waits) - waits)
-    key = lambda h: -(10 * n_waits(h) + len(h["complex_shapes"]))
+    # (hand, its shapes' waits, its extended waits)
+    all_hands = [(h, TileSet(h["simple_waits"]) | h["complex_waits"], TileSet(wait for waits, _, _ in h["extensions"] for wait in waits)) for h in debug_info["simple_hands"]]
+    n_waits = lambda h: len(h[1] | h[2] - waits)
+    key = lambda h: -(10 * n_waits(h) + len(h[0]["complex_shapes"]))
 
-    all_hands = sorted(debug_info["simple_hands"], key=key)
+    all_hands = sorted(all_hands, key=key)
     while len(all_hands) > 0:
-        add_hand(all_hands[0])
+        add_hand(all_hands[0][0])
         all_hands = [hand for hand in sorted(all_hands[1:], key=key) if n_waits(hand) != 0]
+    debug_info["simple_shanten_waits"] = waits # the waits with those of the hands described above
     return ret
 
 def describe_extensions(
-        waits: Set[int],
+        waits: TileSet,
         extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]],
         tanki_extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]],
         shanpon_extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]] = [],
-        shanpon_waits: Set[int] = set()) -> List[str]:
+        shanpon_waits: TileSet = TileSet()) -> List[str]:
     ret = []
     used_sequence = False
     used_adj_sequence = False
@@ -229,14 +244,15 @@ def describe_extensions(
         [(ext, "simple") for ext in extensions] \
       + [(ext, "tanki") for ext in tanki_extensions] \
       + [(ext, "shanpon") for ext in shanpon_extensions]
-    for (new_waits, tile, group), wait_type in all_extensions:
+    for (extended_waits, tile, group), wait_type in all_extensions:
+        new_waits = TileSet(extended_waits)
         # build up a catalog of relative extensions for each tile
         if (tile, wait_type) not in extensions_for_tile:
             extensions_for_tile[(tile, wait_type)] = []
         extensions_for_tile[(tile, wait_type)].append(tuple(t - tile for t in group))
 
         # skip if all the waits of this group are covered
-        if len(new_waits - waits) == 0:
+        if new_waits.issubset(waits):
             continue
 
         # set flags based on kinds of groups we've used
@@ -249,7 +265,7 @@ def describe_extensions(
             used_sequence = True
 
         # actually describe the extension now
-        extend_text.append(f"the {'triplet' if is_triplet else 'sequence'} {ph(sorted_hand(group))} extends the {pt(tile)} wait to {ph(sorted_hand(new_waits))}")
+        extend_text.append(f"the {'triplet' if is_triplet else 'sequence'} {ph(sorted_hand(group))} extends the {pt(tile)} wait to {ph(new_waits.sorted())}")
         waits |= new_waits
 
     if len(extend_text) > 1:
@@ -347,11 +363,11 @@ def describe_extensions(
         elif left_sequence and is_shanpon:
             other_waits = shanpon_waits - {wait}
             other_pairs = [tile for wait in other_waits for tile in [wait, wait]]
-            named_shape_text.append(f"This extended shanpon shape {pg(wait, (-2,-1,0,0,0))}{ph(other_pairs)} is often called **entotsu**, waiting on {pg(wait, (-3,0))}{ph(other_waits)}.")
+            named_shape_text.append(f"This extended shanpon shape {pg(wait, (-2,-1,0,0,0))}{ph(other_pairs)} is often called **entotsu**, waiting on {pg(wait, (-3,0))}{ph(other_waits.sorted())}.")
         elif right_sequence and is_shanpon:
             other_waits = shanpon_waits - {wait}
             other_pairs = [tile for wait in other_waits for tile in [wait, wait]]
-            named_shape_text.append(f"This extended shanpon shape {ph(other_pairs)}{pg(wait, (0,0,0,1,2))} is often called **entotsu**, waiting on {ph(other_waits)}{pg(wait, (0,3))}.")
+            named_shape_text.append(f"This extended shanpon shape {ph(other_pairs)}{pg(wait, (0,0,0,1,2))} is often called **entotsu**, waiting on {ph(other_waits.sorted())}{pg(wait, (0,3))}.")
 
     if len(named_shape_text) > 0:
         named_shape_text[0] = "Note that t" + named_shape_text[0][1:]
@@ -379,11 +395,11 @@ def describe_extensions(
 
     return ret
 
-def describe_headless_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set[int]) -> List[str]:
+def describe_headless_shanten(shanten: int, debug_info: Dict[str, Any], waits: TileSet) -> List[str]:
     simple_shapes = debug_info["headless_taatsus"]
     floating_tiles = debug_info["headless_floating_tiles"]
-    headless_tanki_waits = debug_info["headless_tanki_waits"]
-    headless_taatsu_waits = debug_info["headless_taatsu_waits"]
+    headless_tanki_waits = TileSet(debug_info["headless_tanki_waits"])
+    headless_taatsu_waits = TileSet(debug_info["headless_taatsu_waits"])
     extensions = debug_info["headless_tanki_extensions"]
     shanten_string = SHANTEN_STRINGS[shanten]
     shape_str = get_shape_str(shanten+1, simple_shapes, (), None, shanten+1, floating_tiles)
@@ -408,11 +424,11 @@ def describe_headless_shanten(shanten: int, debug_info: Dict[str, Any], waits: S
     else:
         return []
 
-    add_string = "" if len(waits) == 0 else f" adding {ph(sorted_hand((headless_tanki_waits | headless_taatsu_waits) - waits))} to the wait."
+    add_string = "" if len(waits) == 0 else f" adding {ph(((headless_tanki_waits | headless_taatsu_waits) - waits).sorted())} to the wait."
     ret.extend(["",
         f"The waits for {'broken headless' if is_broken else 'headless'} {shanten_string}"
-        f" are tanki waits on {'the floating tiles' if is_broken else 'each tile'}: {ph(sorted_hand(headless_tanki_waits))}"
-        f" as well as the simple shape waits themselves: {ph(sorted_hand(headless_taatsu_waits))}{add_string}."
+        f" are tanki waits on {'the floating tiles' if is_broken else 'each tile'}: {ph(headless_tanki_waits.sorted())}"
+        f" as well as the simple shape waits themselves: {ph(headless_taatsu_waits.sorted())}{add_string}."
     ])
 
     ret.extend(describe_extensions(waits | headless_tanki_waits | headless_taatsu_waits, [], extensions))
@@ -422,9 +438,9 @@ def describe_headless_shanten(shanten: int, debug_info: Dict[str, Any], waits: S
 def describe_kuttsuki_shanten(shanten: int, debug_info: Dict[str, Any]) -> List[str]:
     floating_tiles = debug_info["kuttsuki_tiles"]
     kuttsuki_taatsus = debug_info["kuttsuki_taatsus"]
-    kuttsuki_taatsu_waits = debug_info["kuttsuki_taatsu_waits"]
-    kuttsuki_tanki_waits = debug_info["kuttsuki_tanki_waits"]
-    kuttsuki_pair_tiles = debug_info["kuttsuki_pair_tiles"]
+    kuttsuki_taatsu_waits = TileSet(debug_info["kuttsuki_taatsu_waits"])
+    kuttsuki_tanki_waits = TileSet(debug_info["kuttsuki_tanki_waits"])
+    kuttsuki_pair_tiles = TileSet(debug_info["kuttsuki_pair_tiles"])
     pairs = tuple((tile, tile) for tile in kuttsuki_pair_tiles)
     pair = pairs[0] if len(pairs) > 0 else None
     shanten_string = SHANTEN_STRINGS[shanten]
@@ -434,20 +450,20 @@ def describe_kuttsuki_shanten(shanten: int, debug_info: Dict[str, Any]) -> List[
 
     ps = "s" if len(kuttsuki_pair_tiles) != 1 else ""
     ss = "s" if len(kuttsuki_taatsus) != 1 else ""
-    pair_string = "" if len(kuttsuki_pair_tiles) == 0 else f"pair{ps} {ph(sorted_hand(kuttsuki_pair_tiles))}"
-    taatsu_string = "" if len(kuttsuki_taatsus) == 0 else f"simple shape{ss} {ph(sorted_hand(kuttsuki_taatsu_waits))}"
+    pair_string = "" if len(kuttsuki_pair_tiles) == 0 else f"pair{ps} {ph(kuttsuki_pair_tiles.sorted())}"
+    taatsu_string = "" if len(kuttsuki_taatsus) == 0 else f"simple shape{ss} {ph(kuttsuki_taatsu_waits.sorted())}"
     extra_wait_str = " and ".join(s for s in [pair_string, taatsu_string] if s != "")
     if extra_wait_str != "":
         extra_wait_str = ", as well as the waits of its " + extra_wait_str
     ret.extend(["",
         f"The waits for sticky {shanten_string} are the tiles 0-2 away from each floating tile,"
-        f" which altogether are {ph(sorted_hand(kuttsuki_tanki_waits))}" + extra_wait_str + "."
+        f" which altogether are {ph(kuttsuki_tanki_waits.sorted())}" + extra_wait_str + "."
     ])
 
     return ret
 
-def describe_chiitoitsu_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set[int]) -> List[str]:
-    chiitoitsu_waits = set(debug_info["chiitoitsu_waits"])
+def describe_chiitoitsu_shanten(shanten: int, debug_info: Dict[str, Any], waits: TileSet) -> List[str]:
+    chiitoitsu_waits = TileSet(debug_info["chiitoitsu_waits"])
     shanten_string = SHANTEN_STRINGS[shanten]
     num_pairs = {1: "five", 2: "four", 3: "three"}[shanten]
     if len(waits) == 0:
@@ -455,33 +471,33 @@ def describe_chiitoitsu_shanten(shanten: int, debug_info: Dict[str, Any], waits:
             f"Due to having {num_pairs} pairs,"
             f" this hand is best described as **chiitoitsu {shanten_string}**.\n\n"
             f"The waits for chiitoitsu {shanten_string} are tanki waits"
-            f" on the unpaired tiles {ph(sorted_hand(chiitoitsu_waits))}."
+            f" on the unpaired tiles {ph(chiitoitsu_waits.sorted())}."
         ]
     elif not chiitoitsu_waits.issubset(waits):
         return ["",
             f"Having {num_pairs} pairs, this hand is also **chiitoitsu {shanten_string}**.\n\n"
             f"The waits for chiitoitsu {shanten_string} are tanki waits"
-            f" on the unpaired tiles {ph(sorted_hand(chiitoitsu_waits))},"
-            f" adding {ph(sorted_hand(chiitoitsu_waits - waits))} to the wait."
+            f" on the unpaired tiles {ph(chiitoitsu_waits.sorted())},"
+            f" adding {ph((chiitoitsu_waits - waits).sorted())} to the wait."
         ]
     else:
         return []
 
-def describe_kokushi_shanten(shanten: int, debug_info: Dict[str, Any], waits: Set[int]) -> List[str]:
-    kokushi_waits = set(debug_info["kokushi_waits"])
+def describe_kokushi_shanten(shanten: int, debug_info: Dict[str, Any], waits: TileSet) -> List[str]:
+    kokushi_waits = TileSet(debug_info["kokushi_waits"])
     shanten_string = SHANTEN_STRINGS[shanten]
     num_pairs = {1: 11, 2: 10, 3: 9}[shanten]
     if len(kokushi_waits) == 2:
         return [
             f"Due to having {num_pairs} terminal/honor tiles with a terminal/honor pair,"
             f" this hand is best described as **kokushi {shanten_string}**.\n\n"
-            f"The waits for kokushi {shanten_string} are the remaining terminal/honors {ph(sorted_hand(kokushi_waits))}."
+            f"The waits for kokushi {shanten_string} are the remaining terminal/honors {ph(kokushi_waits.sorted())}."
         ]
     else:
         return ["",
             f"Due to having {num_pairs+1} terminal/honor tiles with no pair,"
             f" this hand is best described as **13-sided kokushi {shanten_string}**.\n\n"
-            f"The waits for 13-sided kokushi {shanten_string} are any terminal/honor tile {ph(sorted_hand(kokushi_waits))}."
+            f"The waits for 13-sided kokushi {shanten_string} are any terminal/honor tile {ph(kokushi_waits.sorted())}."
         ]
 
 def describe_tanki_iishanten(debug_info: Dict[str, Any]) -> List[str]:
@@ -489,15 +505,15 @@ def describe_tanki_iishanten(debug_info: Dict[str, Any]) -> List[str]:
     return [
         f"Since this hand is basically tenpai with a tanki wait, but all four tiles of that tanki wait are in your hand,"
         f" this hand is best described as **tanki iishanten**.\n\n"
-        f"The waits for tanki iishanten include everything but that tanki tile: {ph(sorted_hand(tanki_iishanten_waits))}."
+        f"The waits for tanki iishanten include everything but that tanki tile: {ph(tanki_iishanten_waits.sorted())}."
     ]
 
-def describe_ankan(debug_info: Dict[str, Any], waits: Set[int]) -> List[str]:
+def describe_ankan(debug_info: Dict[str, Any], waits: TileSet) -> List[str]:
     ankan_tiles = debug_info["ankan_tiles"]
     if len(ankan_tiles & waits) > 0:
         return [
             f"Since all four tiles are in hand,"
-            f" we cannot consider {ph(sorted_hand(ankan_tiles))} as part of the wait."
+            f" we cannot consider {ph(ankan_tiles.sorted())} as part of the wait."
         ]
     else:
         return []
@@ -513,8 +529,8 @@ def describe_tenpai(debug_info: Dict[str, Any]) -> List[str]:
         return try_remove_all_tiles(hand, (pair_tile, pair_tile))
     taatsu_hands = [hand for hand in groupless_removed if len(hand) == 4 if set(Counter(hand).values()) in [{1, 2}, {1, 3}] if get_taatsu_wait(remove_pair(hand)) != set()]
     shanpon_hands = [hand for hand in groupless_removed if len(hand) == 4 if set(Counter(hand).values()) == {2}]
-    orig_waits: Set[int] = set()
-    waits: Set[int] = set()
+    orig_waits = TileSet()
+    waits = TileSet()
     extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]] = []
     tanki_extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]] = []
     shanpon_extensions: List[Tuple[Set[int], int, Tuple[int, int, int]]] = []
@@ -530,28 +546,29 @@ def describe_tenpai(debug_info: Dict[str, Any]) -> List[str]:
         s = "s" if len(tanki_hands) != 1 else ""
         ret.extend(["", f"The waits for this hand include the tanki wait{s} {ph(tanki_tiles)}."])
         # look for extensions
-        waits |= set(tanki_tiles)
-        orig_waits |= set(tanki_tiles)
+        waits |= TileSet(tanki_tiles)
+        orig_waits |= TileSet(tanki_tiles)
         for tanki_hand in tanki_hands:
             groups = try_remove_all_tiles(hand, tanki_hand)
             new_extensions = calculate_tanki_wait_extensions(groups, set(tanki_hand))
             tanki_extensions.extend(new_extensions)
-            waits |= set().union(wait for waits, _, _ in new_extensions for wait in waits)
+            waits |= TileSet(wait for waits, _, _ in new_extensions for wait in waits)
 
     taatsus_used: Set[Tuple[int, ...]] = set()
     if len(taatsu_hands) > 0:
         # look for extensions
         # taatsus_used = [(taatsu, waits)]
-        taatsu_extensions: List[Tuple[Tuple[int, ...], Set[int], Set[int], List[Tuple[Set[int], int, Tuple[int, int, int]]]]] = []
+        taatsu_extensions: List[Tuple[Tuple[int, ...], TileSet, TileSet, List[Tuple[Set[int], int, Tuple[int, int, int]]]]] = []
         for taatsu_hand in taatsu_hands:
             groups = try_remove_all_tiles(hand, taatsu_hand)
             taatsu = remove_pair(taatsu_hand)
-            new_waits = get_taatsu_wait(taatsu)
-            new_extensions = calculate_wait_extensions(groups, new_waits)
-            extended_waits = new_waits.union(wait for waits, _, _ in new_extensions for wait in waits)
+            taatsu_wait = get_taatsu_wait(taatsu)
+            new_extensions = calculate_wait_extensions(groups, taatsu_wait)
+            new_waits = TileSet(taatsu_wait)
+            extended_waits = new_waits | TileSet(wait for waits, _, _ in new_extensions for wait in waits)
             if not (new_waits | extended_waits).issubset(waits):
                 taatsu_extensions.append((taatsu, new_waits, extended_waits, new_extensions))
-        taatsu_waits: Set[int] = set()
+        taatsu_waits = TileSet()
         def add_taatsu_extension(taatsu, new_waits, extended_waits, new_extensions):
             nonlocal waits
             nonlocal taatsus_used
@@ -562,7 +579,7 @@ def describe_tenpai(debug_info: Dict[str, Any]) -> List[str]:
             waits |= new_waits
             extensions.extend(new_extensions)
 
-        n_waits = lambda h: len((h[1] | h[2]) - waits)
+        n_waits = lambda h: (h[1] | h[2]).count_new(waits)
         key = lambda h: -(10 * n_waits(h) + len(h[1]))
         taatsu_extensions = sorted(taatsu_extensions, key=key)
         while len(taatsu_extensions) > 0:
@@ -574,17 +591,17 @@ def describe_tenpai(debug_info: Dict[str, Any]) -> List[str]:
             also = "also " if len(tanki_hands) > 0 else ""
             ret.extend(["",
                 f"This hand {also}has the simple shape{s} {' '.join(ph(sorted_hand(taatsu)) for taatsu in sorted(taatsus_used))},"
-                f" adding {ph(sorted_hand(taatsu_waits - orig_waits))} to the wait."])
+                f" adding {ph((taatsu_waits - orig_waits).sorted())} to the wait."])
             orig_waits |= taatsu_waits
 
-    shanpon_waits: Set[int] = set()
+    shanpon_waits = TileSet()
     if len(shanpon_hands) > 0:
-        shanpon_waits = set(tile for hand in shanpon_hands for tile in hand)
+        shanpon_waits = TileSet(tile for hand in shanpon_hands for tile in hand)
         if not shanpon_waits.issubset(waits):
             also = "also " if len(tanki_hands) > 0 or len(taatsus_used) > 0 else ""
             ret.extend(["",
                 f"This hand {also}has the shanpon {' '.join(ph((wait, wait)) for wait in shanpon_waits)},"
-                f" adding {ph(sorted_hand(shanpon_waits - waits))} to the wait."])
+                f" adding {ph((shanpon_waits - waits).sorted())} to the wait."])
             for shanpon_hand in shanpon_hands:
                 groups = try_remove_all_tiles(hand, shanpon_hand)
                 new_extensions = calculate_wait_extensions(groups, set(shanpon_hand))
@@ -605,6 +622,21 @@ def describe_shanten(debug_info: Dict[str, Any]) -> List[str]:
     else:
         return [f"This hand is {shanten}-shanten."]
 
+def describe_discards(hand: Tuple[int, ...]) -> List[str]:
+    discards = shanten_table.discards(hand)
+    shanten_name = lambda shanten: "tenpai" if shanten == 0 else SHANTEN_STRINGS.get(shanten, f"{shanten}-shanten")
+    ret = [f"Hand: {ph(hand)}", ""]
+    if shanten_table.shanten(hand) == -1:
+        ret.extend(["This hand is already complete.", ""])
+    ret.append("Discards, best first (by shanten, then by how many tiles are left that improve the hand):")
+    _, best_shanten, _, best_ukeire = discards[0]
+    for discard, shanten, waits, ukeire in discards:
+        wait_str = f"waiting on {ph(TileSet(waits).sorted())} ({ukeire} tile{'s' if ukeire != 1 else ''})" if len(waits) > 0 else "no tiles improve it"
+        line = f"{pt(discard)}: {shanten_name(shanten)}, {wait_str}"
+        ret.append(f"**{line}**" if (shanten, ukeire) == (best_shanten, best_ukeire) else line)
+    ret.extend(["", "This only considers standard hands. Analyze the hand after a discard to see chiitoitsu, kokushi musou and how its waits work."])
+    return ret
+
 def assert_analyze_hand(hand: str, expected_waits: str, print_anyways: bool = False, mentions: str = ""):
     ret, waits = _analyze_hand(translate_hand(hand))
     expected_wait_set = set(translate_hand(expected_waits))
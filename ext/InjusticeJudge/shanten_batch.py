@@ -0,0 +1,159 @@
+"""
+Standard shanten and waits for many hands at once, given as an N x 34 array
+of tile counts (1-9m, 1-9p, 1-9s, 1-7z). With NumPy, every hand's suit rows
+are looked up in `shanten_table` at once and combined column by column, so
+this handles tens of thousands of hands per second (e.g. to get efficiency
+stats over whole games). Without NumPy it falls back to one hand at a time.
+
+Run this file to cross-check it against `ShantenTable` and `_analyze_hand`.
+"""
+
+from typing import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .shanten_table import MAX_GROUPS, NONE, POWERS, ROW_SIZE, SUIT_ENTRIES, ShantenTable, entries, pair_shanten, reference_row, shanten_table
+
+TILES_34 = [10 * (i // 9 + 1) + i % 9 + 1 for i in range(34)]
+SUIT_COLUMNS = [(0, 9), (9, 18), (18, 27), (27, 34)]
+
+# for each row entry (pairs * 5 + groups), the entries of two rows that add up to it
+COMBINATIONS: List[Tuple[List[int], List[int]]] = []
+for k in range(ROW_SIZE):
+    pairs, groups = divmod(k, 5)
+    splits = [(p * 5 + g, (pairs - p) * 5 + groups - g) for p in range(pairs + 1) for g in range(groups + 1)]
+    COMBINATIONS.append(([k1 for k1, _ in splits], [k2 for _, k2 in splits]))
+
+def hands_to_counts(hands: Iterable[Iterable[int]]) -> List[List[int]]:
+    """Hands of tile ints (red fives as fives) -> lists of 34 counts"""
+    position = {tile: i for i, tile in enumerate(TILES_34)}
+    position.update({51: 4, 52: 13, 53: 22})
+    counts = []
+    for hand in hands:
+        hand_counts = [0] * 34
+        for tile in hand:
+            hand_counts[position[tile]] += 1
+        counts.append(hand_counts)
+    return counts
+
+def _combine(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """`shanten_table.combine` over the last axis, with -1 for NONE"""
+    combined = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=np.int16)
+    for k, (k1, k2) in enumerate(COMBINATIONS):
+        x, y = a[..., k1], b[..., k2]
+        combined[..., k] = np.where((x >= 0) & (y >= 0), np.minimum(x + y, MAX_GROUPS), -1).max(axis=-1)
+    return combined
+
+def _row_shanten(rows: "np.ndarray", groups_needed: "np.ndarray") -> "np.ndarray":
+    """`shanten_table.row_shanten` over the last axis"""
+    pairs, groups = np.divmod(np.arange(ROW_SIZE), 5)
+    missing = groups_needed[..., None] - groups
+    shanten = 2 * missing - np.minimum(rows, missing) - pairs
+    return np.where((rows >= 0) & (missing >= 0), shanten, 2 * MAX_GROUPS).min(axis=-1)
+
+def _batch_numpy(counts: "np.ndarray", table: ShantenTable) -> Tuple["np.ndarray", "np.ndarray"]:
+    rows_table = np.asarray(table.table)
+    powers = np.array(POWERS, dtype=np.int64)
+    groups_needed = counts.sum(axis=1) // 3
+    indices = np.stack([counts[:, start:end] @ powers[:end-start] for start, end in SUIT_COLUMNS], axis=1)
+    indices[:, 3] += SUIT_ENTRIES
+    def lookup(i: "np.ndarray") -> "np.ndarray":
+        rows = rows_table[i].astype(np.int16)
+        rows[rows == NONE] = -1
+        return rows
+    rows = lookup(indices) # (hands, suit, row)
+    shanten = _row_shanten(_combine(_combine(rows[:, 0], rows[:, 1]), _combine(rows[:, 2], rows[:, 3])), groups_needed)
+
+    waits = np.zeros(counts.shape, dtype=bool)
+    for suit, (start, end) in enumerate(SUIT_COLUMNS):
+        others = [rows[:, other] for other in range(4) if other != suit]
+        rest = _combine(_combine(others[0], others[1]), others[2])
+        # one more of each tile in the suit; a fifth copy isn't in the table
+        fifth = counts[:, start:end] >= 4
+        candidates = np.where(fifth, 0, indices[:, suit, None] + powers[:end-start])
+        new_shanten = _row_shanten(_combine(lookup(candidates), rest[:, None, :]), groups_needed[:, None])
+        waits[:, start:end] = (new_shanten < shanten[:, None]) & ~fifth
+        for hand, rank in zip(*np.nonzero(fifth)):
+            suit_counts = counts[hand, start:end].tolist()
+            suit_counts[rank] += 1
+            rest_row = [NONE if value < 0 else value for value in rest[hand].tolist()]
+            waits[hand, start + rank] = pair_shanten(entries(reference_row(tuple(suit_counts), suit == 3)), entries(rest_row), int(groups_needed[hand])) < shanten[hand]
+    return shanten, waits
+
+def _batch_python(counts: Sequence[Sequence[int]], table: ShantenTable) -> Tuple[List[int], List[List[bool]]]:
+    all_shanten, all_waits = [], []
+    for hand_counts in counts:
+        hand = [tile for tile, count in zip(TILES_34, hand_counts) for _ in range(count)]
+        shanten, waits = table.shanten_and_waits(hand)
+        all_shanten.append(shanten)
+        all_waits.append([tile in waits for tile in TILES_34])
+    return all_shanten, all_waits
+
+def batch_shanten_and_waits(counts: Any, table: ShantenTable = shanten_table) -> Tuple[Any, Any]:
+    """
+    Each hand's standard shanten, and a mask over the 34 tiles of the ones that
+    lower it (for hands of 3n+1 tiles: the winning tiles if tenpai). Arrays of
+    shape (N,) and (N, 34) with NumPy, lists without.
+    """
+    if not table.loaded:
+        table.ensure_loaded()
+    if np is None or table.table is None:
+        return _batch_python(counts, table)
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, 34)
+    invalid = (counts > 4).any(axis=1) # more than four of a tile isn't in the table either
+    if not invalid.any():
+        return _batch_numpy(counts, table)
+    shanten, waits = _batch_numpy(np.where(invalid[:, None], 0, counts), table)
+    for hand in np.nonzero(invalid)[0]:
+        [hand_shanten], [hand_waits] = _batch_python([counts[hand].tolist()], table)
+        shanten[hand], waits[hand] = hand_shanten, hand_waits
+    return shanten, waits
+
+if __name__ == "__main__":
+    # cross-check against one hand at a time and against `_analyze_hand`:
+    #   python -m ext.InjusticeJudge.shanten_batch [hands]
+    import random
+    import sys
+    import time
+    from .shanten import _analyze_hand
+
+    random.seed(0)
+    wall = [tile for tile in TILES_34 for _ in range(4)]
+    def random_hand() -> Tuple[int, ...]:
+        # half of them mostly one suit, which are much more often close to tenpai
+        if random.random() < 0.5:
+            return tuple(sorted(random.sample(wall, 13)))
+        suit = random.choice([10, 20, 30])
+        return tuple(sorted(random.sample([tile for tile in wall if tile // 10 * 10 == suit] + random.sample(wall, 8), 13)))
+    hands = [random_hand() for _ in range(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)]
+    counts = hands_to_counts(hands)
+
+    shanten_table.load()
+    start_time = time.perf_counter()
+    shanten, waits = batch_shanten_and_waits(counts)
+    batch_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    python_shanten, python_waits = _batch_python(counts[:2000], shanten_table)
+    python_time = (time.perf_counter() - start_time) * len(hands) / min(len(hands), 2000)
+    print(f"{len(hands)} hands: batch {batch_time:.2f}s ({len(hands)/batch_time:.0f} hands/s),"
+          f" one at a time {python_time:.2f}s ({len(hands)/python_time:.0f} hands/s)")
+    assert shanten[:2000].tolist() == python_shanten, "batch shanten differs from one at a time"
+    assert waits[:2000].tolist() == python_waits, "batch waits differ from one at a time"
+
+    # `_analyze_hand` also counts chiitoitsu/kokushi waits and drops tiles all four of which
+    # are in hand, so compare hands where neither comes up
+    checked, mismatches = 0, []
+    for i, hand in enumerate(hands[:2000]):
+        if shanten[i] > 1 or max(counts[i]) == 4 or len(set(hand)) <= 8 or len({tile for tile in hand if tile > 40 or tile % 10 in {1, 9}}) >= 10:
+            continue
+        lines, analysis_waits = _analyze_hand(hand)
+        batch_waits = {tile for tile, wait in zip(TILES_34, waits[i]) if wait}
+        checked += 1
+        if batch_waits != analysis_waits:
+            mismatches.append((hand, batch_waits, analysis_waits))
+    print(f"{checked - len(mismatches)}/{checked} tenpai/iishanten hands have the same waits as _analyze_hand")
+    for hand, batch_waits, analysis_waits in mismatches[:10]:
+        print(f"  {hand}: batch {sorted(batch_waits)}, _analyze_hand {sorted(analysis_waits)}")
@@ -1,22 +1,27 @@
+import aiohttp
+import json
+import os
 import re
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import logging
+import time
 from io import BytesIO
-from global_stuff import account_manager
+import global_stuff
+from .analysis import INVALID_LINK_MESSAGE, is_majsoul_link, parse_fetched_log, select_players
+from .analysis_service import analysis_pool
+from .game_cache import game_log_cache, parsed_game_cache
 from modules.pymjsoul.proto import liqi_combined_pb2 as proto
+from modules.render.cache import image_cache, image_key
+from modules.render.engine import SCORE_GRAPH_RENDERER, render_engine, score_graph_renderer
 from discord import Colour, Embed, Interaction, Message, ui
 from typing import *
 
 # InjusticeJudge imports
-from google.protobuf.json_format import MessageToDict  # type: ignore[import]
-from modules.InjusticeJudge.injustice_judge.fetch import parse_majsoul, parse_majsoul_link, fetch_riichicity, parse_riichicity, fetch_tenhou, parse_tenhou, parse_tenhou_link, parse_wrapped_bytes
-from modules.InjusticeJudge.injustice_judge.injustices import evaluate_game
+from modules.InjusticeJudge.injustice_judge.fetch import parse_majsoul_link, parse_tenhou_link
 from modules.InjusticeJudge.injustice_judge.classes import GameMetadata
 from modules.InjusticeJudge.injustice_judge.classes2 import Kyoku
 from modules.InjusticeJudge.injustice_judge.constants import YAOCHUUHAI
 from modules.InjusticeJudge.injustice_judge.display import ph, pt, round_name, short_round_name
-from modules.InjusticeJudge.injustice_judge.utils import calc_ko_oya_points, save_cache, to_dora_indicator
+from modules.InjusticeJudge.injustice_judge.utils import calc_ko_oya_points, to_dora_indicator
 
 async def long_followup(interaction: Interaction, chunks: List[str], header: str, view: Optional[ui.View] = None) -> Message:
     """Followup with a long message by breaking it into multiple messages"""
@@ -49,104 +54,222 @@ async def long_followup(interaction: Interaction, chunks: List[str], header: str
         logging.info("Error in long_followup: interaction.channel was None")
     return last_message
 
+class FollowupStats:
+    """How long streamed responses take to show up: first message vs. the whole thing"""
+    def __init__(self):
+        self.responses = 0
+        self.total_first_message = 0.0
+        self.max_first_message = 0.0
+        self.total_time = 0.0
+
+    def record(self, first_message: float, total: float) -> None:
+        self.responses += 1
+        self.total_first_message += first_message
+        self.max_first_message = max(self.max_first_message, first_message)
+        self.total_time += total
+
+    def summary(self) -> List[str]:
+        if self.responses == 0:
+            return ["streamed responses: none yet"]
+        return [f"streamed responses: {self.responses}, avg first message after {1000*self.total_first_message/self.responses:.0f}ms"
+                f" (max {1000*self.max_first_message:.0f}ms), avg complete after {1000*self.total_time/self.responses:.0f}ms"]
+
+followup_stats = FollowupStats()
+
+async def stream_followup(interaction: Interaction, chunks: AsyncIterator[str], header: Callable[[], str],
+                          if_empty: Callable[[], List[str]]) -> Optional[Message]:
+    """
+    Like `long_followup`, but for chunks that are still being computed: each
+    message is sent as soon as it's full, rather than after the last chunk.
+    `header` and `if_empty` are only called once they're needed.
+    """
+    logging.info("Running stream_followup")
+    start_time = time.perf_counter()
+    first_message_time = 0.0
+    green = Colour.from_str("#1EA51E")
+    messages_sent = 0
+    last_message: Optional[Message] = None
+
+    async def send(text: str, more_coming: bool) -> None:
+        nonlocal first_message_time, messages_sent, last_message
+        if messages_sent == 0:
+            content = header()
+            if more_coming and interaction.channel is None:
+                content += "\n**NOTE:** message is cut off! Ronhorn has no access to the channel to post follow-up messages"
+            if interaction.followup is not None:
+                last_message = await interaction.followup.send(content=content, embed=Embed(description=text, colour=green), wait=True)
+            else:
+                logging.info("Error in stream_followup: interaction.followup was None")
+            first_message_time = time.perf_counter() - start_time
+        elif interaction.channel is not None:
+            last_message = await interaction.channel.send(embed=Embed(description=text, colour=green))  # type: ignore[union-attr]
+        messages_sent += 1
+
+    current = ""
+    async for to_add in chunks:
+        to_add += "\n"
+        if len(to_add) + len(current) > 3900:
+            await send(current, more_coming=True)
+            current = to_add
+        else:
+            current += to_add
+    if messages_sent == 0 and current == "":
+        current = "".join(to_add + "\n" for to_add in if_empty())
+    await send(current, more_coming=False)
+
+    total_time = time.perf_counter() - start_time
+    followup_stats.record(first_message_time, total_time)
+    logging.info(f"  first message after {1000*first_message_time:.0f}ms, {messages_sent} messages after {1000*total_time:.0f}ms")
+    return last_message
+
 """
 =====================================================
 Modified InjusticeJudge Functions
 =====================================================
 """
 
+def parsed_game_key(link: str, nickname: Optional[str]) -> Tuple[str, Any, Optional[str]]:
+    """
+    (game identifier, whatever the link says about which player to look at, nickname)
+    e.g. two `/parse`s of the same Mahjong Soul game with different `_a...` suffixes
+    share a log but not necessarily the seat
+    """
+    if is_majsoul_link(link):
+        identifier, ms_account_id, player_seat = parse_majsoul_link(link)
+        return identifier, (ms_account_id, player_seat), nickname
+    identifier, player_seat = parse_link(link)
+    return identifier, player_seat, nickname
+
 async def parse_game_link(link: str, specified_players: Set[int] = set(), nickname: Optional[str]=None) -> Tuple[List[Kyoku], GameMetadata, Set[int]]:
     """
     basically the same as the exposed `parse_game_link()` of the InjusticeJudge,
-    but with the `fetch_majsoul` part substituted out so we can use our own
-    AccountManager (to avoid logging in for each fetch)
+    but with the fetching substituted out for our own cached fetches (which use
+    our own AccountManager for Mahjong Soul, to avoid logging in for each fetch).
+    The parsed game is shared with other commands through `parsed_game_cache`.
+    """
+    async def fetch_and_parse_game() -> Tuple[List[Kyoku], GameMetadata, Optional[int], Optional[int]]:
+        return parse_fetched_log(link, await fetch_game_log(link), nickname)
+    kyokus, parsed_metadata, parsed_player_seat, player = await parsed_game_cache.get(parsed_game_key(link, nickname), fetch_and_parse_game)
+    return kyokus, parsed_metadata, select_players(parsed_metadata, parsed_player_seat, player, specified_players)
+
+async def analyze_game(link: str, specified_players: Set[int] = set(), look_for: Set[str] = {"injustice"}, nickname: Optional[str] = None) -> AsyncIterator[Tuple[Set[int], List[str]]]:
+    """
+    Same analyze_game as fetch.py, but yields (specified_players, results) one
+    kyoku at a time, as soon as each kyoku is evaluated.
+    Parsing and evaluation run in `analysis_pool`'s worker processes.
+    """
+    fetched_log = await fetch_worker_log(link)
+    async for players, results in analysis_pool.stream(link, fetched_log, specified_players, look_for, nickname):
+        yield players, results
+
+def game_log_key(link: str) -> str:
+    """Name of the log for `link` in `game_log_cache`"""
+    if is_majsoul_link(link):
+        return f"game-{parse_majsoul_link(link)[0]}.log"
+    elif "tenhou.net/" in link:
+        return f"game-{parse_tenhou_link(link)[0]}.json"
+    return f"game-{link}.json"
+
+async def fetch_game_log(link: str) -> Any:
+    """
+    Fetch the log for `link` through `game_log_cache`: a `ResGameRecord` for
+    Mahjong Soul, the decoded JSON response for tenhou.net and Riichi City.
     """
     if "tenhou.net/" in link:
-        logging.info("  fetching tenhou log")
-        tenhou_log, metadata, player = fetch_tenhou(link)
-        logging.info("  tenhou log fetched")
-        if metadata["name"][3] == "":
-            assert player != 3 or all(p != 3 for p in specified_players), "Can't specify North player in a sanma game"
-        kyokus, parsed_metadata, parsed_player_seat = parse_tenhou(tenhou_log, metadata, nickname)
-        logging.info("  tenhou log parsed")
-    elif "mahjongsoul" in link or "maj-soul" in link or "majsoul" in link:
-        # EN: `mahjongsoul.game.yo-star.com`; CN: `maj-soul.com`; JP: `mahjongsoul.com`
-        # Old CN (?): http://majsoul.union-game.com/0/?paipu=190303-335e8b25-7f5c-4bd1-9ac0-249a68529e8d_a93025901
-        logging.info("  fetching majsoul log")
-        majsoul_log, metadata, player = await fetch_majsoul(link)
-        logging.info("  majsoul log fetched")
-        if len(metadata["accounts"]) == 3:
-            assert player != 3 or all(p != 3 for p in specified_players), "Can't specify North player in a sanma game"
-        kyokus, parsed_metadata, parsed_player_seat = parse_majsoul(majsoul_log, metadata, nickname)
-        logging.info("  majsoul log parsed")
+        return await fetch_tenhou_log(link)
+    elif is_majsoul_link(link):
+        return await fetch_majsoul_record(link)
     elif len(link) == 20: # riichi city log id
-        logging.info("  fetching riichicity log")
-        riichicity_log, metadata, player = await fetch_riichicity(link)
-        logging.info("  riichicity log fetched")
-        kyokus, parsed_metadata, parsed_player_seat = parse_riichicity(riichicity_log, metadata, nickname)
-        logging.info("  riichicity log parsed")
-    else:
-        raise Exception("expected tenhou link similar to `tenhou.net/0/?log=`"
-                        " or mahjong soul link similar to `mahjongsoul.game.yo-star.com/?paipu=`"
-                        " or 20-character riichi city log id like `cjc3unuai08d9qvmstjg`")
-    kyokus[-1].is_final_round = True
-    if len(specified_players) == 0:
-        if parsed_player_seat is not None:
-            specified_players = {parsed_player_seat}
-        elif player is not None:
-            specified_players = {player}
-        else:
-            specified_players = {0}
-    return kyokus, parsed_metadata, specified_players
+        return await fetch_riichicity_log(link)
+    raise Exception(INVALID_LINK_MESSAGE)
 
-async def analyze_game(link: str, specified_players: Set[int] = set(), look_for: Set[str] = {"injustice"}, nickname: Optional[str] = None) -> Tuple[List[str], Set[int]]:
-    """Same analyze_game as fetch.py, but returns specified_players"""
-    try:
-        kyokus, game_metadata, specified_players = await parse_game_link(link, specified_players, nickname)
-        logging.info(f"  game link parsed (players: {specified_players})")
-        return [result for kyoku in kyokus for result in evaluate_game(kyoku, specified_players, game_metadata.name, look_for)], specified_players
-    except Exception as e:
-        kyokus, game_metadata, specified_players = await parse_game_link(link, specified_players - {3}, nickname)
-        logging.info("  game link parsed (sanma)")
-        return [result for kyoku in kyokus for result in evaluate_game(kyoku, specified_players, game_metadata.name, look_for)], specified_players
-
-async def fetch_majsoul(link: str):
+async def fetch_worker_log(link: str) -> Any:
+    """`fetch_game_log`, but in the form `analysis_pool` sends to its workers"""
+    fetched_log = await fetch_game_log(link)
+    return fetched_log.SerializeToString() if is_majsoul_link(link) else fetched_log
+
+async def fetch_majsoul_record(link: str):
     """
     NOTE:
-    basically the same as InjusticeJudge's `fetch_majsoul()`, with 1 difference;
+    replaces the fetching part of InjusticeJudge's `fetch_majsoul()`;
     Instead of logging in for each fetch, just fetch through the already logged-in
-    AccountManager.
+    AccountManager. Returns the `ResGameRecord`.
     """
-    identifier, ms_account_id, player_seat = parse_majsoul_link(link)
-    
-    try:
-        f = open(f"cached_games/game-{identifier}.log", 'rb')
+    identifier, _, _ = parse_majsoul_link(link)
+
+    def decode(data: bytes):
         record = proto.ResGameRecord()  # type: ignore[attr-defined]
-        record.ParseFromString(f.read())
-    except Exception:
+        record.ParseFromString(data)
+        return record
+    async def fetch() -> bytes:
+        # looked up now rather than imported, since scripts like `batch_analysis.py`
+        # import this module before logging in
+        account_manager = global_stuff.account_manager
         assert account_manager is not None
         record = await account_manager.call(
             "fetchGameRecord",
             game_uuid=identifier,
             client_version_string=account_manager.client_version_string)
-        save_cache(filename=f"game-{identifier}.log", data=record.SerializeToString())
+        return record.SerializeToString()
+    return await game_log_cache.get(game_log_key(link), decode, fetch)
 
-    parsed = parse_wrapped_bytes(record.data)[1]
-    if parsed.actions != []:  # type: ignore[attr-defined]
-        actions = [parse_wrapped_bytes(action.result) for action in parsed.actions if len(action.result) > 0]  # type: ignore[attr-defined]
-    else:
-        actions = [parse_wrapped_bytes(record) for record in parsed.records]  # type: ignore[attr-defined]
-    
-    player = None
-    if player_seat is not None:
-        player = player_seat
-    elif ms_account_id is not None:
-        for acc in record.head.accounts:
-            if acc.account_id == ms_account_id:
-                player = acc.seat
-                break
-
-    return actions, MessageToDict(record.head), player
+# shared by all tenhou.net and Riichi City fetches; created on first use,
+# since it has to be created inside the event loop
+http_session: Optional[aiohttp.ClientSession] = None
+FETCHES_PER_HOST = int(os.getenv("log_fetches_per_host", 4))
+TENHOU_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+
+def get_http_session() -> aiohttp.ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=FETCHES_PER_HOST),
+            timeout=aiohttp.ClientTimeout(total=30))
+    return http_session
+
+async def close_http_session() -> None:
+    """Called when the cog is unloaded (including on shutdown)"""
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+
+async def fetch_tenhou_log(link: str) -> Dict[str, Any]:
+    """
+    NOTE:
+    replaces the fetching part of InjusticeJudge's `fetch_tenhou()`, which blocks
+    the event loop. Shares the `game-{identifier}.json` cache files with it.
+    """
+    identifier, _ = parse_tenhou_link(link)
+    async def fetch() -> bytes:
+        async with get_http_session().get(f"https://tenhou.net/5/mjlog2json.cgi?{identifier}",
+                                          headers={"User-Agent": TENHOU_USER_AGENT, "Referer": "https://tenhou.net/"}) as response:
+            response.raise_for_status()
+            return await response.read()
+    return await game_log_cache.get(game_log_key(link), json.loads, fetch)
+
+async def fetch_riichicity_log(identifier: str) -> Dict[str, Any]:
+    """
+    NOTE:
+    replaces the fetching part of InjusticeJudge's `fetch_riichicity()`,
+    authenticating with our `rc_sid` (like `/register_stats`).
+    Shares the `game-{identifier}.json` cache files with it.
+    """
+    async def fetch() -> bytes:
+        SID = os.getenv("rc_sid")
+        assert SID is not None
+        async with get_http_session().post("http://13.112.183.79/record/getRoomData",
+                                           headers={"Cookies": "{\"sid\":\"" + SID + "\"}"},
+                                           skip_auto_headers=["User-Agent", "Accept-Encoding"],
+                                           data="{\"keyValue\":\"" + identifier + "\"}") as response:
+            response.raise_for_status()
+            data = await response.read()
+        # don't cache errors
+        results = json.loads(data)
+        if results["code"] != 0:
+            raise Exception(f"Error {results['code']}: {results['message']}")
+        return data
+    return await game_log_cache.get(game_log_key(identifier), json.loads, fetch)
 
 """
 =====================================================
@@ -298,68 +421,23 @@ async def parse_game(link: str, display_hands: Optional[str]="All winning hands
     return header, ret
 
 async def draw_graph(link: str, display_graph: Optional[str] = None) -> BytesIO:
+    return BytesIO(await draw_graph_bytes(link, display_graph))
+
+async def draw_graph_bytes(link: str, display_graph: Optional[str] = None) -> bytes:
+    # the player in the link doesn't change the graph
+    identifier, _ = parse_link(link)
+    renderer = score_graph_renderer(SCORE_GRAPH_RENDERER)
+    key = image_key(renderer, identifier, display_graph == "Scores with placement bonus")
+    return await image_cache.get(key, lambda: render_graph(link, display_graph, renderer))
+
+async def render_graph(link: str, display_graph: Optional[str], renderer: Callable[..., bytes]) -> bytes:
     kyokus, game_metadata, player = await parse_game_link(link)
-    # setup matplotlib
-    font_path = "fonts/Arial Unicode MS.ttf"
-    fm.fontManager.addfont(font_path)
-    font_prop = fm.FontProperties(fname=font_path)
-    plt.rcParams["font.family"] = font_prop.get_name()
-    plt.rcParams["font.size"] = 24
-    plt.rcParams["text.color"] = "gray"
-    plt.rcParams["xtick.color"] = "gray"
-    plt.rcParams["ytick.color"] = "gray"
-    plt.rcParams["figure.figsize"] = [12.8, 8.4]
-    plt.figure(figsize=(12, 7.5))
-
-    plt.xticks(rotation=45, ha="right")
-    plt.margins(0.02)
-    plt.box(False)
-
-    # collect data
     rounds = [""] + [round_name(kyoku.round, kyoku.honba) for kyoku in kyokus]
     scores = [[kyoku.start_scores[i] for kyoku in kyokus] + [game_metadata.game_score[i]] for i in range(game_metadata.num_players)]
     if display_graph == "Scores with placement bonus":
         scores = list(zip(*(list(game_metadata.rules.apply_placement_bonus(round, score)) for round, score in zip([0] + [kyoku.round for kyoku in kyokus], zip(*scores)))))
-    colors = ["orangered", "gold", "forestgreen", "darkviolet"]
-
-    # calculate offsets for annotations (so numbers don't overlap)
-    min_score = min(score for scores_per_round in scores for score in scores_per_round)
-    max_score = max(score for scores_per_round in scores for score in scores_per_round)
-    min_separation = (max_score - min_score) / 12
-    step_unit = min_separation / 24
-    check_closeness = True
-    gas = 1000
-    yoffsets: List[float] = [0] * game_metadata.num_players
-    while check_closeness and gas >= 0:
-        check_closeness = False
-        gas -= 1
-        final_scores = sorted((scores_per_round[-1], i) for i, scores_per_round in enumerate(scores))
-        for (s1, i1), (s2, i2) in zip(final_scores[:-1], final_scores[1:]):
-            if (s2 + yoffsets[i2]) - (s1 + yoffsets[i1]) < min_separation:
-                check_closeness = True
-                yoffsets[i1] -= step_unit
-                yoffsets[i2] += step_unit
-    # draw the graph
-    plt.grid(linestyle="--", linewidth=1.0)
-    plt.axhline(0, color="gray", linewidth=4.0)
-    for name, score, color, yoffset in zip(game_metadata.name, scores, colors, yoffsets):
-        yoffset *= 100/step_unit
-        plt.plot(rounds, score, label=name, color=color, alpha=0.8, linewidth=8, solid_capstyle="round")
-        # display end score
-        plt.annotate(str(score[-1]), (rounds[-1], score[-1]), textcoords="offset points", xytext=(10,yoffset/plt.rcParams["figure.dpi"]), va="center", color=color)
-        if display_graph == "Scores with placement bonus":
-            # display starting placement bonus, too
-            plt.annotate(str(int(score[0])), (rounds[0], score[0]), textcoords="offset points", xytext=(0,10), va="center", ha="center")
-    plt.legend(loc="upper center", bbox_to_anchor=(0.5, 1.15), framealpha=0, ncol=range(game_metadata.num_players), handlelength=0.04)
-    plt.tight_layout()
-
-    # return as a BytesIO object
-    buf = BytesIO()
-    plt.savefig(buf, format="png", transparent=True)
-    buf.seek(0)
-    plt.cla()
-    plt.clf()
-    return buf
+    return await render_engine.render(renderer, rounds, list(game_metadata.name[:game_metadata.num_players]),
+                                      [list(s) for s in scores], display_graph == "Scores with placement bonus")
 
 def parse_link(link: str) -> Tuple[str, Optional[int]]:
     try:
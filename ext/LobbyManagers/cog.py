@@ -1,6 +1,5 @@
 import asyncio
 import datetime
-import gspread
 import logging
 import discord
 from discord.ext import commands, tasks
@@ -8,16 +7,13 @@ from discord import Interaction
 from typing import *
 
 from modules.mahjongsoul.contest_manager import TournamentLogin, ContestManager
-from global_stuff import assert_getenv, account_manager, registry, raw_scores, registry_lock, raw_scores_lock
+from global_stuff import assert_getenv, account_manager, club_store
 from ..InjusticeJudge.command_view import CommandSuggestionView
+from ..InjusticeJudge.precompute import schedule_precompute
 
 BOT_CHANNEL_ID: int        = int(assert_getenv("bot_channel_id"))
 GUILD_ID: int              = int(assert_getenv("guild_id"))
 
-DISCORD_NAME_COL = 2
-MJS_NICKNAME_COL = 4
-MJS_ACCOUNT_ID_COL = 6
-
 class LobbyManager(commands.Cog):
     """
     There will be multiple instances of this class, one for each lobby.
@@ -81,6 +77,8 @@ class LobbyManager(commands.Cog):
                                          skill_enabled=True)
             message = await self.bot_channel.send(content=resp, suppress_embeds=True, view=view)  # type: ignore[union-attr]
             view.set_message(message)
+            # get the buttons' results ready before anyone clicks them
+            schedule_precompute(link)
         self.games = games
     # ensure bot is ready before poll_games is called
     @poll_games.before_loop
@@ -105,7 +103,7 @@ class LobbyManager(commands.Cog):
         player_scores_rendered.append(f"https://mahjongsoul.game.yo-star.com/?paipu={uuid}")
 
         timestamp = str(datetime.datetime.now()).split(".")[0]
-        raw_scores_row = [timestamp, self.game_type, "no"] # a list of values for a "Raw Scores" row
+        players: List[Tuple[str, int]] = [] # (discord name, raw score) for the "Raw Scores" row
         not_registered = [] # list of unregistered players in game, if any
 
         seat_name = ["East", "South", "West", "North"]
@@ -113,15 +111,13 @@ class LobbyManager(commands.Cog):
             player_account_id, player_nickname = seat_player_dict.get(p.seat, (0, "AI"))
             
             raw_score = p.part_point_1
-            async with registry_lock:
-                assert registry is not None
-                found_cell: gspread.cell.Cell = registry.find(str(player_account_id), in_column=MJS_ACCOUNT_ID_COL)
-                if found_cell is not None:
-                    discord_name = registry.cell(found_cell.row, DISCORD_NAME_COL).value
-                    raw_scores_row.extend((discord_name, raw_score))
-                else: # The player was not registered?
-                    not_registered.append(player_nickname)
-                    raw_scores_row.extend(("Unregistered player", raw_score))
+            assert club_store is not None
+            discord_name = await club_store.find_member_by_majsoul_id(player_account_id)
+            if discord_name is not None:
+                players.append((discord_name, raw_score))
+            else: # The player was not registered?
+                not_registered.append(player_nickname)
+                players.append(("Unregistered player", raw_score))
             
             player_scores_rendered.append(
                 f"{player_nickname} ({seat_name[p.seat]}): {p.part_point_1} ({(p.total_point/1000):+})")
@@ -129,9 +125,8 @@ class LobbyManager(commands.Cog):
         for player_nickname in not_registered:
             player_scores_rendered.append(f"*WARNING*: Mahjong Soul player `{player_nickname}` is not registered!")
 
-        async with raw_scores_lock:
-            assert raw_scores is not None
-            raw_scores.append_row(raw_scores_row)
+        # the sheet is updated in the background
+        await club_store.add_raw_scores(timestamp, self.game_type, "no", players, game_uuid=uuid)
 
         return '\n'.join(player_scores_rendered)
     
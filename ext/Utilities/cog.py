@@ -2,23 +2,23 @@ import asyncio
 import datetime
 import time
 import discord
-import gspread
 import logging
 import requests
 import urllib3
 import os
 import json
-import matplotlib.pyplot as plt
-from matplotlib.cbook import get_sample_data
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from io import BytesIO
 from discord.ext import commands
 from discord import app_commands, Colour, Embed, Interaction, VoiceChannel
 from typing import *
 from ext.LobbyManagers.cog import LobbyManager
 from .display_hand import replace_text
-from global_stuff import account_manager, assert_getenv, registry, raw_scores, registry_lock, raw_scores_lock
+from .leaderboard import Leaderboard
+from global_stuff import account_manager, assert_getenv, club_store, registry_lock
+from modules.clubdb.store import MAJSOUL_STATS, RIICHICITY, TENHOU
 from modules.InjusticeJudge.injustice_judge.fetch import parse_majsoul_link
+from modules.render.cache import image_cache, image_key
+from modules.render.engine import render_engine
 from .rules import all_rules, construct_detail_rule
 
 GUILD_ID: int                 = int(assert_getenv("guild_id"))
@@ -42,10 +42,6 @@ ST_NAME: str                  = assert_getenv("st_name")
 REGISTRY_NAME_LENGTH: int     = int(assert_getenv("max_name_len"))
 VOICE_CHANNEL_ID: int         = int(assert_getenv("voice_channel_id"))
 
-DISCORD_NAME_COL: int         = 2
-MJS_NICKNAME_COL: int         = 4
-MJS_ACCOUNT_ID_COL: int       = 6
-
 class LonghornRiichiUtilities(commands.Cog):
     """
     Utility commands specific to Longhorn Riichi
@@ -53,6 +49,19 @@ class LonghornRiichiUtilities(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.player_registry_lock = asyncio.Lock()
         self.bot = bot
+        self.leaderboard = Leaderboard({lobby: all_rules[lobby]["uma"] for lobby in [YH_NAME, YT_NAME, SH_NAME, ST_NAME]})
+
+    async def cog_load(self):
+        assert club_store is not None
+        start_time = time.perf_counter()
+        games = await club_store.get_raw_scores()
+        self.leaderboard.load(games)
+        club_store.raw_score_listeners.append(self.leaderboard.add_game)
+        logging.info(f"Loaded leaderboard from {len(games)} games in {1000*(time.perf_counter() - start_time):.0f}ms")
+
+    async def cog_unload(self):
+        assert club_store is not None
+        club_store.raw_score_listeners.remove(self.leaderboard.add_game)
 
     """
     =====================================================
@@ -105,6 +114,7 @@ class LonghornRiichiUtilities(commands.Cog):
             "### Information:",
             "- `/info`: Look up a player's club info (e.g. Mahjong Soul ID).",
             "- `/stats`: Look up a player's club stats (e.g. leaderboard placement).",
+            "- `/leaderboard`: Show the club leaderboard for a game type, and where you're ranked on it.",
             "- `/parse`: Display a summary of the provided game log link. Has an option to display winning and starting hands.",
             "- `/nodocchi`: Get a Nodocchi link for a given tenhou.net username.",
             "- `/amae_koromo`: Get an Amae-Koromo link for a given Mahjong Soul username.",
@@ -168,7 +178,7 @@ class LonghornRiichiUtilities(commands.Cog):
     @app_commands.command(name="terminate_own_game", description=f"Terminate the game you are currently in.")
     async def terminate_own_game(self, interaction: Interaction):
         await interaction.response.defer()
-        nickname = self.get_member_mjs_nickname(interaction.user.name)
+        nickname = await self.get_member_mjs_nickname(interaction.user.name)
         await interaction.followup.send(content=self.try_all_lobbies("terminate_game", nickname))
     
     @app_commands.command(name="pause_any_game", description=f"Pause the game of the specified player. Only usable by @{OFFICER_ROLE}.")
@@ -181,7 +191,7 @@ class LonghornRiichiUtilities(commands.Cog):
     @app_commands.command(name="pause_own_game", description=f"Pause the game you are currently in.")
     async def pause_own_game(self, interaction: Interaction):
         await interaction.response.defer()
-        nickname = self.get_member_mjs_nickname(interaction.user.name)
+        nickname = await self.get_member_mjs_nickname(interaction.user.name)
         await interaction.followup.send(content=self.try_all_lobbies("pause_game", nickname))
     
     @app_commands.command(name="unpause_any_game", description=f"Unpause the paused game of the specified player. Only usable by @{OFFICER_ROLE}.")
@@ -194,7 +204,7 @@ class LonghornRiichiUtilities(commands.Cog):
     @app_commands.command(name="unpause_own_game", description=f"Unpause the paused game you were in.")
     async def unpause_own_game(self, interaction: Interaction):
         await interaction.response.defer()
-        nickname = self.get_member_mjs_nickname(interaction.user.name)
+        nickname = await self.get_member_mjs_nickname(interaction.user.name)
         await interaction.followup.send(content=self.try_all_lobbies("unpause_game", nickname))
         
     # @app_commands.command(name="test_command", description=f"Test command")
@@ -209,18 +219,17 @@ class LonghornRiichiUtilities(commands.Cog):
             discord_name += "#" + discriminator
         return discord_name
 
-    def get_member_mjs_nickname(self, discord_name: str) -> Optional[str]:
-        assert registry is not None
-        found_cell: gspread.cell.Cell = registry.find(discord_name, in_column=DISCORD_NAME_COL)
-        if found_cell is None:
+    async def get_member_mjs_nickname(self, discord_name: str) -> Optional[str]:
+        assert club_store is not None
+        member = await club_store.get_member(discord_name)
+        if member is None:
             # No player with given Discord name found; returning None
             return None
-        
-        return registry.cell(found_cell.row, MJS_NICKNAME_COL).value
+        return member["ms_nickname"]
 
     async def _register(self, name: str, server_member: discord.Member, friend_id: Optional[int]) -> str:
         """
-        Add player to the registry, removing any existing registration first.
+        Add player to the registry, replacing any existing registration.
         Assumes input is already sanitized (e.g., `name` isn't 200 chars long)
         Raise exceptions if the friend ID is invalid.
         Returns the response string.
@@ -231,38 +240,30 @@ class LonghornRiichiUtilities(commands.Cog):
         existing_friend_id: Optional[int] = None
         mahjongsoul_nickname = None
         mahjongsoul_account_id = None
-        async with registry_lock:
-            assert registry is not None
-            # Delete any existing registration
-            found_cell: gspread.cell.Cell = registry.find(discord_name, in_column=2)
-            cell_existed = found_cell is not None
-            if cell_existed:
-                [_, _, paid_membership, *mahjongsoul_fields] = registry.row_values(found_cell.row)
-                if mahjongsoul_fields:
-                    [mahjongsoul_nickname, existing_friend_id, mahjongsoul_account_id] = mahjongsoul_fields
-                    assert existing_friend_id is not None, "There are Mahjong Soul fields in the existing registry entry, but no Friend ID??"
-                    existing_friend_id = int(existing_friend_id)
-                registry.delete_rows(found_cell.row)
+        assert club_store is not None
+        assert account_manager is not None
+        # look up the Mahjong Soul account while we read the existing registration
+        get_member = club_store.get_member(discord_name)
+        if friend_id is None:
+            existing, result = await get_member, None
+        else:
+            existing, result = await asyncio.gather(get_member, account_manager.get_account(friend_id))
+        cell_existed = existing is not None
+        if existing is not None:
+            paid_membership = existing["paid_membership"]
+            mahjongsoul_nickname = existing["ms_nickname"]
+            existing_friend_id = existing["ms_friend_id"]
+            mahjongsoul_account_id = existing["ms_account_id"]
         
         if friend_id is None:
             friend_id = existing_friend_id
         elif friend_id != existing_friend_id:
-            assert account_manager is not None
-            result = await account_manager.get_account(friend_id)
             if result is None:
                 raise Exception(f"Couldn't find Mahjong Soul account for this friend ID: {friend_id}")
             mahjongsoul_nickname = result[0]
             mahjongsoul_account_id = result[1]
 
-        data = [name,
-                discord_name,
-                paid_membership,
-                mahjongsoul_nickname,
-                friend_id,
-                mahjongsoul_account_id]
-
-        async with registry_lock:
-            registry.append_row(data)
+        await club_store.register_member(name, discord_name, paid_membership, mahjongsoul_nickname, friend_id, mahjongsoul_account_id)
         
         register_string = "updated registration" if cell_existed else "registered"
 
@@ -304,14 +305,11 @@ class LonghornRiichiUtilities(commands.Cog):
 
     async def _unregister(self, server_member: discord.Member) -> str:
         discord_name = self.get_discord_name(server_member)
-        async with registry_lock:
-            assert registry is not None
-            found_cell: gspread.cell.Cell = registry.find(discord_name, in_column=2)
-            if found_cell is None:
-                return f"\"{discord_name}\" is not a registered member."
-            else:
-                registry.delete_rows(found_cell.row)
-                return f"\"{discord_name}\"'s registration has been removed."
+        assert club_store is not None
+        if not await club_store.remove_member(discord_name):
+            return f"\"{discord_name}\" is not a registered member."
+        else:
+            return f"\"{discord_name}\"'s registration has been removed."
 
     @app_commands.command(name="unregister", description="Remove your registered information.")
     async def unregister(self, interaction: Interaction):
@@ -551,13 +549,12 @@ class LonghornRiichiUtilities(commands.Cog):
             first_player, first_score = ordered_players[0]
             ordered_players[0] = (first_player, first_score + 1000*riichi_sticks)
 
-            # enter the scores into the sheet
+            # enter the scores (the sheet is updated in the background)
             timestamp = str(datetime.datetime.now()).split(".")[0]
             gamemode = f"{game_style} {game_type.value}"
             flatten = lambda xss: (x for xs in xss for x in xs)
-            async with raw_scores_lock:
-                assert raw_scores is not None
-                raw_scores.append_row([timestamp, gamemode, "yes", *flatten(map(lambda p: (self.get_discord_name(p[0]), str(p[1])), ordered_players))])
+            assert club_store is not None
+            await club_store.add_raw_scores(timestamp, gamemode, "yes", [(self.get_discord_name(p), score) for p, score in ordered_players])
 
             player_score_strings = list(flatten(map(lambda p: (p[0].mention, str(p[1])), ordered_players)))
             score_printout = f"Successfully entered scores for a {gamemode} game:\n" \
@@ -571,6 +568,35 @@ class LonghornRiichiUtilities(commands.Cog):
         except Exception as e:
             await interaction.followup.send(content="Error: " + str(e))
 
+    @app_commands.command(name="leaderboard", description=f"Show the club leaderboard for a game type.")
+    @app_commands.describe(game_type="Game type to display the leaderboard for.",
+                           server_member="(optional) Also show where this member is ranked. Defaults to you.")
+    @app_commands.choices(game_type=[
+        app_commands.Choice(name=YH_NAME, value=YH_NAME),
+        app_commands.Choice(name=YT_NAME, value=YT_NAME),
+        app_commands.Choice(name=SH_NAME, value=SH_NAME),
+        app_commands.Choice(name=ST_NAME, value=ST_NAME)])
+    async def leaderboard(self, interaction: Interaction, game_type: app_commands.Choice[str], server_member: Optional[discord.Member] = None):
+        if server_member is None:
+            assert isinstance(interaction.user, discord.Member)
+            server_member = interaction.user
+        discord_name = self.get_discord_name(server_member)
+        standings = self.leaderboard.standings(game_type.value)
+        if len(standings) == 0:
+            return await interaction.response.send_message(content=f"No {game_type.value} games on record.")
+
+        render = lambda s: f"{s['rank']}. **{s['name']}**: {s['total_points']:+.1f} ({s['games_played']} games, avg placement {s['avg_placement']:.2f})"
+        lines = [render(s) for s in standings[:10]]
+        own = next((s for s in standings if s["name"] == discord_name), None)
+        if own is not None and own["rank"] > 10:
+            lines.append("...")
+            lines.append(render(own))
+        green = Colour.from_str("#1EA51E")
+        embed = Embed(title=f"{game_type.value} leaderboard", description="\n".join(lines), colour=green)
+        if own is None:
+            embed.set_footer(text=f"{discord_name} has no {game_type.value} games on record.")
+        await interaction.response.send_message(embed=embed)
+
     @app_commands.command(name="update_membership", description=f"Update a player's membership type (paid or unpaid). Only usable by @{OFFICER_ROLE}.")
     @app_commands.describe(server_member="The server member whose membership type you want to update",
                            membership="Make them a paid or unpaid member?")
@@ -584,12 +610,9 @@ class LonghornRiichiUtilities(commands.Cog):
                                       membership: app_commands.Choice[str]):
         await interaction.response.defer(ephemeral=True)
         discord_name = self.get_discord_name(server_member)
-        async with registry_lock:
-            assert registry is not None
-            found_cell = registry.find(discord_name, in_column=2)
-            if found_cell is None:
-                return await interaction.followup.send(content=f"Error: {discord_name} is not registered as a club member.")
-            registry.update_cell(row=found_cell.row, col=3, value=membership.value)
+        assert club_store is not None
+        if not await club_store.set_paid_membership(discord_name, membership.value):
+            return await interaction.followup.send(content=f"Error: {discord_name} is not registered as a club member.")
         if membership.value == "yes":
             await server_member.add_roles(discord.Object(PAID_MEMBER_ROLE_ID))
             await interaction.followup.send(content=f"Updated {discord_name} to be a paid member.")
@@ -758,29 +781,20 @@ class GlobalUtilities(commands.Cog):
                                    riichicity_friend_code: Optional[int]):
         await interaction.response.defer(ephemeral=True)
         tenhou_name = None # no way to get tenhou stats outside of nodocchi so we will ignore tenhou.net
+        assert club_store is not None
+        discord_name = interaction.user.name
+        updated = {}
         async with registry_lock:
-            if not os.path.isfile("player_registry.json"):
-                player_registry = {}
-            else:
-                with open("player_registry.json", "rb") as file:
-                    player_registry = json.load(file)
-            discord_name = interaction.user.name
-            if discord_name not in player_registry:
-                player_registry[discord_name] = {}
-
-            updated = {}
             if majsoul_friend_code is not None:
                 assert account_manager is not None
                 result = await account_manager.get_account(majsoul_friend_code)
                 if result is None:
                     raise Exception(f"Invalid Mahjong soul friend code {majsoul_friend_code}")
-                player_registry[discord_name]["ms_name"] = result[0]
-                player_registry[discord_name]["ms_id"] = result[1]
-                player_registry[discord_name]["ms_friendcode"] = majsoul_friend_code
-                updated["Mahjong Soul"] = player_registry[discord_name]["ms_name"]
+                await club_store.link_account(discord_name, MAJSOUL_STATS, result[0], result[1], majsoul_friend_code)
+                updated["Mahjong Soul"] = result[0]
             if tenhou_name is not None:
-                player_registry[discord_name]["tenhou_name"] = tenhou_name
-                updated["tenhou.net"] = player_registry[discord_name]["tenhou_name"]
+                await club_store.link_account(discord_name, TENHOU, tenhou_name)
+                updated["tenhou.net"] = tenhou_name
             if riichicity_name is not None or riichicity_friend_code is not None:
                 query = str(riichicity_friend_code) if riichicity_friend_code is not None else riichicity_name
                 assert query is not None                    
@@ -797,50 +811,23 @@ class GlobalUtilities(commands.Cog):
                     data="{\"findType\":2,\"content\":\"" + query + "\"}").json()
                 if results["code"] != 0:
                     raise Exception(f"Error {results['code']}: {results['message']}")
-                player_registry[discord_name]["rc_name"] = results["data"]["friendList"][0]["nickname"]
-                player_registry[discord_name]["rc_friendcode"] = results["data"]["friendList"][0]["userID"]
-                updated["Riichi City"] = player_registry[discord_name]["rc_name"]
-            with open("player_registry.json", "wb") as file:
-                file.write(json.dumps(player_registry, ensure_ascii=False).encode("utf-8"))
+                riichicity_account = results["data"]["friendList"][0]
+                await club_store.link_account(discord_name, RIICHICITY, riichicity_account["nickname"], None, riichicity_account["userID"])
+                updated["Riichi City"] = riichicity_account["nickname"]
+            linked_accounts = await club_store.get_linked_accounts(discord_name)
 
         out_header = f"Updated your registration for {' and '.join(updated.keys())}:"
         green = Colour.from_str("#1EA51E")
         embed = Embed(description="Registered accounts:", colour=green)
-        for k, v in {"Mahjong Soul": "ms_name", "tenhou.net": "tenhou_name", "Riichi City": "rc_name"}.items():
-            if v in player_registry[discord_name]:
-                embed.add_field(name=f"**{k}**", value=player_registry[discord_name][v], inline=True)
+        for k, platform in {"Mahjong Soul": MAJSOUL_STATS, "tenhou.net": TENHOU, "Riichi City": RIICHICITY}.items():
+            if platform in linked_accounts:
+                embed.add_field(name=f"**{k}**", value=linked_accounts[platform]["nickname"], inline=True)
         await interaction.followup.send(content=out_header, embed=embed)
 
-    def draw_ms_trendline(self, data):
-        plt.rcParams["font.size"] = 36
-        plt.rcParams["text.color"] = "orange"
-        plt.rcParams["xtick.color"] = "gray"
-        plt.rcParams["ytick.color"] = "gray"
-        plt.figure(figsize=(20, 4))
-        plt.plot(range(len(data)), [rank for rank, _ in data], marker="o", markersize=28, color="orange", linestyle="-", linewidth=8)
-
-        fn = get_sample_data(os.path.join(os.getcwd(), "images/sunglasses_cat.png"), asfileobj=False)
-        ax = plt.gca()
-        sunglasses_cat = OffsetImage(plt.imread(fn, format='png'), zoom=0.15)
-        for x, (rank, sunglasses) in zip(range(10), data):
-            if sunglasses:
-                ax.add_artist(AnnotationBbox(sunglasses_cat, (x, rank), frameon=False, box_alignment=(0.5, 0.5)))
-
-        ax.invert_yaxis()
-        plt.yticks(range(1, 5), ["1st", "2nd", "3rd", "4th"])
-        plt.ylim(4.5, 0.5)
-        plt.grid(axis="y")
-        plt.tick_params(axis="x", which="both", bottom=False, top=False, labelbottom=False)
-        plt.box(False)
-        plt.tight_layout()
-
-        # return as a BytesIO object
-        buf = BytesIO()
-        plt.savefig(buf, format="png", transparent=True, bbox_inches="tight")
-        buf.seek(0)
-        plt.cla()
-        plt.clf()
-        return buf
+    async def draw_ms_trendline(self, majsoul_id: int, data) -> BytesIO:
+        from modules.render.graphs import ms_trendline # imports matplotlib
+        key = image_key(ms_trendline, majsoul_id, json.dumps(data))
+        return BytesIO(await image_cache.get(key, lambda: render_engine.render(ms_trendline, data)))
 
     @app_commands.command(name="ms_stats", description=f"Fetch Mahjong Soul stats for yourself or someone else.")
     @app_commands.describe(game_type="Game type to display stats for.",
@@ -863,25 +850,12 @@ class GlobalUtilities(commands.Cog):
             assert isinstance(interaction.user, discord.Member)
             user = interaction.user
         if majsoul_id is None:
-            async with registry_lock:
-                global registry
-                assert registry is not None
-                found_cell: gspread.cell.Cell = registry.find(user.name, in_column=2)
-                try:
-                    [_, _, _, *mahjongsoul_fields] = registry.row_values(found_cell.row)
-                    [majsoul_name, _, majsoul_id] = mahjongsoul_fields
-                    majsoul_id = int(majsoul_id)
-                except Exception as e:
-                    # fall back to json file
-                    if not os.path.isfile("player_registry.json"):
-                        player_registry = {}
-                    else:
-                        with open("player_registry.json", "rb") as file:
-                            player_registry = json.load(file)
-                    if user.name not in player_registry or "ms_name" not in player_registry[user.name]:
-                        return await interaction.followup.send(content=f"Error: first register your Mahjong Soul friend code with </register_stats:1195388249791799366>!")
-                    majsoul_name = player_registry[user.name]["ms_name"]
-                    majsoul_id = player_registry[user.name]["ms_id"]
+            assert club_store is not None
+            linked_accounts = await club_store.get_linked_accounts(user.name)
+            if MAJSOUL_STATS not in linked_accounts or linked_accounts[MAJSOUL_STATS]["account_id"] is None:
+                return await interaction.followup.send(content=f"Error: first register your Mahjong Soul friend code with </register_stats:1195388249791799366>!")
+            majsoul_name = linked_accounts[MAJSOUL_STATS]["nickname"]
+            majsoul_id = linked_accounts[MAJSOUL_STATS]["account_id"]
         assert majsoul_name is not None
         assert majsoul_id is not None
 
@@ -891,7 +865,7 @@ class GlobalUtilities(commands.Cog):
         trendline_data_key = "Yonma recents" if "Yonma" in game_type.value else "Sanma recents"
         if trendline_data_key not in stats:
             return await interaction.followup.send(content=f"No {game_type.value} games on record.")
-        trendline = discord.File(fp=self.draw_ms_trendline(data=stats[trendline_data_key]), filename=trendline_filename)
+        trendline = discord.File(fp=await self.draw_ms_trendline(majsoul_id, data=stats[trendline_data_key]), filename=trendline_filename)
 
         green = Colour.from_str("#1EA51E")
         embed = Embed(title=f"**{game_type.value}** stats for Mahjong Soul player **{majsoul_name}**", colour=green)
@@ -950,16 +924,12 @@ class GlobalUtilities(commands.Cog):
             assert isinstance(interaction.user, discord.Member)
             user = interaction.user
         if riichicity_id is None:
-            async with registry_lock:
-                if not os.path.isfile("player_registry.json"):
-                    player_registry = {}
-                else:
-                    with open("player_registry.json", "rb") as file:
-                        player_registry = json.load(file)
-            if user.name not in player_registry or "rc_name" not in player_registry[user.name]:
+            assert club_store is not None
+            linked_accounts = await club_store.get_linked_accounts(user.name)
+            if RIICHICITY not in linked_accounts:
                 return await interaction.followup.send(content=f"Error: first register your Riichi City username with </register_stats:1195388249791799366>!")
-            riichicity_name = player_registry[user.name]["rc_name"]
-            riichicity_id = player_registry[user.name]["rc_friendcode"]
+            riichicity_name = linked_accounts[RIICHICITY]["nickname"]
+            riichicity_id = linked_accounts[RIICHICITY]["friend_code"]
         assert riichicity_name is not None
         assert riichicity_id is not None
 
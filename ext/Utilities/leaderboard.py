@@ -0,0 +1,113 @@
+import numpy as np
+from typing import *
+
+UNREGISTERED = "Unregistered player"
+
+class Leaderboard:
+    """
+    Standings for every game mode, computed from the raw scores with NumPy.
+    `load()` builds everything in one vectorized pass; `add_game()` applies
+    a single new game on top of that.
+
+    `game_modes` maps each game mode name (e.g. "Yonma Hanchan") to its uma;
+    the number of players is the length of the uma tuple.
+    Points for a game are (raw score - starting points)/1000 + uma.
+    """
+    def __init__(self, game_modes: Dict[str, Tuple[int, ...]]):
+        self.modes = list(game_modes.keys())
+        self.mode_index = {mode: i for i, mode in enumerate(self.modes)}
+        # uma[mode, placement] and starting points per mode
+        self.uma = np.zeros((len(self.modes), 4))
+        self.start_points = np.zeros(len(self.modes))
+        self.num_seats = [len(uma) for uma in game_modes.values()]
+        for i, uma in enumerate(game_modes.values()):
+            self.uma[i, :len(uma)] = uma
+            self.start_points[i] = 35000 if len(uma) == 3 else 25000
+        self.players: List[str] = []
+        self.player_index: Dict[str, int] = {}
+        self._allocate(0)
+
+    def _allocate(self, num_players: int) -> None:
+        num_modes = len(self.modes)
+        self.games_played = np.zeros((num_modes, num_players), dtype=np.int64)
+        self.total_points = np.zeros((num_modes, num_players))
+        self.total_score = np.zeros((num_modes, num_players), dtype=np.int64)
+        self.placement_counts = np.zeros((num_modes, num_players, 4), dtype=np.int64)
+
+    def _grow(self, num_players: int) -> None:
+        """Make room for `num_players` players, keeping existing totals"""
+        extra = num_players - self.games_played.shape[1]
+        if extra <= 0:
+            return
+        pad = lambda a: np.concatenate([a, np.zeros((a.shape[0], extra, *a.shape[2:]), dtype=a.dtype)], axis=1)
+        self.games_played = pad(self.games_played)
+        self.total_points = pad(self.total_points)
+        self.total_score = pad(self.total_score)
+        self.placement_counts = pad(self.placement_counts)
+
+    def _index(self, name: str) -> int:
+        if name not in self.player_index:
+            self.player_index[name] = len(self.players)
+            self.players.append(name)
+        return self.player_index[name]
+
+    def load(self, games: List[Dict[str, Any]]) -> None:
+        """Recompute all standings from scratch, given games as returned by `ClubStore.get_raw_scores()`"""
+        self.players = []
+        self.player_index = {}
+        self._allocate(0)
+        self._apply(games)
+
+    def add_game(self, game: Dict[str, Any]) -> None:
+        self._apply([game])
+
+    def _apply(self, games: List[Dict[str, Any]]) -> None:
+        games = [game for game in games if game["game_mode"] in self.mode_index]
+        if len(games) == 0:
+            return
+        # (games x 4) arrays; empty seats have player -1
+        num_games = len(games)
+        modes = np.array([self.mode_index[game["game_mode"]] for game in games])
+        players = np.full((num_games, 4), -1, dtype=np.int64)
+        scores = np.zeros((num_games, 4), dtype=np.int64)
+        for i, game in enumerate(games):
+            for j, (name, score) in enumerate(game["players"][:4]):
+                players[i, j] = -1 if name == UNREGISTERED else self._index(name)
+                scores[i, j] = score
+        self._grow(len(self.players))
+
+        # placement = number of seats with a strictly higher score, ties going to the earlier seat
+        seated = np.array([[j < len(game["players"]) for j in range(4)] for game in games])
+        masked = np.where(seated, scores, np.iinfo(np.int64).min)
+        seat = np.arange(4)
+        higher = (masked[:, None, :] > masked[:, :, None]) \
+               | ((masked[:, None, :] == masked[:, :, None]) & (seat[None, None, :] < seat[None, :, None]))
+        placements = higher.sum(axis=2)
+        points = (scores - self.start_points[modes][:, None]) / 1000 + self.uma[modes[:, None], placements]
+
+        counted = players >= 0
+        mode_of_seat = np.broadcast_to(modes[:, None], players.shape)[counted]
+        player_of_seat = players[counted]
+        np.add.at(self.games_played, (mode_of_seat, player_of_seat), 1)
+        np.add.at(self.total_points, (mode_of_seat, player_of_seat), points[counted])
+        np.add.at(self.total_score, (mode_of_seat, player_of_seat), scores[counted])
+        np.add.at(self.placement_counts, (mode_of_seat, player_of_seat, placements[counted]), 1)
+
+    def standings(self, game_mode: str) -> List[Dict[str, Any]]:
+        """Everyone who played `game_mode`, sorted by total points"""
+        m = self.mode_index[game_mode]
+        games_played = self.games_played[m]
+        played = np.flatnonzero(games_played > 0)
+        order = played[np.argsort(-self.total_points[m, played], kind="stable")]
+        num_seats = self.num_seats[m]
+        placement_counts = self.placement_counts[m, order, :num_seats]
+        avg_placement = (placement_counts * np.arange(1, num_seats + 1)).sum(axis=1) / games_played[order]
+        return [{"rank": rank + 1,
+                 "name": self.players[p],
+                 "total_points": float(self.total_points[m, p]),
+                 "games_played": int(games_played[p]),
+                 "avg_points": float(self.total_points[m, p] / games_played[p]),
+                 "avg_score": float(self.total_score[m, p] / games_played[p]),
+                 "avg_placement": float(avg_placement[rank]),
+                 "placement_counts": placement_counts[rank].tolist()}
+                for rank, p in enumerate(order)]
@@ -11,6 +11,8 @@ def assert_getenv(name: str) -> str:
     return value
 
 # Google Sheets stuff
+# `registry` and `raw_scores` are `AsyncWorksheet`s; every call on them
+# runs on `gs_client`'s thread pool rather than the event loop
 gs_client = None
 leaderboard_ss = None
 registry = None
@@ -23,15 +25,49 @@ async def connect_to_google_sheets():
     global leaderboard_ss
     global registry
     global raw_scores
-    import gspread
-    await asyncio.sleep(0) # yield thread
-    gs_client = gspread.service_account(filename='gs_service_account.json')
-    await asyncio.sleep(0) # yield thread
-    leaderboard_ss = gs_client.open_by_url(assert_getenv("spreadsheet_url"))
-    registry = leaderboard_ss.worksheet("Registry")
-    raw_scores = leaderboard_ss.worksheet("Raw Scores")
+    from os import getenv
+    from modules.gsheets.async_sheets import AsyncSheetsClient
+    gs_client = AsyncSheetsClient(max_workers=int(getenv("gs_max_workers", 4)),
+                                  read_per_minute=int(getenv("gs_read_quota", 60)),
+                                  write_per_minute=int(getenv("gs_write_quota", 60)))
+    leaderboard_ss = await gs_client.open_by_url('gs_service_account.json', assert_getenv("spreadsheet_url"))
+    registry, raw_scores = await asyncio.gather(
+        gs_client.worksheet(leaderboard_ss, "Registry"),
+        gs_client.worksheet(leaderboard_ss, "Raw Scores"))
     logging.info("Opened connection to gsheets!")
 
+# Club store stuff
+# `club_store` is the source of truth for the registry, linked accounts and
+# raw scores; `sheets_exporter` mirrors it onto the Google Sheet in the background
+club_store = None
+sheets_exporter = None
+async def load_club_store():
+    # must run after `connect_to_google_sheets()`, since the first run
+    # imports the existing Registry/Raw Scores sheets into the store
+    logging.info("Opening club store...")
+    global club_store
+    global sheets_exporter
+    import json
+    import os
+    from modules.clubdb.store import ClubStore
+    from modules.clubdb.exporter import SheetsExporter
+    club_store = ClubStore(os.getenv("club_db_path", "club.db"))
+    await club_store.open()
+    if await club_store.get_meta("imported") is None:
+        assert registry is not None and raw_scores is not None
+        registry_rows, raw_score_rows = await asyncio.gather(registry.get_all_values(), raw_scores.get_all_values())
+        player_registry = {}
+        if os.path.isfile("player_registry.json"):
+            with open("player_registry.json", "rb") as file:
+                player_registry = json.load(file)
+        num_members, num_games, num_accounts, num_rejected = await club_store.import_existing(registry_rows, raw_score_rows, player_registry)
+        logging.info(f"Imported {num_members} members, {num_games} games and {num_accounts} linked accounts into the club store"
+                     f" ({num_rejected} Raw Scores rows skipped for malformed scores)")
+    sheets_exporter = SheetsExporter(club_store, registry, raw_scores, registry_lock, raw_scores_lock,
+                                     interval=float(os.getenv("club_export_interval", 60)))
+    sheets_exporter.start()
+    logging.info("Opened club store!")
+
 account_manager = None
 async def load_mjs_account_manager():
     # initialize an account manager to be shared with all extensions.
@@ -0,0 +1,185 @@
+# times the InjusticeJudge commands over the regression games in `unit_test_imports.py`,
+# using logs cached in a fixtures directory so nothing touches the network. Usage:
+#   python injustice_benchmark.py --record          # fetch the fixtures once (logs in to Mahjong Soul)
+#   python injustice_benchmark.py                   # compare against benchmark_baseline.json
+#   python injustice_benchmark.py --save-baseline   # ...and make this run the new baseline
+# Analysis runs in this process (not the pool), so its timings and memory
+# don't include the pool overhead. `draw_graph` and `draw_graph_fast` compare the
+# two score graph renderers; peak memory only counts what tracemalloc sees,
+# which excludes Pillow's image buffers.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import *
+
+from unit_test_imports import links
+
+STEPS = ["decode", "parse_game", "injustice", "skill", "draw_graph", "draw_graph_fast"]
+
+def describe(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {"min": ordered[0],
+            "median": statistics.median(ordered),
+            "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]}
+
+async def main(args) -> int:
+    # the cache directory is read at import time
+    os.environ["game_cache_dir"] = args.fixtures
+    if args.record:
+        import global_stuff
+        await global_stuff.load_mjs_account_manager()
+    from ext.InjusticeJudge.analysis import decode_majsoul_record, decode_riichicity_log, decode_tenhou_log, evaluate_kyokus, is_majsoul_link, parse_fetched_log
+    from ext.InjusticeJudge.game_cache import game_log_cache, parsed_game_cache
+    from ext.InjusticeJudge.utilities import close_http_session, fetch_game_log, game_log_key, parse_game, render_graph
+    from modules.render.engine import score_graph_renderer
+    from modules.pymjsoul.proto import liqi_combined_pb2 as proto
+
+    games = {reason: link for reason, link in links.items() if args.only is None or args.only in reason}
+    if args.record:
+        failed = 0
+        for reason, link in games.items():
+            try:
+                await fetch_game_log(link)
+            except Exception as e:
+                print(f"couldn't fetch {reason} ({link}): {e!r}")
+                failed += 1
+        await game_log_cache.flush()
+        await close_http_session()
+        print(f"Recorded {len(games) - failed} of {len(games)} games into {args.fixtures}")
+        return 1 if failed > 0 else 0
+    game_log_cache.offline = True
+
+    def decode(link: str, data: bytes) -> Any:
+        if is_majsoul_link(link):
+            record = proto.ResGameRecord()  # type: ignore[attr-defined]
+            record.ParseFromString(data)
+            return decode_majsoul_record(record, link)
+        elif "tenhou.net/" in link:
+            return decode_tenhou_log(json.loads(data), link)
+        return decode_riichicity_log(json.loads(data))
+
+    def analyze(link: str, fetched_log: Any, look_for: str) -> List[str]:
+        kyokus, game_metadata, parsed_player_seat, player = parse_fetched_log(link, fetched_log, None)
+        return [result for _, results in evaluate_kyokus(kyokus, game_metadata, parsed_player_seat, player, {0,1,2,3}, {look_for})
+                        for result in results]
+
+    png_sizes: Dict[str, Dict[str, int]] = {step: {} for step in STEPS} # graph step -> game -> bytes
+    async def run_step(step: str, link: str) -> None:
+        if step == "decode":
+            decode(link, data[link])
+        elif step == "parse_game":
+            parsed_game_cache.entries.clear()
+            await parse_game(link, "All winning hands and starting hands")
+        elif step in {"injustice", "skill"}:
+            analyze(link, await fetch_game_log(link), step)
+        elif step in {"draw_graph", "draw_graph_fast"}:
+            # bypasses the image cache; the parse is cached by now
+            renderer = score_graph_renderer("fast" if step == "draw_graph_fast" else "matplotlib")
+            png_sizes[step][reason_of[link]] = len(await render_graph(link, "Scores only", renderer))
+
+    # load everything into memory first, so no step times the disk
+    data: Dict[str, bytes] = {}
+    for reason, link in list(games.items()):
+        try:
+            await fetch_game_log(link)
+            data[link] = game_log_cache.store.read(game_log_key(link))  # type: ignore[assignment]
+        except LookupError:
+            print(f"skipping {reason}: not in {args.fixtures} (run with --record)")
+            del games[reason]
+        except Exception as e:
+            print(f"skipping {reason}: {e!r}")
+            del games[reason]
+    if len(games) == 0:
+        print("No games to benchmark.")
+        return 1
+
+    timings: Dict[str, Dict[str, List[float]]] = {step: {} for step in STEPS} # step -> game -> seconds
+    peak_memory: Dict[str, int] = {step: 0 for step in STEPS}
+    failures: Dict[str, Dict[str, str]] = {step: {} for step in STEPS}
+    reason_of = {link: reason for reason, link in games.items()}
+    for step in STEPS:
+        for reason, link in games.items():
+            try:
+                await run_step(step, link) # warm up
+                samples = []
+                for _ in range(args.repeat):
+                    start_time = time.perf_counter()
+                    await run_step(step, link)
+                    samples.append(time.perf_counter() - start_time)
+                timings[step][reason] = samples
+                # separate pass, since tracing slows everything down
+                tracemalloc.start()
+                await run_step(step, link)
+                peak_memory[step] = max(peak_memory[step], tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            except Exception as e:
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                failures[step][reason] = repr(e)
+
+    results: Dict[str, Any] = {
+        "meta": {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                 "games": len(games), "repeat": args.repeat},
+        "steps": {}}
+    print(f"{len(games)} games, {args.repeat} runs each (seconds per game)")
+    print(f"  {'step':<16}{'min':>10}{'median':>10}{'p95':>10}{'peak MB':>10}{'avg PNG KB':>12}")
+    for step in STEPS:
+        per_game = {reason: statistics.median(samples) for reason, samples in timings[step].items()}
+        if len(per_game) == 0:
+            print(f"  {step:<16}failed on every game")
+        else:
+            summary = describe([sample for samples in timings[step].values() for sample in samples])
+            results["steps"][step] = {**summary, "peak_memory": peak_memory[step], "per_game": per_game, "failures": failures[step]}
+            png_size = ""
+            if len(png_sizes[step]) > 0:
+                results["steps"][step]["png_bytes"] = png_sizes[step]
+                png_size = f"{sum(png_sizes[step].values())/len(png_sizes[step])/1000:>12.1f}"
+            print(f"  {step:<16}{summary['min']:>10.4f}{summary['median']:>10.4f}{summary['p95']:>10.4f}{peak_memory[step]/1e6:>10.1f}{png_size}")
+        for reason, error in failures[step].items():
+            print(f"    failed on {reason}: {error}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.baseline} ({baseline['meta']['time']}):")
+        for step, summary in results["steps"].items():
+            if step not in baseline["steps"]:
+                continue
+            # only compare games both runs have, in case the game set changed
+            common = summary["per_game"].keys() & baseline["steps"][step]["per_game"].keys()
+            if len(common) == 0:
+                continue
+            new = sum(summary["per_game"][game] for game in common)
+            old = sum(baseline["steps"][step]["per_game"][game] for game in common)
+            change = new / old - 1 if old > 0 else 0
+            # sub-millisecond differences are noise, whatever the percentage
+            regressed = change > args.threshold and new - old > 0.001
+            print(f"  {step:<16}{100*change:>+8.1f}%{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(step)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved as the new baseline {args.baseline}")
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the InjusticeJudge commands on cached regression games.")
+    parser.add_argument("--fixtures", default="benchmark_fixtures", help="game log cache directory to read the games from")
+    parser.add_argument("--record", action="store_true", help="fetch the games into --fixtures instead of benchmarking")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per game and step")
+    parser.add_argument("--only", default=None, help="only games whose description contains this")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown (as a fraction) that counts as a regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
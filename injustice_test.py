@@ -14,8 +14,9 @@ async def test_injustice():
     print("===============================")
     for reason, link in links.items():
         print("reason: ", reason, "\n-----------")
-        for injustice in (await analyze_game(link))[0]:
-            print(injustice)
+        async for _, injustices in analyze_game(link):
+            for injustice in injustices:
+                print(injustice)
         print("===============================")
 
 asyncio.run(test_injustice())
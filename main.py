@@ -1,5 +1,5 @@
 import asyncio
-from global_stuff import connect_to_google_sheets, load_mjs_account_manager
+from global_stuff import connect_to_google_sheets, load_club_store, load_mjs_account_manager
 import logging
 from threading import Thread
 
@@ -29,18 +29,35 @@ async def main() -> None:
     load_bot_task = asyncio.create_task(setup_bot())
     # load global stuff
     gs_task = asyncio.create_task(connect_to_google_sheets())
+    store_task = asyncio.create_task(_load_club_store_after(gs_task))
     mjs_task = asyncio.create_task(load_mjs_account_manager())
+    shanten_table_task = asyncio.create_task(_load_shanten_table())
 
-    bot = (await asyncio.gather(load_bot_task, gs_task, mjs_task))[0]
+    bot = (await asyncio.gather(load_bot_task, gs_task, store_task, mjs_task, shanten_table_task))[0]
 
     from global_stuff import assert_getenv
     DISCORD_TOKEN = assert_getenv("bot_token")
     await bot.start(DISCORD_TOKEN)
 
+async def _load_club_store_after(gs_task: asyncio.Task) -> None:
+    await gs_task
+    await load_club_store()
+
+async def _load_shanten_table() -> None:
+    """Memory-map `/shanten`'s table (building it the first time) off the event loop"""
+    from ext.InjusticeJudge.shanten_table import shanten_table
+    try:
+        await asyncio.to_thread(shanten_table.load)
+    except Exception as e:
+        logging.error(f"_load_shanten_table: {e}; `/shanten` computes rows as needed until a retry in the background loads it")
+
 async def _background_imports() -> None:
     """Cache some imports we might need later in an async thread"""
-    pkgs = ["discord", "gspread", "json", "numpy", "matplotlib.pyplot", "google.protobuf",
-            "requests", "aiohttp", "websockets", "urllib3",
+    import os
+    # the score graph renderer (and matplotlib, unless it's the fast one)
+    renderer = "modules.render.fast" if os.getenv("score_graph_renderer") == "fast" else "modules.render.graphs"
+    pkgs = ["discord", "gspread", "json", "numpy", renderer, "google.protobuf",
+            "requests", "aiohttp", "sqlite3", "websockets", "urllib3",
             "functools", "itertools", "hashlib", "hmac", "struct", "uuid", "re",
             "modules.InjusticeJudge.injustice_judge.classes2"]
     import time
@@ -59,4 +76,6 @@ async def _background_imports() -> None:
             await asyncio.sleep(0) # yield
     logging.info("Done with async background imports")
 
-asyncio.run(main())
+# guarded since worker processes (see `ext/InjusticeJudge/analysis.py`) import this module
+if __name__ == "__main__":
+    asyncio.run(main())
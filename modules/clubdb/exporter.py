@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import re
+import time
+from typing import *
+from modules.gsheets.scheduler import PRIORITY_LEADERBOARD
+from .store import ClubStore
+
+DISCORD_NAME_COL: int = 2
+REGISTRY_LAST_COL: str = "F"
+
+class SheetsExporter:
+    """
+    Mirrors the club store onto the Registry and Raw Scores sheets in the
+    background, so commands never wait on Google Sheets. Wakes up whenever
+    the store changes (and every `interval` seconds, to retry failures).
+    """
+    def __init__(self, store: ClubStore, registry, raw_scores,
+                 registry_lock: asyncio.Lock, raw_scores_lock: asyncio.Lock, interval: float = 60):
+        self.store = store
+        self.registry = registry
+        self.raw_scores = raw_scores
+        self.registry_lock = registry_lock
+        self.raw_scores_lock = raw_scores_lock
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_export: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # discord name -> row number on the Registry sheet; refreshed once per export pass
+        self.registry_rows: Optional[Dict[str, int]] = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.store.changed.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.store.changed.clear()
+            try:
+                await self.export_once()
+            except Exception as e:
+                self.last_error = repr(e)
+                logging.error(f"clubdb: failed to export to Google Sheets: {e!r}")
+
+    async def export_once(self) -> Tuple[int, int]:
+        """Export everything that's pending; returns (members, games) exported"""
+        members = await self.store.get_unsynced_members()
+        if len(members) > 0:
+            async with self.registry_lock:
+                # someone may have edited the sheet by hand since the last pass
+                await self._load_registry_rows()
+                for member in members:
+                    if member["deleted"]:
+                        await self.delete_registry_row(member["discord_name"])
+                    else:
+                        await self.upsert_registry_row(member["discord_name"], [member["name"],
+                                                                                member["discord_name"],
+                                                                                member["paid_membership"],
+                                                                                member["ms_nickname"],
+                                                                                member["ms_friend_id"],
+                                                                                member["ms_account_id"]])
+                    await self.store.mark_member_synced(member["discord_name"], member["version"])
+        games = await self.store.get_raw_scores(unexported_only=True)
+        for game in games:
+            await self._export_game(game)
+        self.last_export = time.time()
+        if len(members) + len(games) > 0:
+            logging.info(f"clubdb: exported {len(members)} registry entries and {len(games)} games to Google Sheets")
+        return len(members), len(games)
+
+    async def _load_registry_rows(self) -> None:
+        discord_names = await self.registry.col_values(DISCORD_NAME_COL)
+        self.registry_rows = {name: i+1 for i, name in enumerate(discord_names) if name != ""}
+
+    async def upsert_registry_row(self, discord_name: str, values: List[Any]) -> None:
+        """
+        Overwrite the member's existing Registry row in place with a single write,
+        or append a new row if they aren't on the sheet. Caller holds `registry_lock`.
+        """
+        if self.registry_rows is None:
+            await self._load_registry_rows()
+        assert self.registry_rows is not None
+        values = ["" if v is None else v for v in values] # `None` would leave the old cell value in place
+        row = self.registry_rows.get(discord_name)
+        if row is not None:
+            await self.registry.update(f"A{row}:{REGISTRY_LAST_COL}{row}", [values])
+        else:
+            response = await self.registry.append_row(values)
+            # e.g. "Registry!A12:F12"
+            match = re.search(r"![A-Z]+(\d+):", response.get("updates", {}).get("updatedRange", "")) if isinstance(response, dict) else None
+            if match is not None:
+                self.registry_rows[discord_name] = int(match.group(1))
+            else:
+                self.registry_rows = None
+
+    async def delete_registry_row(self, discord_name: str) -> None:
+        """Remove the member's Registry row, if any. Caller holds `registry_lock`."""
+        if self.registry_rows is None:
+            await self._load_registry_rows()
+        assert self.registry_rows is not None
+        row = self.registry_rows.pop(discord_name, None)
+        if row is not None:
+            await self.registry.delete_rows(row)
+            self.registry_rows = {name: r-1 if r > row else r for name, r in self.registry_rows.items()}
+
+    async def _export_game(self, game: Dict[str, Any]) -> None:
+        row = [game["timestamp"], game["game_mode"], game["irl"]]
+        for discord_name, score in game["players"]:
+            row.extend((discord_name, score))
+        async with self.raw_scores_lock:
+            await self.raw_scores.append_row(row, priority=PRIORITY_LEADERBOARD)
+        await self.store.mark_raw_scores_exported(game["id"])
+
+    async def summary(self) -> List[str]:
+        pending_members = len(await self.store.get_unsynced_members())
+        pending_games = len(await self.store.get_raw_scores(unexported_only=True))
+        last_export = "never" if self.last_export is None else f"{time.time() - self.last_export:.0f}s ago"
+        ret = [f"exporter: {pending_members} registry entries and {pending_games} games pending, last export {last_export}"]
+        if self.last_error is not None:
+            ret.append(f"exporter: last error {self.last_error}")
+        return ret
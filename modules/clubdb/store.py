@@ -0,0 +1,374 @@
+import asyncio
+import functools
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS members (
+    discord_name TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    paid_membership TEXT NOT NULL DEFAULT 'no',
+    deleted INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1,
+    synced_version INTEGER
+);
+CREATE TABLE IF NOT EXISTS linked_accounts (
+    discord_name TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    nickname TEXT,
+    account_id INTEGER,
+    friend_code INTEGER,
+    PRIMARY KEY (discord_name, platform)
+);
+CREATE INDEX IF NOT EXISTS linked_accounts_by_account_id ON linked_accounts (platform, account_id);
+CREATE TABLE IF NOT EXISTS raw_scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    game_mode TEXT NOT NULL,
+    irl TEXT NOT NULL,
+    game_uuid TEXT,
+    exported INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS raw_scores_by_timestamp ON raw_scores (timestamp);
+CREATE INDEX IF NOT EXISTS raw_scores_by_exported ON raw_scores (exported);
+CREATE TABLE IF NOT EXISTS raw_score_players (
+    game_id INTEGER NOT NULL REFERENCES raw_scores (id),
+    placement INTEGER NOT NULL,
+    discord_name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (game_id, placement)
+);
+CREATE INDEX IF NOT EXISTS raw_score_players_by_name ON raw_score_players (discord_name);
+"""
+
+# values for `linked_accounts.platform`
+MAJSOUL = "majsoul" # the Mahjong Soul account on the Registry sheet
+MAJSOUL_STATS = "majsoul_stats" # the Mahjong Soul account registered for `/ms_stats` with `/register_stats`
+RIICHICITY = "riichicity"
+TENHOU = "tenhou"
+
+class ClubStore:
+    """
+    Local SQLite database that is the source of truth for the club registry,
+    linked game accounts, and raw scores. The Google Sheet is kept in sync
+    in the background by `SheetsExporter`.
+
+    All queries run on a single dedicated thread (which owns the connection),
+    so they never block the event loop and writes are serialized.
+    """
+    def __init__(self, path: str = "club.db"):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clubdb")
+        self.conn: Optional[sqlite3.Connection] = None
+        # set whenever something changes that should be exported to the sheet
+        self.changed = asyncio.Event()
+        # called with each newly added game (same format as `get_raw_scores()`)
+        self.raw_score_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def open(self) -> None:
+        await self._run(self._open)
+
+    def _open(self) -> None:
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+
+    """
+    =====================================================
+    META
+    =====================================================
+    """
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        return await self._run(self._get_meta, key)
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        assert self.conn is not None
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row["value"]
+
+    async def set_meta(self, key: str, value: str) -> None:
+        await self._run(self._set_meta, key, value)
+
+    def _set_meta(self, key: str, value: str) -> None:
+        assert self.conn is not None
+        with self.conn:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+    """
+    =====================================================
+    MEMBERS
+    =====================================================
+    """
+
+    async def get_member(self, discord_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the member's registry entry with their Mahjong Soul account:
+        {name, discord_name, paid_membership, ms_nickname, ms_friend_id, ms_account_id}
+        """
+        return await self._run(self._get_member, discord_name)
+
+    def _get_member(self, discord_name: str) -> Optional[Dict[str, Any]]:
+        assert self.conn is not None
+        row = self.conn.execute("""
+            SELECT m.name, m.discord_name, m.paid_membership,
+                   a.nickname AS ms_nickname, a.friend_code AS ms_friend_id, a.account_id AS ms_account_id
+            FROM members m LEFT JOIN linked_accounts a ON a.discord_name = m.discord_name AND a.platform = ?
+            WHERE m.discord_name = ? AND m.deleted = 0""", (MAJSOUL, discord_name)).fetchone()
+        return None if row is None else dict(row)
+
+    async def find_member_by_majsoul_id(self, account_id: int) -> Optional[str]:
+        """Returns the Discord name of the member with the given Mahjong Soul account id"""
+        return await self._run(self._find_member_by_majsoul_id, account_id)
+
+    def _find_member_by_majsoul_id(self, account_id: int) -> Optional[str]:
+        assert self.conn is not None
+        row = self.conn.execute("""
+            SELECT m.discord_name FROM linked_accounts a JOIN members m ON a.discord_name = m.discord_name
+            WHERE a.platform = ? AND a.account_id = ? AND m.deleted = 0""", (MAJSOUL, account_id)).fetchone()
+        return None if row is None else row["discord_name"]
+
+    async def register_member(self, name: str, discord_name: str, paid_membership: str,
+                              ms_nickname: Optional[str], ms_friend_id: Optional[int], ms_account_id: Optional[int]) -> None:
+        await self._run(self._register_member, name, discord_name, paid_membership, ms_nickname, ms_friend_id, ms_account_id)
+        self.changed.set()
+
+    def _register_member(self, name, discord_name, paid_membership, ms_nickname, ms_friend_id, ms_account_id) -> None:
+        assert self.conn is not None
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO members (discord_name, name, paid_membership) VALUES (?, ?, ?)
+                ON CONFLICT (discord_name) DO UPDATE SET
+                    name = excluded.name, paid_membership = excluded.paid_membership,
+                    deleted = 0, version = version + 1""", (discord_name, name, paid_membership))
+            if ms_friend_id is not None:
+                self._link_account(discord_name, MAJSOUL, ms_nickname, ms_account_id, ms_friend_id)
+
+    async def remove_member(self, discord_name: str) -> bool:
+        """Returns False if there was no such member"""
+        removed = await self._run(self._remove_member, discord_name)
+        self.changed.set()
+        return removed
+
+    def _remove_member(self, discord_name: str) -> bool:
+        assert self.conn is not None
+        with self.conn:
+            # keep the row around until the exporter removes it from the sheet
+            cursor = self.conn.execute("UPDATE members SET deleted = 1, version = version + 1 WHERE discord_name = ? AND deleted = 0", (discord_name,))
+            return cursor.rowcount > 0
+
+    async def set_paid_membership(self, discord_name: str, paid_membership: str) -> bool:
+        """Returns False if there was no such member"""
+        updated = await self._run(self._set_paid_membership, discord_name, paid_membership)
+        self.changed.set()
+        return updated
+
+    def _set_paid_membership(self, discord_name: str, paid_membership: str) -> bool:
+        assert self.conn is not None
+        with self.conn:
+            cursor = self.conn.execute("UPDATE members SET paid_membership = ?, version = version + 1 WHERE discord_name = ? AND deleted = 0", (paid_membership, discord_name))
+            return cursor.rowcount > 0
+
+    async def get_unsynced_members(self) -> List[Dict[str, Any]]:
+        """Members whose latest version hasn't been exported to the sheet yet"""
+        return await self._run(self._get_unsynced_members)
+
+    def _get_unsynced_members(self) -> List[Dict[str, Any]]:
+        assert self.conn is not None
+        rows = self.conn.execute("""
+            SELECT m.name, m.discord_name, m.paid_membership, m.deleted, m.version,
+                   a.nickname AS ms_nickname, a.friend_code AS ms_friend_id, a.account_id AS ms_account_id
+            FROM members m LEFT JOIN linked_accounts a ON a.discord_name = m.discord_name AND a.platform = ?
+            WHERE m.synced_version IS NULL OR m.synced_version != m.version""", (MAJSOUL,)).fetchall()
+        return [dict(row) for row in rows]
+
+    async def mark_member_synced(self, discord_name: str, version: int) -> None:
+        await self._run(self._mark_member_synced, discord_name, version)
+
+    def _mark_member_synced(self, discord_name: str, version: int) -> None:
+        assert self.conn is not None
+        with self.conn:
+            # only if nothing changed while we were exporting
+            self.conn.execute("UPDATE members SET synced_version = version WHERE discord_name = ? AND version = ?", (discord_name, version))
+            self.conn.execute("DELETE FROM members WHERE discord_name = ? AND version = ? AND deleted = 1", (discord_name, version))
+
+    """
+    =====================================================
+    LINKED ACCOUNTS
+    =====================================================
+    """
+
+    async def get_linked_accounts(self, discord_name: str) -> Dict[str, Dict[str, Any]]:
+        """Returns {platform: {nickname, account_id, friend_code}}"""
+        return await self._run(self._get_linked_accounts, discord_name)
+
+    def _get_linked_accounts(self, discord_name: str) -> Dict[str, Dict[str, Any]]:
+        assert self.conn is not None
+        rows = self.conn.execute("SELECT platform, nickname, account_id, friend_code FROM linked_accounts WHERE discord_name = ?", (discord_name,)).fetchall()
+        return {row["platform"]: {"nickname": row["nickname"], "account_id": row["account_id"], "friend_code": row["friend_code"]} for row in rows}
+
+    async def link_account(self, discord_name: str, platform: str, nickname: Optional[str],
+                           account_id: Optional[int] = None, friend_code: Optional[int] = None) -> None:
+        await self._run(self._link_account_and_commit, discord_name, platform, nickname, account_id, friend_code)
+        self.changed.set()
+
+    def _link_account_and_commit(self, *args) -> None:
+        assert self.conn is not None
+        with self.conn:
+            self._link_account(*args)
+
+    def _link_account(self, discord_name, platform, nickname, account_id, friend_code) -> None:
+        assert self.conn is not None
+        self.conn.execute("""
+            INSERT INTO linked_accounts (discord_name, platform, nickname, account_id, friend_code) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (discord_name, platform) DO UPDATE SET
+                nickname = excluded.nickname, account_id = excluded.account_id, friend_code = excluded.friend_code""",
+            (discord_name, platform, nickname, account_id, friend_code))
+        if platform == MAJSOUL: # the Mahjong Soul account shows up on the Registry sheet
+            self.conn.execute("UPDATE members SET version = version + 1 WHERE discord_name = ?", (discord_name,))
+
+    """
+    =====================================================
+    RAW SCORES
+    =====================================================
+    """
+
+    async def add_raw_scores(self, timestamp: str, game_mode: str, irl: str, players: List[Tuple[str, int]], game_uuid: Optional[str] = None) -> int:
+        """
+        `players` is a list of (discord name, raw score), in placement order.
+        Returns the id of the new game.
+        """
+        game_id = await self._run(self._add_raw_scores, timestamp, game_mode, irl, players, game_uuid, False)
+        self.changed.set()
+        game = {"id": game_id, "timestamp": timestamp, "game_mode": game_mode, "irl": irl, "game_uuid": game_uuid,
+                "players": [(name, int(score)) for name, score in players]}
+        for listener in self.raw_score_listeners:
+            listener(game)
+        return game_id
+
+    def _add_raw_scores(self, timestamp, game_mode, irl, players, game_uuid, exported) -> int:
+        assert self.conn is not None
+        with self.conn:
+            return self._insert_raw_scores(timestamp, game_mode, irl, players, game_uuid, exported)
+
+    def _insert_raw_scores(self, timestamp, game_mode, irl, players, game_uuid, exported) -> int:
+        """`_add_raw_scores` without committing"""
+        assert self.conn is not None
+        cursor = self.conn.execute("INSERT INTO raw_scores (timestamp, game_mode, irl, game_uuid, exported) VALUES (?, ?, ?, ?, ?)",
+                                   (timestamp, game_mode, irl, game_uuid, int(exported)))
+        game_id = cursor.lastrowid
+        self.conn.executemany("INSERT INTO raw_score_players (game_id, placement, discord_name, score) VALUES (?, ?, ?, ?)",
+                              [(game_id, i+1, name, int(score)) for i, (name, score) in enumerate(players)])
+        assert game_id is not None
+        return game_id
+
+    async def get_raw_scores(self, after_id: int = 0, unexported_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        Returns games with id > `after_id` in id order, each as
+        {id, timestamp, game_mode, irl, game_uuid, players: [(discord name, raw score)]}
+        """
+        return await self._run(self._get_raw_scores, after_id, unexported_only)
+
+    def _get_raw_scores(self, after_id: int, unexported_only: bool) -> List[Dict[str, Any]]:
+        assert self.conn is not None
+        query = "SELECT id, timestamp, game_mode, irl, game_uuid FROM raw_scores WHERE id > ?"
+        if unexported_only:
+            query += " AND exported = 0"
+        games = {row["id"]: {**dict(row), "players": []} for row in self.conn.execute(query + " ORDER BY id", (after_id,))}
+        if len(games) > 0:
+            for row in self.conn.execute("SELECT game_id, discord_name, score FROM raw_score_players WHERE game_id >= ? ORDER BY game_id, placement", (min(games),)):
+                if row["game_id"] in games:
+                    games[row["game_id"]]["players"].append((row["discord_name"], row["score"]))
+        return list(games.values())
+
+    async def get_game_uuids(self, start: str, end: str) -> List[str]:
+        """Mahjong Soul game uuids of online games recorded between the timestamps `start` and `end` (inclusive)"""
+        return await self._run(self._get_game_uuids, start, end)
+
+    def _get_game_uuids(self, start: str, end: str) -> List[str]:
+        assert self.conn is not None
+        return [row["game_uuid"] for row in self.conn.execute(
+            "SELECT game_uuid FROM raw_scores WHERE game_uuid IS NOT NULL AND timestamp BETWEEN ? AND ? ORDER BY id", (start, end))]
+
+    async def mark_raw_scores_exported(self, game_id: int) -> None:
+        await self._run(self._mark_raw_scores_exported, game_id)
+
+    def _mark_raw_scores_exported(self, game_id: int) -> None:
+        assert self.conn is not None
+        with self.conn:
+            self.conn.execute("UPDATE raw_scores SET exported = 1 WHERE id = ?", (game_id,))
+
+    """
+    =====================================================
+    ONE-TIME IMPORT
+    =====================================================
+    """
+
+    async def import_existing(self, registry_rows: List[List[str]], raw_score_rows: List[List[str]], player_registry: Dict[str, Dict[str, Any]]) -> Tuple[int, int, int, int]:
+        """
+        Migrate the existing Registry sheet, Raw Scores sheet and `player_registry.json`
+        in one transaction, which also sets the "imported" meta key.
+        Everything imported is marked as already exported to the sheet.
+        Returns the number of (members, games, linked accounts) imported,
+        and the number of Raw Scores rows skipped for having a malformed score.
+        """
+        return await self._run(self._import_existing, registry_rows, raw_score_rows, player_registry)
+
+    def _import_existing(self, registry_rows, raw_score_rows, player_registry) -> Tuple[int, int, int, int]:
+        assert self.conn is not None
+        num_members = num_games = num_accounts = num_rejected = 0
+        to_int = lambda s: int(s) if s not in {None, ""} else None
+        with self.conn:
+            for discord_name, entry in player_registry.items():
+                if "ms_id" in entry:
+                    self._link_account(discord_name, MAJSOUL_STATS, entry.get("ms_name"), entry["ms_id"], entry.get("ms_friendcode"))
+                    num_accounts += 1
+                if "rc_friendcode" in entry:
+                    self._link_account(discord_name, RIICHICITY, entry.get("rc_name"), None, entry["rc_friendcode"])
+                    num_accounts += 1
+                if "tenhou_name" in entry:
+                    self._link_account(discord_name, TENHOU, entry["tenhou_name"], None, None)
+                    num_accounts += 1
+            for row in registry_rows[1:]: # skip the header row
+                [name, discord_name, paid_membership, *mahjongsoul_fields] = row + [""] * (3 - len(row))
+                if discord_name == "":
+                    continue
+                self.conn.execute("INSERT OR REPLACE INTO members (discord_name, name, paid_membership, version, synced_version) VALUES (?, ?, ?, 1, 1)",
+                                  (discord_name, name, paid_membership or "no"))
+                num_members += 1
+                mahjongsoul_fields += [""] * (3 - len(mahjongsoul_fields))
+                ms_nickname, ms_friend_id, ms_account_id = mahjongsoul_fields[:3]
+                if to_int(ms_friend_id) is not None:
+                    self._link_account(discord_name, MAJSOUL, ms_nickname, to_int(ms_account_id), to_int(ms_friend_id))
+                    num_accounts += 1
+            # linking accounts bumped versions; nothing from the sheet itself needs exporting
+            self.conn.execute("UPDATE members SET synced_version = version")
+            for row_number, row in enumerate(raw_score_rows[1:], start=2): # skip the header row
+                timestamp, game_mode, irl, *player_fields = row + [""] * (3 - len(row))
+                try:
+                    players = [(player_fields[i], int(player_fields[i+1])) for i in range(0, len(player_fields) - 1, 2) if player_fields[i] != ""]
+                except ValueError:
+                    logging.warning(f"import_existing: skipping Raw Scores row {row_number} with a malformed score: {row}")
+                    num_rejected += 1
+                    continue
+                if len(players) > 0:
+                    self._insert_raw_scores(timestamp, game_mode, irl, players, None, True)
+                    num_games += 1
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('imported', 'yes') ON CONFLICT (key) DO UPDATE SET value = excluded.value")
+        return num_members, num_games, num_accounts, num_rejected
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+from .scheduler import SheetsScheduler, PRIORITY_DEFAULT
+
+MAX_QUOTA_RETRIES = 5
+
+class SheetsQuotaError(Exception):
+    def __init__(self, op: str):
+        self.message = f"Google Sheets is still over its request quota after {MAX_QUOTA_RETRIES} retries ({op}). Please try again in a minute."
+        super().__init__(self.message)
+
+def is_quota_error(error: Exception) -> bool:
+    import gspread
+    return isinstance(error, gspread.exceptions.APIError) and error.response.status_code == 429
+
+class SheetsStats:
+    """
+    Keeps track of how long each kind of Google Sheets call takes,
+    e.g. "Registry.find" or "Raw Scores.append_row"
+    """
+    def __init__(self):
+        # op name -> [number of calls, total seconds, max seconds]
+        self.ops: Dict[str, List[float]] = {}
+
+    def record(self, op: str, elapsed: float) -> None:
+        if op not in self.ops:
+            self.ops[op] = [0, 0.0, 0.0]
+        entry = self.ops[op]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def summary(self) -> List[str]:
+        ret = []
+        for op, (count, total, max_elapsed) in sorted(self.ops.items()):
+            ret.append(f"{op}: {int(count)} calls, avg {1000*total/count:.0f}ms, max {1000*max_elapsed:.0f}ms")
+        return ret
+
+class AsyncWorksheet:
+    """
+    Wraps a gspread `Worksheet` so that every call runs on the Sheets thread
+    pool instead of the event loop. Methods mirror the gspread methods we use.
+    NOTE: this does not lock anything; callers should still hold
+    `registry_lock`/`raw_scores_lock` around read-modify-write sequences.
+    """
+    def __init__(self, worksheet, client: "AsyncSheetsClient"):
+        self.worksheet = worksheet
+        self.client = client
+        self.title: str = worksheet.title
+
+    async def _run(self, op: str, kind: str, priority: int, fn: Callable, *args, **kwargs) -> Any:
+        return await self.client.run(f"{self.title}.{op}", kind, priority, fn, *args, **kwargs)
+
+    async def find(self, query: str, in_column: Optional[int] = None, priority: int = PRIORITY_DEFAULT):
+        return await self._run("find", "read", priority, self.worksheet.find, query, in_column=in_column)
+
+    async def cell(self, row: int, col: int, priority: int = PRIORITY_DEFAULT):
+        return await self._run("cell", "read", priority, self.worksheet.cell, row, col)
+
+    async def row_values(self, row: int, priority: int = PRIORITY_DEFAULT) -> List[str]:
+        return await self._run("row_values", "read", priority, self.worksheet.row_values, row)
+
+    async def col_values(self, col: int, priority: int = PRIORITY_DEFAULT) -> List[str]:
+        return await self._run("col_values", "read", priority, self.worksheet.col_values, col)
+
+    async def get_all_values(self, priority: int = PRIORITY_DEFAULT) -> List[List[str]]:
+        return await self._run("get_all_values", "read", priority, self.worksheet.get_all_values)
+
+    async def append_row(self, values: List[Any], priority: int = PRIORITY_DEFAULT):
+        return await self._run("append_row", "write", priority, self.worksheet.append_row, values)
+
+    async def update(self, range_name: str, values: List[List[Any]], priority: int = PRIORITY_DEFAULT):
+        return await self._run("update", "write", priority, self.worksheet.update, values=values, range_name=range_name)
+
+    async def delete_rows(self, start_index: int, end_index: Optional[int] = None, priority: int = PRIORITY_DEFAULT):
+        return await self._run("delete_rows", "write", priority, self.worksheet.delete_rows, start_index, end_index)
+
+    async def update_cell(self, row: int, col: int, value: Any, priority: int = PRIORITY_DEFAULT):
+        return await self._run("update_cell", "write", priority, self.worksheet.update_cell, row, col, value)
+
+class AsyncSheetsClient:
+    """
+    Owns the bounded thread pool that all gspread calls run on,
+    including the service account auth and opening the spreadsheet.
+    Every call first takes a token from the read or write bucket of
+    `self.scheduler`, so bursts queue up instead of hitting 429s.
+    """
+    def __init__(self, max_workers: int = 4, read_per_minute: int = 60, write_per_minute: int = 60):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gsheets")
+        self.scheduler = SheetsScheduler(read_per_minute, write_per_minute)
+        self.stats = SheetsStats()
+        self.gs_client = None
+
+    async def run(self, op: str, kind: Optional[str], priority: int, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on the thread pool, recording its latency under `op`.
+        `kind` is the quota the call counts against ("read", "write", or None).
+        If Google still responds with a 429, we drain the bucket, back off, and requeue.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_QUOTA_RETRIES + 1):
+            if kind is not None:
+                await self.scheduler.acquire(kind, priority)
+            start_time = time.perf_counter()
+            try:
+                return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            except Exception as e:
+                if kind is None or not is_quota_error(e):
+                    raise e
+            finally:
+                elapsed = time.perf_counter() - start_time
+                self.stats.record(op, elapsed)
+                logging.debug(f"gsheets: {op} took {1000*elapsed:.0f}ms")
+            logging.info(f"gsheets: {op} hit the {kind} quota (attempt {attempt+1}); backing off")
+            self.scheduler.drain(kind)
+            await asyncio.sleep(min(2 ** attempt, 32) + random.random())
+        raise SheetsQuotaError(op)
+
+    async def open_by_url(self, service_account_filename: str, url: str):
+        import gspread
+        self.gs_client = await self.run("service_account", None, PRIORITY_DEFAULT, gspread.service_account, filename=service_account_filename)
+        return await self.run("open_by_url", "read", PRIORITY_DEFAULT, self.gs_client.open_by_url, url)
+
+    async def worksheet(self, spreadsheet, title: str) -> AsyncWorksheet:
+        return AsyncWorksheet(await self.run("worksheet", "read", PRIORITY_DEFAULT, spreadsheet.worksheet, title), self)
@@ -0,0 +1,164 @@
+"""
+In-memory stand-ins for gspread's `Spreadsheet` and `Worksheet`, implementing
+the calls the bot makes. Used to exercise the Sheets layer offline
+(see `sheets_benchmark.py`); every call sleeps for `latency` seconds and
+may fail with a 429 like the real API.
+"""
+
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import *
+
+class FakeResponse:
+    """Just enough of a `requests.Response` for `gspread.exceptions.APIError`"""
+    def __init__(self, status_code: int, message: str):
+        self.status_code = status_code
+        self.text = message
+        self._json = {"error": {"code": status_code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+
+    def json(self) -> Dict[str, Any]:
+        return self._json
+
+class FakeCell:
+    def __init__(self, row: int, col: int, value: Any):
+        self.row = row
+        self.col = col
+        self.value = value
+
+class FakeSpreadsheet:
+    """
+    Holds the worksheets and the settings they share:
+    - `latency`: seconds each call takes
+    - `read_quota`/`write_quota`: calls allowed per rolling minute before
+      Google would start responding with 429 (None for unlimited)
+    - `quota_error_rate`: chance of a spurious 429 on any call
+    """
+    def __init__(self, latency: float = 0.0, read_quota: Optional[int] = None, write_quota: Optional[int] = None,
+                 quota_error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.quotas = {"read": read_quota, "write": write_quota}
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.worksheets: Dict[str, "FakeWorksheet"] = {}
+        self.calls: Counter = Counter()        # "Registry.find" -> count
+        self.quota_errors: Counter = Counter() # "Registry.find" -> count
+        self.recent: Dict[str, Deque[float]] = {"read": deque(), "write": deque()}
+        self.lock = threading.Lock()
+
+    def add_worksheet(self, title: str, rows: Optional[List[List[Any]]] = None) -> "FakeWorksheet":
+        self.worksheets[title] = FakeWorksheet(self, title, rows or [])
+        return self.worksheets[title]
+
+    def worksheet(self, title: str) -> "FakeWorksheet":
+        self._call(title, "worksheet", "read")
+        return self.worksheets[title]
+
+    def _call(self, title: str, op: str, kind: str) -> None:
+        import gspread
+        name = f"{title}.{op}"
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls[name] += 1
+            now = time.monotonic()
+            recent = self.recent[kind]
+            while len(recent) > 0 and recent[0] < now - 60:
+                recent.popleft()
+            quota = self.quotas[kind]
+            over_quota = quota is not None and len(recent) >= quota
+            if over_quota or self.random.random() < self.quota_error_rate:
+                self.quota_errors[name] += 1
+                raise gspread.exceptions.APIError(FakeResponse(429, f"Quota exceeded for {kind} requests"))  # type: ignore[arg-type]
+            recent.append(now)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: FakeSpreadsheet, title: str, rows: List[List[Any]]):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(row) for row in rows]
+
+    def _call(self, op: str, kind: str) -> None:
+        self.spreadsheet._call(self.title, op, kind)
+
+    def _get(self, row: int, col: int) -> Any:
+        if row <= len(self.rows) and col <= len(self.rows[row-1]):
+            return self.rows[row-1][col-1]
+        return None
+
+    # reads
+
+    def find(self, query: str, in_row: Optional[int] = None, in_column: Optional[int] = None, case_sensitive: bool = True) -> Optional[FakeCell]:
+        self._call("find", "read")
+        for r, row in enumerate(self.rows, start=1):
+            if in_row is not None and r != in_row:
+                continue
+            for c, value in enumerate(row, start=1):
+                if in_column is not None and c != in_column:
+                    continue
+                if str(value) == query:
+                    return FakeCell(r, c, str(value))
+        return None
+
+    def cell(self, row: int, col: int) -> FakeCell:
+        self._call("cell", "read")
+        value = self._get(row, col)
+        return FakeCell(row, col, None if value is None else str(value))
+
+    def row_values(self, row: int) -> List[str]:
+        self._call("row_values", "read")
+        values = [str(v) for v in self.rows[row-1]] if row <= len(self.rows) else []
+        while len(values) > 0 and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col: int) -> List[str]:
+        self._call("col_values", "read")
+        values = ["" if self._get(r, col) is None else str(self._get(r, col)) for r in range(1, len(self.rows) + 1)]
+        while len(values) > 0 and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_all_values(self) -> List[List[str]]:
+        self._call("get_all_values", "read")
+        width = max((len(row) for row in self.rows), default=0)
+        return [[str(v) for v in row] + [""] * (width - len(row)) for row in self.rows]
+
+    # writes
+
+    def append_row(self, values: List[Any], **kwargs) -> Dict[str, Any]:
+        self._call("append_row", "write")
+        self.rows.append(["" if v is None else v for v in values])
+        n = len(self.rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{n}:{chr(ord('A') + len(values) - 1)}{n}"}}
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> None:
+        self._call("delete_rows", "write")
+        end_index = start_index if end_index is None else end_index
+        del self.rows[start_index-1:end_index]
+
+    def update_cell(self, row: int, col: int, value: Any) -> None:
+        self._call("update_cell", "write")
+        while len(self.rows) < row:
+            self.rows.append([])
+        self.rows[row-1] += [""] * (col - len(self.rows[row-1]))
+        self.rows[row-1][col-1] = value
+
+    def update(self, values: List[List[Any]], range_name: str, **kwargs) -> None:
+        """Only supports "A1:F1"-style ranges"""
+        self._call("update", "write")
+        import re
+        match = re.fullmatch(r"([A-Z])(\d+):([A-Z])(\d+)", range_name)
+        assert match is not None, f"unsupported range {range_name}"
+        first_col = ord(match.group(1)) - ord("A")
+        first_row = int(match.group(2))
+        for r, row_values in enumerate(values, start=first_row):
+            while len(self.rows) < r:
+                self.rows.append([])
+            row = self.rows[r-1]
+            row += [""] * (first_col + len(row_values) - len(row))
+            row[first_col:first_col + len(row_values)] = row_values
@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import *
+
+# lower numbers are served first when requests are queued
+PRIORITY_LEADERBOARD = 0 # game results and IRL scores
+PRIORITY_DEFAULT = 1     # registration, membership updates, etc.
+PRIORITY_LOOKUP = 2      # read-only lookups like `/ms_stats`
+
+class TokenBucket:
+    """
+    Refills at `per_minute` tokens per minute, up to `capacity` tokens.
+    When the bucket is empty, `acquire()` queues the caller instead of
+    failing; queued callers are served by priority, then first-come first-serve.
+    """
+    def __init__(self, name: str, per_minute: int, capacity: Optional[int] = None):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = [] # heap of (priority, order, future)
+        self.order = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    @property
+    def level(self) -> float:
+        self._refill()
+        return self.tokens
+
+    @property
+    def queue_length(self) -> int:
+        return sum(1 for _, _, fut in self.waiters if not fut.done())
+
+    def drain(self) -> None:
+        """Called when Google tells us we're over quota anyways"""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT) -> None:
+        self._refill()
+        if len(self.waiters) == 0 and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.order), fut))
+        self._serve_waiters()
+        await fut
+
+    def _serve_waiters(self) -> None:
+        self._refill()
+        while len(self.waiters) > 0 and self.tokens >= 1:
+            _, _, fut = heapq.heappop(self.waiters)
+            if fut.done(): # cancelled while waiting
+                continue
+            self.tokens -= 1
+            fut.set_result(None)
+        while len(self.waiters) > 0 and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+        if len(self.waiters) > 0 and self.timer is None:
+            delay = (1 - self.tokens) / self.rate
+            self.timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self.timer = None
+        self._serve_waiters()
+
+class SheetsScheduler:
+    """
+    Separate token buckets for the per-minute read and write quotas of
+    the Google Sheets API. Also keeps track of how long requests queue.
+    """
+    def __init__(self, read_per_minute: int = 60, write_per_minute: int = 60):
+        self.buckets = {
+            "read": TokenBucket("read", read_per_minute),
+            "write": TokenBucket("write", write_per_minute),
+        }
+        # bucket name -> [number of waits, total seconds, max seconds]
+        self.waits: Dict[str, List[float]] = {name: [0, 0.0, 0.0] for name in self.buckets}
+
+    async def acquire(self, kind: str, priority: int = PRIORITY_DEFAULT) -> float:
+        """Wait for a token of the given kind ("read" or "write"); returns seconds waited"""
+        start_time = time.perf_counter()
+        await self.buckets[kind].acquire(priority)
+        waited = time.perf_counter() - start_time
+        entry = self.waits[kind]
+        entry[0] += 1
+        entry[1] += waited
+        entry[2] = max(entry[2], waited)
+        return waited
+
+    def drain(self, kind: str) -> None:
+        self.buckets[kind].drain()
+
+    def summary(self) -> List[str]:
+        ret = []
+        for name, bucket in self.buckets.items():
+            count, total, max_wait = self.waits[name]
+            avg_wait = total / count if count > 0 else 0
+            ret.append(f"{name} bucket: {bucket.level:.1f}/{bucket.capacity} tokens, {bucket.queue_length} queued,"
+                       f" avg wait {1000*avg_wait:.0f}ms, max wait {1000*max_wait:.0f}ms")
+        return ret
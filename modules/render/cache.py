@@ -0,0 +1,172 @@
+"""
+Cache of rendered images, keyed by a hash of the renderer, its version and
+whatever identifies the input (e.g. game id and graph mode). Finished games
+never change, so their graphs only ever need to be rendered once.
+- memory: LRU bounded by bytes
+- disk (optional): one PNG per key in `image_cache_dir`, LRU by modification
+  time (touched on every hit) under a byte budget
+Concurrent requests for the same key share one render, which runs in its
+own task so that cancelling one request doesn't cancel it for the others.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+# bump a renderer's version whenever its output changes, so cached images aren't reused
+RENDERER_VERSIONS = {"score_graph": 1, "score_graph_fast": 1, "ms_trendline": 1}
+
+def image_key(renderer: Callable, *parts: Any) -> str:
+    name = renderer.__name__
+    return hashlib.sha256("\0".join([name, str(RENDERER_VERSIONS.get(name, 0)), *map(str, parts)]).encode()).hexdigest()
+
+class ImageCacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared = 0 # waited on someone else's render
+        self.misses = 0
+        self.evictions = 0
+        self.render_time = 0.0
+
+    def summary(self) -> List[str]:
+        lookups = self.memory_hits + self.disk_hits + self.shared + self.misses
+        rate = lambda n: f"{100*n/lookups:.1f}%" if lookups > 0 else "n/a"
+        avg_render = f"{1000*self.render_time/self.misses:.0f}ms" if self.misses > 0 else "n/a"
+        return [f"images: {lookups} lookups: {rate(self.memory_hits)} memory hits, {rate(self.disk_hits)} disk hits,"
+                f" {rate(self.shared)} shared renders, {rate(self.misses)} misses (avg render {avg_render}), {self.evictions} evictions"]
+
+class ImageCache:
+    """`get(key, render)` returns the cached PNG for `key`, or `await render()`'s"""
+    def __init__(self, directory: Optional[str], memory_budget: int, disk_budget: int):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image_cache")
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_bytes = 0
+        self.disk: OrderedDict[str, int] = OrderedDict() # key -> size, least recently used first
+        self.disk_bytes = 0
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.stats = ImageCacheStats()
+        self.loaded = directory is None
+        self.load_lock = asyncio.Lock()
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _path(self, key: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load(self) -> None:
+        assert self.directory is not None
+        os.makedirs(self.directory, exist_ok=True)
+        entries = sorted((entry.stat().st_mtime, entry.name[:-len(".png")], entry.stat().st_size)
+                         for entry in os.scandir(self.directory) if entry.name.endswith(".png"))
+        self.disk = OrderedDict((key, size) for _, key, size in entries)
+        self.disk_bytes = sum(self.disk.values())
+        logging.info(f"image_cache: {len(self.disk)} images on disk ({self.disk_bytes/1e6:.1f} MB)")
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes, evicted: List[str]) -> None:
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        for evicted_key in evicted:
+            try:
+                os.remove(self._path(evicted_key))
+            except FileNotFoundError:
+                pass
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key))
+        if len(data) > self.memory_budget:
+            return
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.memory_budget:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.stats.evictions += 1
+
+    async def _put_disk(self, key: str, data: bytes) -> None:
+        if key in self.disk:
+            self.disk_bytes -= self.disk.pop(key)
+        self.disk[key] = len(data)
+        self.disk_bytes += len(data)
+        evicted = []
+        while self.disk_bytes > self.disk_budget and len(self.disk) > 1:
+            evicted_key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            evicted.append(evicted_key)
+        self.stats.evictions += len(evicted)
+        await self._run(self._write, key, data, evicted)
+
+    async def get(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats.memory_hits += 1
+            return self.memory[key]
+        if key in self.in_flight:
+            self.stats.shared += 1
+        else:
+            task = asyncio.ensure_future(self._render_and_store(key, render))
+            # mark any exception retrieved in case every requester was cancelled
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self.in_flight[key] = task
+        return await asyncio.shield(self.in_flight[key])
+
+    async def _render_and_store(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            data = await self._get_uncached(key, render)
+            self._put_memory(key, data)
+            return data
+        finally:
+            del self.in_flight[key]
+
+    async def _get_uncached(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        if self.directory is not None:
+            async with self.load_lock:
+                if not self.loaded:
+                    await self._run(self._load)
+                    self.loaded = True
+            if key in self.disk:
+                data = await self._run(self._read, key)
+                if data is not None:
+                    self.disk.move_to_end(key)
+                    self.stats.disk_hits += 1
+                    return data
+                # someone deleted the file
+                self.disk_bytes -= self.disk.pop(key)
+
+        start_time = time.perf_counter()
+        data = await render()
+        self.stats.render_time += time.perf_counter() - start_time
+        self.stats.misses += 1
+        if self.directory is not None:
+            await self._put_disk(key, data)
+        return data
+
+    def summary(self) -> List[str]:
+        disk = f", disk: {len(self.disk)} images, {self.disk_bytes/1e6:.1f}/{self.disk_budget/1e6:.0f} MB" if self.directory is not None else ""
+        return [f"image memory: {len(self.memory)} images, {self.memory_bytes/1e6:.1f}/{self.memory_budget/1e6:.0f} MB{disk}"] + self.stats.summary()
+
+image_cache = ImageCache(directory=os.getenv("image_cache_dir") or None,
+                         memory_budget=int(os.getenv("image_cache_memory_bytes", 16_000_000)),
+                         disk_budget=int(os.getenv("image_cache_disk_bytes", 200_000_000)))
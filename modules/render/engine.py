@@ -0,0 +1,90 @@
+"""
+Renders images (score graphs, trendlines, ...) on a thread pool instead of the
+event loop. Renderers build their own figure or image rather than using pyplot,
+whose global figure and rcParams would let two concurrent renders clobber each
+other. Fonts and images are loaded once, the first time a renderer asks for them.
+This module doesn't import matplotlib, so renderers that don't need it
+(see `fast.py`) don't pay for importing it.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+FONT_PATH = "fonts/Arial Unicode MS.ttf"
+IMAGE_PATHS = {"sunglasses_cat": "images/sunglasses_cat.png"}
+
+class Assets:
+    """Whatever renderers load once and share (fonts, images), by name"""
+    def __init__(self):
+        self.loaded: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def get(self, name: str, load: Callable[[], Any]) -> Any:
+        with self.lock:
+            if name not in self.loaded:
+                self.loaded[name] = load()
+            return self.loaded[name]
+
+assets = Assets()
+
+class RenderStats:
+    def __init__(self):
+        self.renders = 0
+        self.total_queue_wait = 0.0
+        self.total_render_time = 0.0
+        self.max_render_time = 0.0
+
+class RenderEngine:
+    """
+    Lazily started pool of `max_workers` threads. A renderer is a function
+    `renderer(assets, *args) -> PNG bytes`; `render()` times each one by name.
+    """
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.stats: Dict[str, RenderStats] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        return self.executor
+
+    @staticmethod
+    def _run(renderer: Callable[..., bytes], args: Tuple[Any, ...], submitted_at: float) -> Tuple[bytes, float, float]:
+        start_time = time.perf_counter()
+        png = renderer(assets, *args)
+        return png, start_time - submitted_at, time.perf_counter() - start_time
+
+    async def render(self, renderer: Callable[..., bytes], *args) -> bytes:
+        loop = asyncio.get_running_loop()
+        png, queue_wait, render_time = await loop.run_in_executor(self._get_executor(), self._run, renderer, args, time.perf_counter())
+        stats = self.stats.setdefault(renderer.__name__, RenderStats())
+        stats.renders += 1
+        stats.total_queue_wait += queue_wait
+        stats.total_render_time += render_time
+        stats.max_render_time = max(stats.max_render_time, render_time)
+        logging.info(f"render: {renderer.__name__} queued {1000*queue_wait:.0f}ms, rendered {1000*render_time:.0f}ms ({len(png)} bytes)")
+        return png
+
+    def summary(self) -> List[str]:
+        if len(self.stats) == 0:
+            return [f"render: no renders yet ({self.max_workers} workers)"]
+        return [f"render: {name}: {s.renders} renders, avg queued {1000*s.total_queue_wait/s.renders:.0f}ms,"
+                f" avg {1000*s.total_render_time/s.renders:.0f}ms, max {1000*s.max_render_time:.0f}ms"
+                for name, s in self.stats.items()]
+
+def score_graph_renderer(name: str) -> Callable[..., bytes]:
+    """The score graph renderer called `name` ("matplotlib" or "fast"), imported on first use"""
+    if name == "fast":
+        from .fast import score_graph_fast
+        return score_graph_fast
+    from .graphs import score_graph
+    return score_graph
+
+render_engine = RenderEngine(max_workers=int(os.getenv("render_workers", 2)))
+SCORE_GRAPH_RENDERER = os.getenv("score_graph_renderer", "matplotlib")
@@ -0,0 +1,112 @@
+"""
+matplotlib renderers for `render_engine`: each takes the shared assets and
+plain data (so it can be rendered anywhere) and returns PNG bytes.
+"""
+
+import logging
+import os
+from io import BytesIO
+from typing import *
+
+import matplotlib
+import matplotlib.font_manager as fm
+import matplotlib.image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.offsetbox import AnnotationBbox, OffsetImage
+
+from .engine import FONT_PATH, IMAGE_PATHS, Assets
+
+class MatplotlibAssets:
+    def __init__(self):
+        if os.path.exists(FONT_PATH):
+            fm.fontManager.addfont(FONT_PATH)
+            self.font_name = fm.FontProperties(fname=FONT_PATH).get_name()
+        else:
+            logging.warning(f"render: {FONT_PATH} not found, using matplotlib's default font")
+            self.font_name = matplotlib.rcParams["font.family"][0]
+        # set once and never changed, so renders don't have to touch rcParams
+        matplotlib.rcParams["font.family"] = self.font_name
+        self.images = {name: matplotlib.image.imread(path, format="png") for name, path in IMAGE_PATHS.items() if os.path.exists(path)}
+
+def new_figure(assets: Assets, **kwargs) -> Figure:
+    """A figure that isn't registered with pyplot"""
+    assets.get("matplotlib", MatplotlibAssets)
+    figure = Figure(**kwargs)
+    FigureCanvasAgg(figure)
+    return figure
+
+def to_png(figure: Figure, **savefig_kwargs) -> bytes:
+    buf = BytesIO()
+    figure.savefig(buf, format="png", transparent=True, **savefig_kwargs)
+    return buf.getvalue()
+
+SCORE_COLORS = ["orangered", "gold", "forestgreen", "darkviolet"]
+
+def score_graph(assets: Assets, rounds: List[str], names: List[str], scores: List[List[float]], show_start_scores: bool) -> bytes:
+    """
+    `rounds` are the x-axis labels (the first one being the start of the game),
+    `scores` each player's score at each of them
+    """
+    figure = new_figure(assets, figsize=(12, 7.5))
+    ax = figure.add_subplot()
+    ax.tick_params(labelsize=24, colors="gray")
+    ax.set_xticks(range(len(rounds)), rounds, rotation=45, ha="right")
+    ax.margins(0.02)
+    ax.set_frame_on(False)
+
+    # calculate offsets for annotations (so numbers don't overlap)
+    min_score = min(score for scores_per_round in scores for score in scores_per_round)
+    max_score = max(score for scores_per_round in scores for score in scores_per_round)
+    min_separation = (max_score - min_score) / 12
+    step_unit = min_separation / 24
+    check_closeness = True
+    gas = 1000
+    yoffsets: List[float] = [0] * len(scores)
+    while check_closeness and gas >= 0:
+        check_closeness = False
+        gas -= 1
+        final_scores = sorted((scores_per_round[-1], i) for i, scores_per_round in enumerate(scores))
+        for (s1, i1), (s2, i2) in zip(final_scores[:-1], final_scores[1:]):
+            if (s2 + yoffsets[i2]) - (s1 + yoffsets[i1]) < min_separation:
+                check_closeness = True
+                yoffsets[i1] -= step_unit
+                yoffsets[i2] += step_unit
+    # draw the graph
+    ax.grid(linestyle="--", linewidth=1.0)
+    ax.axhline(0, color="gray", linewidth=4.0)
+    last = len(rounds) - 1
+    for name, score, color, yoffset in zip(names, scores, SCORE_COLORS, yoffsets):
+        yoffset *= 100/step_unit if step_unit != 0 else 0
+        ax.plot(range(len(rounds)), score, label=name, color=color, alpha=0.8, linewidth=8, solid_capstyle="round")
+        # display end score
+        ax.annotate(str(score[-1]), (last, score[-1]), textcoords="offset points", xytext=(10,yoffset/figure.dpi), va="center", color=color, fontsize=24)
+        if show_start_scores:
+            # display starting placement bonus, too
+            ax.annotate(str(int(score[0])), (0, score[0]), textcoords="offset points", xytext=(0,10), va="center", ha="center", color="gray", fontsize=24)
+    ax.legend(loc="upper center", bbox_to_anchor=(0.5, 1.15), framealpha=0, ncol=len(scores), handlelength=0.04, fontsize=24, labelcolor="gray")
+    figure.tight_layout()
+    return to_png(figure)
+
+def ms_trendline(assets: Assets, data: List[Tuple[int, bool]]) -> bytes:
+    """`data` is (placement, whether to draw sunglasses) for each recent game"""
+    figure = new_figure(assets, figsize=(20, 4))
+    ax = figure.add_subplot()
+    ax.plot(range(len(data)), [rank for rank, _ in data], marker="o", markersize=28, color="orange", linestyle="-", linewidth=8)
+
+    images = assets.get("matplotlib", MatplotlibAssets).images
+    if "sunglasses_cat" in images:
+        sunglasses_cat = OffsetImage(images["sunglasses_cat"], zoom=0.15)
+        for x, (rank, sunglasses) in zip(range(10), data):
+            if sunglasses:
+                ax.add_artist(AnnotationBbox(sunglasses_cat, (x, rank), frameon=False, box_alignment=(0.5, 0.5)))
+
+    ax.invert_yaxis()
+    ax.set_yticks(range(1, 5), ["1st", "2nd", "3rd", "4th"])
+    ax.tick_params(labelsize=36, colors="gray")
+    ax.set_ylim(4.5, 0.5)
+    ax.grid(axis="y")
+    ax.tick_params(axis="x", which="both", bottom=False, top=False, labelbottom=False)
+    ax.set_frame_on(False)
+    figure.tight_layout()
+    return to_png(figure, bbox_inches="tight")
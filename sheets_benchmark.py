@@ -0,0 +1,164 @@
+# replays a club night (registrations, finished online games, IRL score entries)
+# against an in-memory Google Sheet, so changes to the Sheets layer can be measured
+# without a real spreadsheet. Usage: python sheets_benchmark.py [--latency 0.3] ...
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import *
+
+# the cogs read these at import time; values don't matter here
+for key, value in {"guild_id": "0", "bot_channel_id": "0", "voice_channel_id": "0",
+                   "officer_role": "Officer", "junior_officer_role": "Junior Officer",
+                   "paid_member_role_id": "0", "past_paid_member_role_id": "0",
+                   "spreadsheet_url": "", "max_name_len": "30",
+                   "yh_name": "Yonma Hanchan", "yt_name": "Yonma Tonpuu", "sh_name": "Sanma Hanchan", "st_name": "Sanma Tonpuu",
+                   "yh_tournament_id": "0", "yt_tournament_id": "0", "sh_tournament_id": "0", "st_tournament_id": "0",
+                   "yh_contest_unique_id": "0", "yt_contest_unique_id": "1", "sh_contest_unique_id": "2", "st_contest_unique_id": "3"}.items():
+    os.environ.setdefault(key, value)
+
+import global_stuff
+from modules.gsheets.async_sheets import AsyncSheetsClient
+from modules.gsheets.fake_sheets import FakeSpreadsheet
+
+class TimedLock(asyncio.Lock):
+    """`asyncio.Lock` that keeps track of how long acquirers waited"""
+    def __init__(self):
+        super().__init__()
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self):
+        start_time = time.perf_counter()
+        ret = await super().acquire()
+        waited = time.perf_counter() - start_time
+        self.acquisitions += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return ret
+
+class FakeAccountManager:
+    """Mahjong Soul friend ID lookups, with network latency"""
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def get_account(self, friend_id: int) -> Optional[Tuple[str, int]]:
+        await asyncio.sleep(self.latency)
+        return (f"ms_player_{friend_id}", 100000 + friend_id)
+
+class FakeMember:
+    def __init__(self, i: int):
+        self.name = f"member_{i}"
+        self.discriminator = "0"
+        self.mention = f"@{self.name}"
+
+class FakeInteraction:
+    def __init__(self):
+        self.response = SimpleNamespace(defer=self._noop)
+        self.followup = SimpleNamespace(send=self._noop)
+    async def _noop(self, *args, **kwargs):
+        pass
+
+def make_record(account_ids: List[int]):
+    scores = sorted(random.sample(range(-100, 600), 3), reverse=True)
+    scores = [100*s for s in scores]
+    scores.append(100000 - sum(scores))
+    scores.sort(reverse=True)
+    seats = list(range(4))
+    random.shuffle(seats)
+    return SimpleNamespace(
+        accounts=[SimpleNamespace(seat=seat, account_id=account_id, nickname=f"ms_player_{account_id - 100000}")
+                  for seat, account_id in zip(seats, account_ids)],
+        result=SimpleNamespace(players=[SimpleNamespace(seat=seat, part_point_1=score, total_point=(score - 25000))
+                                        for seat, score in zip(seats, scores)]))
+
+async def wait_for_export(store) -> None:
+    while len(await store.get_unsynced_members()) + len(await store.get_raw_scores(unexported_only=True)) > 0:
+        await asyncio.sleep(0.05)
+
+async def main(args) -> None:
+    random.seed(args.seed)
+    spreadsheet = FakeSpreadsheet(latency=args.latency, read_quota=args.google_read_quota, write_quota=args.google_write_quota,
+                                  quota_error_rate=args.quota_error_rate, seed=args.seed)
+    spreadsheet.add_worksheet("Registry", [["Name", "Discord Name", "Paid Member", "Mahjong Soul Nickname", "Friend ID", "Account ID"]]
+        + [[f"Existing {i}", f"existing_{i}", "no", "", "", ""] for i in range(args.existing_members)])
+    spreadsheet.add_worksheet("Raw Scores", [["Timestamp", "Game Mode", "IRL?", "1st", "Score", "2nd", "Score", "3rd", "Score", "4th", "Score"]])
+
+    # stand in for `connect_to_google_sheets()`, `load_mjs_account_manager()` and `load_club_store()`
+    global_stuff.gs_client = gs_client = AsyncSheetsClient(max_workers=args.workers, read_per_minute=args.read_quota, write_per_minute=args.write_quota)
+    global_stuff.registry, global_stuff.raw_scores = await asyncio.gather(
+        gs_client.worksheet(spreadsheet, "Registry"),
+        gs_client.worksheet(spreadsheet, "Raw Scores"))
+    global_stuff.registry_lock = registry_lock = TimedLock()
+    global_stuff.raw_scores_lock = raw_scores_lock = TimedLock()
+    global_stuff.account_manager = FakeAccountManager(args.latency)
+    os.environ["club_db_path"] = os.path.join(tempfile.mkdtemp(), "club.db")
+    await global_stuff.load_club_store()
+    store = global_stuff.club_store
+    calls_before = spreadsheet.total_calls
+
+    # the cogs import the above from `global_stuff`, so only import them now
+    from discord import app_commands
+    from ext.Utilities.cog import LonghornRiichiUtilities
+    from ext.LobbyManagers.cog import LobbyManager
+    utilities = LonghornRiichiUtilities(None)  # type: ignore[arg-type]
+    await utilities.cog_load()
+    yonma_lobby = SimpleNamespace(game_type=os.environ["yh_name"])
+
+    members = [FakeMember(i) for i in range(args.registrations)]
+    async def register(i: int) -> None:
+        await asyncio.sleep(random.random() * args.spread)
+        await utilities._register(f"Member {i}", members[i], 1000 + i)  # type: ignore[arg-type]
+    async def finish_game(i: int) -> None:
+        await asyncio.sleep(args.spread + random.random() * args.spread)
+        players = random.sample(range(args.registrations), 4)
+        await LobbyManager.add_game_to_leaderboard(yonma_lobby, f"game-{i}", make_record([101000 + p for p in players]))  # type: ignore[arg-type]
+    async def enter_scores(i: int) -> None:
+        await asyncio.sleep(args.spread + random.random() * args.spread)
+        players = [members[p] for p in random.sample(range(args.registrations), 4)]
+        await utilities.enter_scores.callback(utilities, FakeInteraction(), app_commands.Choice(name="Hanchan", value="Hanchan"),  # type: ignore[arg-type]
+            players[0], 40000, players[1], 30000, players[2], 20000, players[3], 10000)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*map(register, range(args.registrations)),
+                         *map(finish_game, range(args.games)),
+                         *map(enter_scores, range(args.irl_games)))
+    commands_done = time.perf_counter() - start_time
+    await wait_for_export(store)
+    export_done = time.perf_counter() - start_time
+
+    print(f"Replayed {args.registrations} registrations, {args.games} games, {args.irl_games} IRL entries"
+          f" ({args.latency*1000:.0f}ms latency, arrivals spread over {2*args.spread:.0f}s)")
+    print(f"  commands finished after {commands_done:.2f}s; sheet in sync after {export_done:.2f}s")
+    print(f"  {spreadsheet.total_calls - calls_before} Sheets API calls, {sum(spreadsheet.quota_errors.values())} quota errors:")
+    for op, count in sorted(spreadsheet.calls.items()):
+        print(f"    {op}: {count}")
+    for name, lock in [("registry_lock", registry_lock), ("raw_scores_lock", raw_scores_lock)]:
+        avg_wait = lock.total_wait / lock.acquisitions if lock.acquisitions > 0 else 0
+        print(f"  {name}: {lock.acquisitions} acquisitions, {lock.total_wait:.2f}s total wait,"
+              f" avg {1000*avg_wait:.0f}ms, max {1000*lock.max_wait:.0f}ms")
+    for line in gs_client.scheduler.summary() + gs_client.stats.summary():
+        print("  " + line)
+    assert len(spreadsheet.worksheets["Raw Scores"].rows) == 1 + args.games + args.irl_games
+    assert len(spreadsheet.worksheets["Registry"].rows) == 1 + args.existing_members + args.registrations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Google Sheets layer against an in-memory sheet.")
+    parser.add_argument("--registrations", type=int, default=40)
+    parser.add_argument("--games", type=int, default=30)
+    parser.add_argument("--irl-games", type=int, default=10)
+    parser.add_argument("--existing-members", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per Sheets/Mahjong Soul call")
+    parser.add_argument("--spread", type=float, default=2.0, help="registrations arrive over this many seconds, then games over the next")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--read-quota", type=int, default=60, help="client-side reads per minute")
+    parser.add_argument("--write-quota", type=int, default=60, help="client-side writes per minute")
+    parser.add_argument("--google-read-quota", type=int, default=None, help="reads per minute before the fake sheet returns 429")
+    parser.add_argument("--google-write-quota", type=int, default=None, help="writes per minute before the fake sheet returns 429")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="chance of a spurious 429 per call")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
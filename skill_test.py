@@ -15,11 +15,13 @@ async def test_injustice():
     for reason, link in links.items():
         print("reason: ", reason, "\n-----------")
         try:
-            for injustice in (await analyze_game(link, specified_players={0,1,2,3}, look_for={"skill"}))[0]:
-                print(injustice)
+            async for _, skills in analyze_game(link, specified_players={0,1,2,3}, look_for={"skill"}):
+                for skill in skills:
+                    print(skill)
         except:
-            for injustice in (await analyze_game(link, specified_players={0,1,2}, look_for={"skill"}))[0]:
-                print(injustice)
+            async for _, skills in analyze_game(link, specified_players={0,1,2}, look_for={"skill"}):
+                for skill in skills:
+                    print(skill)
         print("===============================")
 
 asyncio.run(test_injustice())